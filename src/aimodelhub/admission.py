@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+
+
+class Rejected(Exception):
+    """
+    Raised when a request is not admitted, with the reason 'overloaded' or 'rate_limited'.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Waiter:
+    __slots__ = ('future', 'on_position', 'position')
+
+    def __init__(self, on_position):
+        self.future = asyncio.get_running_loop().create_future()
+        self.on_position = on_position
+        self.position = None
+
+
+class AdmissionController:
+    """
+    Limits the number of requests running at once. Requests beyond the limit wait
+    in one queue per session, and the queues are served round robin, so that a
+    session sending many requests does not delay the others. Requests are rejected
+    when the queue is full or when their session exceeds its rate limit.
+    """
+
+    def __init__(self, max_concurrent, max_queue=None, rate_limit=None, rate_window=60.0, clock=time.monotonic):
+        """
+        Args:
+            max_concurrent (int): Number of requests running at once.
+            max_queue (int, optional): Number of waiting requests. None for no limit.
+            rate_limit (int, optional): Number of requests per session within rate_window. None for no limit.
+            rate_window (float, optional): Seconds of the rate limit window.
+            clock (callable, optional): Monotonic clock returning seconds.
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.clock = clock
+        self.running = 0
+        self.queues = OrderedDict()
+        self.waiting = 0
+        self.requests = {}
+        self.anonymous = itertools.count()
+
+    def check_rate(self, session_id, count=True):
+        """
+        Checks a request of a session against its rate limit and counts it.
+        Args:
+            session_id (Hashable): The session sending the request.
+            count (bool, optional): Count the request. False, if it may still be rejected
+                otherwise; it is counted with count_request once it is accepted.
+        Raises:
+            Rejected: If the session sent rate_limit requests within the last rate_window seconds.
+        """
+        if self.rate_limit is None:
+            return
+        now = self.clock()
+        times = self.requests.get(session_id)
+        while times and times[0] <= now - self.rate_window:
+            times.popleft()
+        if times and len(times) >= self.rate_limit:
+            raise Rejected('rate_limited')
+        if count:
+            self.count_request(session_id)
+
+    def count_request(self, session_id):
+        """
+        Counts an accepted request of a session against its rate limit.
+        Args:
+            session_id (Hashable): The session sending the request.
+        """
+        if self.rate_limit is None:
+            return
+        now = self.clock()
+        self.requests.setdefault(session_id, deque()).append(now)
+        # Sessions without recent requests are forgotten.
+        if len(self.requests) > 1000:
+            self.requests = {key: value for key, value in self.requests.items() if value and value[-1] > now - self.rate_window}
+
+    async def acquire(self, session_id=None, on_position=None):
+        """
+        Waits until the request may run.
+        Args:
+            session_id (Hashable, optional): The session sending the request. Requests
+                without a session are queued like a session of their own.
+            on_position (callable, optional): Called with the position in the queue
+                (1 is next) whenever it changes while the request waits.
+        Raises:
+            Rejected: If the request is rate limited or the queue is full.
+        """
+        if session_id is None:
+            session_id = ('anonymous', next(self.anonymous))
+        # Requests shed as overloaded do not count against the rate limit.
+        self.check_rate(session_id, count=False)
+        if self.running < self.max_concurrent and not self.waiting:
+            self.running += 1
+            self.count_request(session_id)
+            return
+        if self.max_queue is not None and self.waiting >= self.max_queue:
+            raise Rejected('overloaded')
+        self.count_request(session_id)
+
+        waiter = Waiter(on_position)
+        self.queues.setdefault(session_id, deque()).append(waiter)
+        self.waiting += 1
+        self.report_positions()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted, but cancelled before running: the slot goes to the next request.
+                self.release()
+            else:
+                self.remove(session_id, waiter)
+            raise
+
+    def release(self):
+        """
+        Ends a running request and admits the next waiting one.
+        """
+        self.running -= 1
+        while self.queues and self.running < self.max_concurrent:
+            session_id, queue = self.queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                # The session goes to the end of the round.
+                self.queues[session_id] = queue
+            self.waiting -= 1
+            self.running += 1
+            waiter.future.set_result(None)
+        self.report_positions()
+
+    def remove(self, session_id, waiter):
+        queue = self.queues.get(session_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.waiting -= 1
+            if not queue:
+                del self.queues[session_id]
+            self.report_positions()
+
+    def positions(self):
+        """
+        Yields:
+            tuple: Every waiting request with its position in the queue, in the
+                order in which the queues are served.
+        """
+        queues = list(self.queues.values())
+        position = 0
+        for depth in itertools.count():
+            queues = [queue for queue in queues if len(queue) > depth]
+            if not queues:
+                return
+            for queue in queues:
+                position += 1
+                yield queue[depth], position
+
+    def report_positions(self):
+        for waiter, position in self.positions():
+            if waiter.position != position:
+                waiter.position = position
+                if waiter.on_position is not None:
+                    waiter.on_position(position)
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import re
+
+from config import ANSWER_CACHE_SIMILARITY, CHAT_INSTRUCTIONS, LLM_NAME
+from aimodelhub.async_vectordb import get_query_embedding
+from aimodelhub.cache import answer_cache, normalize_query
+from aimodelhub.llm import get_llm
+from aimodelhub.metrics import chat_coalesced_streams
+from aimodelhub.singleflight import StreamFanout
+
+# Digest of the instructions, so that changed instructions do not reuse cached answers.
+INSTRUCTIONS_DIGEST = hashlib.sha256(CHAT_INSTRUCTIONS.encode('utf-8')).hexdigest()[:16]
+
+# Answers being generated, shared by concurrent identical questions.
+_answers = StreamFanout(chat_coalesced_streams)
+
+
+def answer_scope(documents, model_name=LLM_NAME):
+    """
+    Args:
+        documents (list): The retrieved documents the answer is based on.
+        model_name (str, optional): Name of the large language model answering.
+    Returns:
+        tuple: The scope of the answer in the answer cache.
+    """
+    # Keyed on the content rather than the IDs, which replicas and lexical indexes reuse after a rebuild.
+    keys = sorted(
+        f"{document.get('collection', '')}/{document['file_name']}/"
+        f"{hashlib.sha256(document['content'].encode('utf-8')).hexdigest()[:16]}"
+        for document in documents
+    )
+    return (model_name, INSTRUCTIONS_DIGEST, tuple(keys))
+
+
+async def get_cached_answer(query, documents):
+    """
+    Looks up the answer to a query, given the documents retrieved for it. With
+    ANSWER_CACHE_SIMILARITY, answers to paraphrases of the query are found as well.
+    Args:
+        query (str): The query of the user.
+        documents (list): The documents retrieved for the query.
+    Returns:
+        dict: The cached 'answer' with the number of 'prompt_tokens' and 'answer_tokens'
+            it took to generate, or None.
+    """
+    embedding = await get_query_embedding(query) if ANSWER_CACHE_SIMILARITY is not None else None
+    return answer_cache.get(answer_scope(documents), query, embedding)
+
+
+async def cache_answer(query, documents, answer, prompt_tokens, answer_tokens):
+    """
+    Caches a complete answer.
+    Args:
+        query (str): The query of the user.
+        documents (list): The documents retrieved for the query.
+        answer (str): The answer of the LLM.
+        prompt_tokens (int): The number of tokens of the prompt.
+        answer_tokens (int): The number of tokens of the answer.
+    """
+    embedding = await get_query_embedding(query) if ANSWER_CACHE_SIMILARITY is not None else None
+    value = {'answer': answer, 'prompt_tokens': prompt_tokens, 'answer_tokens': answer_tokens}
+    answer_cache.put(answer_scope(documents), query, value, embedding)
+
+
+async def replay_answer(answer):
+    """
+    Streams a cached answer word by word like the LLM would.
+    Args:
+        answer (str): The cached answer.
+    Yields:
+        AIMessageChunk: The chunks of the answer.
+    """
+    from langchain_core.messages import AIMessageChunk
+
+    for word in re.findall(r'\s*\S+\s*', answer) or [answer]:
+        yield AIMessageChunk(content=word)
+        await asyncio.sleep(0)
+
+
+async def shared_answer(query, documents, prompt, session_id=None, on_position=None):
+    """
+    Streams the answer to a query, sharing one stream of the LLM with concurrent
+    identical queries for which the same documents were retrieved. A stream is
+    only shared once it was admitted, so the queue and its rejections only
+    concern the session opening it; a session joining a running stream only
+    counts against its own rate limit.
+    Args:
+        query (str): The query of the user.
+        documents (list): The retrieved documents the prompt is based on.
+        prompt (list): Prompt to be used as the input of the LLM, if no identical answer is being generated.
+        session_id (Hashable, optional): The session asking, for the fair queue and the rate limit.
+        on_position (callable, optional): Called with the position in the queue while waiting.
+    Returns:
+        AsyncIterator: The chunks of the answer.
+    Raises:
+        Rejected: If the session is not admitted.
+    """
+    key = (answer_scope(documents), normalize_query(query))
+    llm = get_llm()
+    if _answers.running(key):
+        llm.admission.check_rate(session_id)
+    else:
+        await llm.admit(session_id, on_position)
+        if _answers.running(key):
+            # An identical answer was admitted while this one waited.
+            llm.release()
+        else:
+            return _answers.stream(key, lambda: llm.stream(prompt), llm.release)
+    return _answers.stream(key, None)
@@ -0,0 +1,333 @@
+import asyncio
+import random
+
+import httpx
+
+from config import (
+    COLLECTION_API_URL, EMBEDDING_MODEL, HEADERS, HTTP_KEEPALIVE_EXPIRY, HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_TIMEOUT, HYBRID_OVERFETCH, INGEST_BACKOFF, INGEST_RETRIES, INGEST_UPLOADERS,
+    LEXICAL_INDEX, LLM_BASE_URL, LOCAL_REPLICA, REPLICA_EMBEDDING_BATCH, REQUEST_COALESCING, RETRIEVAL_CACHE_ENABLED, RETRIEVAL_CACHE_SIMILARITY,
+    RETRIEVAL_TIMEOUT,
+)
+from aimodelhub.cache import embedding_cache, invalidate_collection, normalize_query, retrieval_cache
+from aimodelhub.metrics import retrieval_coalesced
+from aimodelhub.payloads import collection_body, parse_matches
+from aimodelhub.singleflight import SingleFlight
+
+# Collection queries in flight, shared by concurrent identical queries.
+_queries = SingleFlight(retrieval_coalesced)
+
+# Process-wide HTTP client shared by all coroutines, so that connections to the
+# collections API are pooled and kept alive between requests.
+_client = None
+
+
+def get_client():
+    """
+    Returns the shared async HTTP client, creating it on first use.
+    Returns:
+        httpx.AsyncClient: Client with a pooled keep-alive connection set.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=COLLECTION_API_URL,
+            headers=HEADERS,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    """
+    Closes the shared async HTTP client and all of its pooled connections.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def request_with_retry(method, url, retries=INGEST_RETRIES, backoff=INGEST_BACKOFF, **kwargs):
+    """
+    Sends a request with the shared client and retries it with exponential backoff
+    and jitter if it is throttled (429), fails on the server side (5xx) or the
+    connection breaks. A 'Retry-After' header sent by the server is respected.
+    Args:
+        method (str): The HTTP method.
+        url (str): The url, relative to the collections API.
+        retries (int, optional): Maximum number of retries.
+        backoff (float, optional): Seconds to wait before the first retry.
+        **kwargs: Further arguments passed to httpx.AsyncClient.request.
+    Returns:
+        httpx.Response: The last response received.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = await get_client().request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        else:
+            if (response.status_code != 429 and response.status_code < 500) or attempt == retries:
+                return response
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                await asyncio.sleep(int(retry_after))
+                continue
+        await asyncio.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+async def create_collection(collection_name, collection_description):
+    """
+    Creates a collection in IONOS AI Model Hub without blocking the event loop.
+    Args:
+        collection_name (str): The name of the collection.
+        collection_description (str): A description of the collection.
+    Returns:
+        str: The ID of the created collection.
+    """
+    body = collection_body(collection_name, collection_description)
+    response = await get_client().post("/collections", json=body)
+
+    if response.status_code != 201:
+        print(f"Error creating collection: {response.status_code} - {response.text}")
+        return None
+
+    collection_id = response.json()["id"]
+    print("Collection ID:", collection_id)
+    return collection_id
+
+
+async def add_documents_to_collection(collection_id, items):
+    """
+    Adds several documents to the collection with a single request, retrying
+    throttled and failed requests.
+    Args:
+        collection_id (str): The ID of the collection.
+        items (list): Document items as built by aimodelhub.payloads.document_item.
+    Returns:
+        list: The items as returned by the API (including the document IDs) or None on error.
+    """
+    body = {"type": "collection", "items": items}
+    response = await request_with_retry("PUT", f"/collections/{collection_id}/documents", json=body)
+    invalidate_collection(collection_id)
+
+    if response.status_code != 200:
+        names = [item["properties"]["name"] for item in items]
+        print(f"Error adding documents {names}: {response.status_code} - {response.text}")
+        return None
+    return response.json().get("items", [])
+
+
+async def delete_document(collection_id, document_id):
+    """
+    Deletes a single document from the collection, retrying throttled and failed requests.
+    Args:
+        collection_id (str): The ID of the collection.
+        document_id (str): The ID of the document to delete.
+    Returns:
+        bool: True, if the document is gone from the collection.
+    """
+    response = await request_with_retry("DELETE", f"/collections/{collection_id}/documents/{document_id}")
+    invalidate_collection(collection_id)
+
+    if response.status_code not in (200, 204, 404):
+        print(f"Error deleting document {document_id}: {response.status_code} - {response.text}")
+        return False
+    return True
+
+
+async def delete_documents(collection_id, document_ids):
+    """
+    Deletes several documents from the collection concurrently.
+    Args:
+        collection_id (str): The ID of the collection.
+        document_ids (list): The IDs of the documents to delete.
+    Returns:
+        list: For every document, True if it is gone from the collection.
+    """
+    return await asyncio.gather(*[delete_document(collection_id, document_id) for document_id in document_ids])
+
+
+async def retrieve_documents(collection_id, query_string, num_documents=3):
+    """
+    Retrieves documents from the specified collection which are semantically most similar to the
+    query string without blocking the event loop. If the collection has a local replica
+    (LOCAL_REPLICA), only the query is embedded remotely and the replica is searched.
+    With REQUEST_COALESCING, concurrent identical queries share one request.
+    Args:
+        collection_id (str): The ID of the collection to query.
+        query_string (str): The natural language query.
+        num_documents (int, optional): The number of documents to retrieve.
+    Returns:
+        list: The results from the document collection.
+    """
+    scope = (collection_id, num_documents)
+    embedding = None
+    if RETRIEVAL_CACHE_ENABLED:
+        cached = retrieval_cache.get(scope, query_string)
+        if cached is None and RETRIEVAL_CACHE_SIMILARITY is not None:
+            embedding = await get_query_embedding(query_string)
+            cached = retrieval_cache.get(scope, query_string, embedding)
+        if cached is not None:
+            return cached
+
+    if REQUEST_COALESCING:
+        key = (collection_id, num_documents, normalize_query(query_string))
+        return await _queries.run(key, query_collection, collection_id, query_string, num_documents, embedding)
+    return await query_collection(collection_id, query_string, num_documents, embedding)
+
+
+async def query_collection(collection_id, query_string, num_documents=3, embedding=None):
+    """
+    Queries the local replica or the collections API, fuses the matches with those of
+    the lexical index of the collection (LEXICAL_INDEX) and caches the results.
+    Args:
+        collection_id (str): The ID of the collection to query.
+        query_string (str): The natural language query.
+        num_documents (int, optional): The number of documents to retrieve.
+        embedding (list, optional): The embedding of the query, if it is known already.
+    Returns:
+        list: The results from the document collection.
+    Raises:
+        RuntimeError: If the collections API answers with an error.
+    """
+    # The local indexes need numpy, which is only loaded once a collection is queried.
+    from aimodelhub.lexical import get_lexical_index, hybrid_matches
+    from aimodelhub.replica import get_replica
+
+    # With a lexical index, more candidates are fetched for the fusion of both rankings.
+    hybrid = LEXICAL_INDEX and get_lexical_index(collection_id) is not None
+    limit = num_documents * HYBRID_OVERFETCH if hybrid else num_documents
+    results = None
+    replica = get_replica(collection_id) if LOCAL_REPLICA else None
+    if replica is not None:
+        try:
+            embedding = embedding or await get_query_embedding(query_string)
+            results = replica.search(embedding, limit)
+        except Exception as error:
+            print(f"Error querying the replica of collection {collection_id}: {error}")
+
+    if results is None:
+        body = {"query": query_string, "limit": limit}
+        response = await get_client().post(f"/collections/{collection_id}/query", json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"Error querying collection {collection_id}: {response.status_code} - {response.text}")
+        results = parse_matches(response.json())
+    if hybrid:
+        results = hybrid_matches(collection_id, query_string, results, num_documents)
+
+    if RETRIEVAL_CACHE_ENABLED:
+        retrieval_cache.put((collection_id, num_documents), query_string, results, embedding)
+    return results
+
+
+async def retrieve_from_collections(collections, query_string, num_documents=3, timeout=RETRIEVAL_TIMEOUT):
+    """
+    Queries several collections concurrently and merges the matches by score. Each
+    collection gets at most `timeout` seconds; collections which are slower or fail
+    are left out, so that one of them cannot hold up the answer.
+    Args:
+        collections (dict): The IDs of the collections to query by name.
+        query_string (str): The natural language query.
+        num_documents (int, optional): The number of documents to retrieve in total.
+        timeout (float, optional): Seconds to wait for the results of a single collection.
+    Returns:
+        list: The best matches of all collections, each with the 'collection' name it came from.
+    """
+    async def query(name, collection_id):
+        try:
+            results = await asyncio.wait_for(retrieve_documents(collection_id, query_string, num_documents), timeout)
+        except asyncio.TimeoutError:
+            print(f"Collection '{name}' did not answer within {timeout} s.")
+            return []
+        except Exception as error:
+            print(f"Error querying collection '{name}': {error}")
+            return []
+        return [{**result, 'collection': name} for result in results]
+
+    answers = await asyncio.gather(*[query(name, collection_id) for name, collection_id in collections.items()])
+    matches = [result for results in answers for result in results]
+    return sorted(matches, key=lambda result: result['score'], reverse=True)[:num_documents]
+
+
+async def embed_query(query_string):
+    """
+    Computes the embedding of a query with the embedding model of the collections
+    without blocking the event loop.
+    Args:
+        query_string (str): The natural language query.
+    Returns:
+        list: The embedding vector.
+    """
+    body = {"model": EMBEDDING_MODEL, "input": query_string}
+    response = await get_client().post(f"{LLM_BASE_URL}/embeddings", json=body)
+    if response.status_code != 200:
+        raise RuntimeError(f"Error embedding the query: {response.status_code} - {response.text}")
+
+    return response.json()['data'][0]['embedding']
+
+
+async def get_query_embedding(query_string):
+    """
+    Returns the embedding of a query, computing it only if it is not cached.
+    Args:
+        query_string (str): The natural language query.
+    Returns:
+        list: The embedding vector.
+    """
+    embedding = embedding_cache.get((EMBEDDING_MODEL,), query_string)
+    if embedding is None:
+        embedding = await embed_query(query_string)
+        embedding_cache.put((EMBEDDING_MODEL,), query_string, embedding)
+    return embedding
+
+
+async def embed_texts(texts, batch_size=REPLICA_EMBEDDING_BATCH, concurrency=INGEST_UPLOADERS):
+    """
+    Computes the embeddings of many texts with the embedding model of the collections,
+    sending batches of texts concurrently and retrying throttled or failed requests.
+    Args:
+        texts (list): The texts to embed.
+        batch_size (int, optional): Number of texts embedded with a single request.
+        concurrency (int, optional): Number of concurrent requests.
+    Returns:
+        list: The embedding vector of every text.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def embed_batch(batch):
+        async with slots:
+            body = {"model": EMBEDDING_MODEL, "input": batch}
+            response = await request_with_retry("POST", f"{LLM_BASE_URL}/embeddings", json=body)
+            response.raise_for_status()
+            data = sorted(response.json()['data'], key=lambda entry: entry['index'])
+            return [entry['embedding'] for entry in data]
+
+    batches = await asyncio.gather(*[
+        embed_batch(texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)
+    ])
+    return [embedding for batch in batches for embedding in batch]
+
+
+async def delete_collection(collection_id):
+    """
+    Deletes the collection specified without blocking the event loop.
+    Args:
+        collection_id (str): The ID of the collection to delete.
+    """
+    response = await get_client().delete(f"/collections/{collection_id}")
+    invalidate_collection(collection_id)
+
+    if response.status_code == 204:
+        print(f"Deleted collection: {collection_id}")
+    elif response.status_code == 404:
+        print(f"Collection to delete did not exist: {collection_id}")
+    else:
+        print(f"Error deleting collection: {response.status_code} - {response.text}")
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, CACHE_INVALIDATION_INTERVAL, CACHE_INVALIDATION_PATH,
+    RETRIEVAL_CACHE_SIMILARITY, RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL,
+)
+
+
+def normalize_query(query):
+    """
+    Normalizes a query, so that trivially different spellings share a cache entry.
+    Args:
+        query (str): The natural language query.
+    Returns:
+        str: The lower cased query with collapsed whitespace and without trailing punctuation.
+    """
+    return re.sub(r'\s+', ' ', query).strip().lower().rstrip('?!. ')
+
+
+class EmbeddingIndex:
+    """
+    The normalized query embeddings of the entries of one scope as rows of a numpy
+    matrix, so that the most similar query is found with a single product.
+    """
+
+    def __init__(self, dimension):
+        import numpy
+
+        self.keys = []
+        self.rows = {}
+        self.matrix = numpy.empty((16, dimension), dtype=numpy.float32)
+
+    def add(self, key, embedding):
+        import numpy
+
+        vector = numpy.asarray(embedding, dtype=numpy.float32)
+        norm = numpy.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.matrix):
+                self.matrix = numpy.concatenate([self.matrix, numpy.empty_like(self.matrix)])
+            self.keys.append(key)
+            self.rows[key] = row
+        self.matrix[row] = vector
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        # The last row takes the place of the removed one.
+        last = len(self.keys) - 1
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.keys[row] = self.keys[last]
+            self.rows[self.keys[row]] = row
+        self.keys.pop()
+
+    def similarities(self, embedding):
+        """
+        Args:
+            embedding (list): Embedding of a query.
+        Returns:
+            numpy.ndarray: The cosine similarity of the query with every row.
+        """
+        import numpy
+
+        vector = numpy.asarray(embedding, dtype=numpy.float32)
+        norm = numpy.linalg.norm(vector)
+        return self.matrix[:len(self.keys)] @ (vector / norm if norm else vector)
+
+
+class QueryCache:
+    """
+    LRU cache with time-to-live for values derived from natural language queries.
+
+    Entries are keyed on a scope (e.g. the collection and the number of requested
+    documents) plus the normalized query. Optionally, a query misses the exact key
+    but still hits an entry of the same scope whose query embedding has at least
+    the configured cosine similarity.
+
+    Caches with a name see the invalidations of other processes sharing
+    CACHE_INVALIDATION_PATH within CACHE_INVALIDATION_INTERVAL seconds.
+    """
+
+    def __init__(self, max_entries, ttl, similarity_threshold=None, name=None):
+        """
+        Args:
+            max_entries (int): Number of entries kept before the least recently used is evicted.
+            ttl (float): Seconds an entry stays valid.
+            similarity_threshold (float, optional): Minimum cosine similarity of near-duplicate
+                queries. Defaults to None, which disables near-duplicate matching.
+            name (str, optional): Name of the cache in CACHE_INVALIDATION_PATH. Defaults to
+                None, which invalidates the entries of the current process only.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.name = name
+        self.entries = OrderedDict()
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.next_sync = 0.0
+        self.synced = {}
+        self.counters = {
+            'hits': 0, 'semantic_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0,
+        }
+
+    def _remove(self, key):
+        del self.entries[key]
+        index = self.indexes.get(key[0])
+        if index is not None:
+            index.remove(key)
+            if not index.keys:
+                del self.indexes[key[0]]
+
+    def _drop(self, scope_id, before=None):
+        """
+        Drops the entries whose scope starts with scope_id (all for None), which were
+        cached before the given time.time().
+        """
+        offset = time.time() - time.monotonic()
+        for key, (expires_at, _, _) in list(self.entries.items()):
+            if scope_id is not None and key[0][0] != scope_id:
+                continue
+            if before is not None and expires_at - self.ttl + offset >= before:
+                continue
+            self._remove(key)
+            self.counters['invalidations'] += 1
+
+    def _sync(self):
+        """
+        Applies the invalidations written by other processes since the last check.
+        """
+        now = time.monotonic()
+        if self.name is None or CACHE_INVALIDATION_PATH is None or now < self.next_sync:
+            return
+        self.next_sync = now + CACHE_INVALIDATION_INTERVAL
+        try:
+            files = list(os.scandir(CACHE_INVALIDATION_PATH))
+        except FileNotFoundError:
+            return
+        for file in files:
+            if not file.name.startswith(f"{self.name}-") or not file.name.endswith(".json"):
+                continue
+            try:
+                modified = file.stat().st_mtime_ns
+                if self.synced.get(file.name) == modified:
+                    continue
+                with open(file.path) as handle:
+                    scope_id = json.load(handle)
+            except (FileNotFoundError, ValueError):
+                continue
+            self.synced[file.name] = modified
+            self._drop(scope_id, modified / 1e9)
+
+    def get(self, scope, query, embedding=None):
+        """
+        Looks up the value cached for a query.
+        Args:
+            scope (tuple): The scope of the query. Its first element is used for invalidation.
+            query (str): The natural language query.
+            embedding (list, optional): Embedding of the query used for near-duplicate matching.
+                If omitted, only exact matches of the normalized query are returned.
+        Returns:
+            The cached value or None.
+        """
+        key = (scope, normalize_query(query))
+        now = time.monotonic()
+        with self.lock:
+            self._sync()
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < now:
+                self._remove(key)
+                self.counters['expirations'] += 1
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return entry[1]
+
+            index = self.indexes.get(scope)
+            if embedding is not None and self.similarity_threshold is not None and index is not None:
+                similarities = index.similarities(embedding)
+                # Expired entries are skipped until the most similar valid one is found.
+                for row in similarities.argsort()[::-1]:
+                    if similarities[row] < self.similarity_threshold:
+                        break
+                    best_key = index.keys[row]
+                    if self.entries[best_key][0] >= now:
+                        self.entries.move_to_end(best_key)
+                        self.counters['semantic_hits'] += 1
+                        return self.entries[best_key][1]
+
+            # With near-duplicate matching the exact lookup is followed by a second
+            # lookup with the embedding, so only that one counts as a miss.
+            if embedding is not None or self.similarity_threshold is None:
+                self.counters['misses'] += 1
+            return None
+
+    def put(self, scope, query, value, embedding=None):
+        """
+        Caches the value for a query, evicting the least recently used entry if full.
+        Args:
+            scope (tuple): The scope of the query.
+            query (str): The natural language query.
+            value: The value to cache.
+            embedding (list, optional): Embedding of the query used for near-duplicate matching.
+        """
+        key = (scope, normalize_query(query))
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value, embedding)
+            if embedding is not None and self.similarity_threshold is not None:
+                if scope not in self.indexes:
+                    self.indexes[scope] = EmbeddingIndex(len(embedding))
+                self.indexes[scope].add(key, embedding)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.counters['evictions'] += 1
+
+    def invalidate(self, scope_id=None):
+        """
+        Drops all entries whose scope starts with the given id, in this process and,
+        for a cache with a name, in the other processes sharing CACHE_INVALIDATION_PATH.
+        Args:
+            scope_id (optional): First element of the scopes to drop, e.g. a collection ID.
+                Defaults to None, which drops all entries.
+        """
+        with self.lock:
+            self._drop(scope_id)
+            if self.name is None or CACHE_INVALIDATION_PATH is None:
+                return
+            digest = hashlib.sha256(json.dumps(scope_id).encode('utf-8')).hexdigest()[:16]
+            file_name = f"{self.name}-{digest}.json"
+            os.makedirs(CACHE_INVALIDATION_PATH, exist_ok=True)
+            path = os.path.join(CACHE_INVALIDATION_PATH, file_name)
+            with open(f"{path}.{os.getpid()}.tmp", "w") as file:
+                json.dump(scope_id, file)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+            self.synced[file_name] = os.stat(path).st_mtime_ns
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit, miss, eviction, expiration and invalidation counters and the current size.
+        """
+        with self.lock:
+            return {**self.counters, 'size': len(self.entries)}
+
+
+# Cache of the results of collection queries. Invalidated when a collection changes,
+# also in the other processes, see CACHE_INVALIDATION_PATH.
+retrieval_cache = QueryCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_SIMILARITY, 'retrieval')
+# Cache of the embeddings of queries, scoped by the embedding model.
+embedding_cache = QueryCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+# Cache of complete answers of the LLM, scoped by the model, the instructions and the
+# retrieved documents, see aimodelhub.answers.
+answer_cache = QueryCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY, 'answer')
+
+
+def invalidate_collection(collection_id):
+    """
+    Drops the cached results of a collection which changed and all cached answers,
+    as they may be based on its documents.
+    Args:
+        collection_id (str): The ID of the collection.
+    """
+    retrieval_cache.invalidate(collection_id)
+    answer_cache.invalidate()
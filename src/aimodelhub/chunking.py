@@ -0,0 +1,82 @@
+import re
+
+from config import CLIENT_CHUNK_OVERLAP, CLIENT_CHUNK_TOKENS
+from aimodelhub.tokens import count_tokens
+
+
+def split_units(text, max_tokens):
+    """
+    Splits text into paragraphs. Paragraphs with more than max_tokens tokens are
+    split into sentences and sentences that are still too long into groups of words.
+    Args:
+        text (str): The text of a page or paragraph.
+        max_tokens (int): Maximum number of tokens of a unit.
+    Yields:
+        tuple: The text of the next unit and its number of tokens.
+    """
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens <= max_tokens:
+            yield paragraph, tokens
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            tokens = count_tokens(sentence)
+            if tokens <= max_tokens:
+                yield sentence, tokens
+                continue
+            words, word_tokens = [], 0
+            for word in sentence.split():
+                tokens = count_tokens(word)
+                if words and word_tokens + tokens > max_tokens:
+                    yield ' '.join(words), word_tokens
+                    words, word_tokens = [], 0
+                words.append(word)
+                word_tokens += tokens
+            if words:
+                yield ' '.join(words), word_tokens
+
+
+def make_chunk(units):
+    pages = [page for page, _, _ in units if page is not None]
+    return {
+        'text': '\n\n'.join(text for _, text, _ in units),
+        'page_start': min(pages) if pages else None,
+        'page_end': max(pages) if pages else None,
+    }
+
+
+def chunk_segments(segments, chunk_tokens=CLIENT_CHUNK_TOKENS, overlap_tokens=CLIENT_CHUNK_OVERLAP):
+    """
+    Packs the paragraphs of a document into chunks of at most chunk_tokens tokens.
+    Chunks are only cut between paragraphs (or sentences of overly long paragraphs)
+    and start with the trailing paragraphs of the previous chunk up to overlap_tokens.
+    Args:
+        segments (Iterable): Tuples of the page number (or None) and the text of each segment,
+            see aimodelhub.documents.iter_segments.
+        chunk_tokens (int, optional): Maximum number of tokens per chunk.
+        overlap_tokens (int, optional): Maximum number of tokens repeated from the previous chunk.
+    Yields:
+        dict: The 'text' of the next chunk and the first and last page it covers
+            ('page_start', 'page_end'), which are None for documents without pages.
+    """
+    units, total = [], 0
+    for page, text in segments:
+        for unit, tokens in split_units(text, chunk_tokens):
+            if units and total + tokens > chunk_tokens:
+                yield make_chunk(units)
+                overlap, overlap_total = [], 0
+                for previous in reversed(units):
+                    if overlap_total + previous[2] > overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_total += previous[2]
+                while overlap and overlap_total + tokens > chunk_tokens:
+                    overlap_total -= overlap.pop(0)[2]
+                units, total = overlap, overlap_total
+            units.append((page, unit, tokens))
+            total += tokens
+    if units:
+        yield make_chunk(units)
@@ -1,26 +1,93 @@
 import os
-from docx import Document
-import fitz
 
 
-def extract_from_pdf(file_path, max_pages=None):
+def iter_pdf_pages(file_path, max_pages=None, first_page=0):
     """
-    Extracts text from a PDF file.
+    Extracts text from a PDF file page by page.
     Args:
         file_path (str): The path to the PDF file.
         max_pages (int, optional): The maximum number of pages to extract. Defaults to None (all pages).
-    Returns:
-        str: The extracted text.
+        first_page (int, optional): The position of the first page to extract, starting at 0.
+    Yields:
+        str: The text of the next page.
     """
+    import fitz
+
     with fitz.open(file_path) as doc:
-        text = ''
         num_pages = len(doc)
-        for page_num in range(num_pages):
+        for page_num in range(first_page, num_pages):
             if max_pages is not None and page_num >= max_pages:
                 break
-            page = doc[page_num]
-            text += page.get_text()
-        return text
+            yield doc[page_num].get_text()
+
+
+def count_pdf_pages(file_path):
+    """
+    Args:
+        file_path (str): The path to the PDF file.
+    Returns:
+        int: The number of pages of the PDF file.
+    """
+    import fitz
+
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+
+def extract_pdf_range(file_path, first_page, end_page):
+    """
+    Extracts a range of pages of a PDF file, so that large files can be extracted
+    by several processes.
+    Args:
+        file_path (str): The path to the PDF file.
+        first_page (int): The position of the first page to extract, starting at 0.
+        end_page (int): The position after the last page to extract.
+    Returns:
+        list: Tuples of the page number (starting at 1) and the text of every page.
+    """
+    pages = iter_pdf_pages(file_path, end_page, first_page)
+    return list(enumerate(pages, start=first_page + 1))
+
+
+def iter_docx_paragraphs(file_path):
+    """
+    Extracts text from a DOCX file paragraph by paragraph.
+    Args:
+        file_path (str): The path to the DOCX file.
+    Yields:
+        str: The text of the next paragraph followed by a line break.
+    """
+    from docx import Document
+
+    doc = Document(file_path)
+    for para in doc.paragraphs:
+        yield para.text + '\n'
+
+
+def iter_txt_blocks(file_path, block_size=1024 * 1024):
+    """
+    Reads a raw text file in blocks, so that large files are never held in memory as a whole.
+    Args:
+        file_path (str): The path to the raw text file.
+        block_size (int, optional): Number of characters per block.
+    Yields:
+        str: The next block of text.
+    """
+    with open(file_path) as f:
+        for block in iter(lambda: f.read(block_size), ''):
+            yield block
+
+
+def extract_from_pdf(file_path, max_pages=None):
+    """
+    Extracts text from a PDF file.
+    Args:
+        file_path (str): The path to the PDF file.
+        max_pages (int, optional): The maximum number of pages to extract. Defaults to None (all pages).
+    Returns:
+        str: The extracted text.
+    """
+    return ''.join(iter_pdf_pages(file_path, max_pages))
 
 
 def extract_from_docx(file_path):
@@ -31,11 +98,7 @@ def extract_from_docx(file_path):
     Returns:
         str: The extracted text.
     """
-    doc = Document(file_path)
-    text = ''
-    for para in doc.paragraphs:
-        text += para.text + '\n'
-    return text
+    return ''.join(iter_docx_paragraphs(file_path))
 
 
 def extract_from_txt(file_path):
@@ -46,12 +109,43 @@ def extract_from_txt(file_path):
     Returns:
         str: The extracted text.
     """
-    text = ""
-    
-    with open(file_path) as f:
-        text += f.read()
+    return ''.join(iter_txt_blocks(file_path))
+
 
-    return text
+def iter_text(file_path, max_pages=None):
+    """
+    Extracts text from a file based on its extension, segment by segment: PDFs by
+    page, DOCX files by paragraph and raw text files in blocks.
+    Args:
+        file_path (str): The path to the file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs. Defaults to None.
+    Returns:
+        Iterator: The text segments, or an empty iterator for unsupported file formats.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.pdf':
+        return iter_pdf_pages(file_path, max_pages)
+    elif file_extension == '.docx':
+        return iter_docx_paragraphs(file_path)
+    elif file_extension == '.txt':
+        return iter_txt_blocks(file_path)
+    else:
+        print(f"Unsupported file format: {file_extension}")
+        return iter(())
+
+
+def iter_segments(file_path, max_pages=None):
+    """
+    Extracts text from a file segment by segment together with the page number.
+    Args:
+        file_path (str): The path to the file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs. Defaults to None.
+    Yields:
+        tuple: The page number (starting at 1, None for files without pages) and the text of the next segment.
+    """
+    paged = os.path.splitext(file_path)[1].lower() == '.pdf'
+    for number, text in enumerate(iter_text(file_path, max_pages), start=1):
+        yield (number if paged else None), text
 
 
 def extract_text(file_path, max_pages=None):
@@ -0,0 +1,205 @@
+import gzip
+import hashlib
+import json
+import os
+
+from config import EXTRACTION_CACHE_BYTES, EXTRACTION_CACHE_PATH, PDF_SHARD_PAGES
+from aimodelhub.documents import count_pdf_pages, iter_segments
+
+# Changes whenever the extracted text of a file changes, e.g. with a new extraction
+# library, so that texts cached before are not used anymore.
+EXTRACTION_VERSION = 1
+
+
+def file_hash(file_path):
+    """
+    Args:
+        file_path (str): The path to the file.
+    Returns:
+        str: The SHA-256 hex digest of the file content, read in blocks of 1 MB.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extraction_key(file_path, max_pages=None):
+    """
+    Args:
+        file_path (str): The path to the file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs.
+    Returns:
+        str: Identifies the text extracted from the content of the file, wherever it is stored.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    pages = max_pages if extension == '.pdf' else None
+    return f"{file_hash(file_path)}-{pages}-{EXTRACTION_VERSION}{extension}"
+
+
+def cache_file(key, path=EXTRACTION_CACHE_PATH):
+    return os.path.join(path, f"{key}.jsonl.gz")
+
+
+def load_extraction(key, path=EXTRACTION_CACHE_PATH):
+    """
+    Reads text extracted before and marks it as recently used.
+    Args:
+        key (str): The key of the file, see extraction_key.
+        path (str, optional): The folder of the extraction cache.
+    Returns:
+        list: Tuples of the page number and the text of every segment or None, if the text is not cached.
+    """
+    if path is None:
+        return None
+    file_name = cache_file(key, path)
+    try:
+        with gzip.open(file_name, "rt", encoding="utf-8") as file:
+            segments = [tuple(json.loads(line)) for line in file]
+        os.utime(file_name)
+    except (FileNotFoundError, EOFError, OSError, ValueError):
+        return None
+    return segments
+
+
+def store_extraction(key, segments, path=EXTRACTION_CACHE_PATH, max_bytes=EXTRACTION_CACHE_BYTES):
+    """
+    Stores extracted text compressed and evicts the least recently used texts
+    once the cache exceeds its size.
+    Args:
+        key (str): The key of the file, see extraction_key.
+        segments (list): Tuples of the page number and the text of every segment.
+        path (str, optional): The folder of the extraction cache.
+        max_bytes (int, optional): The maximum size of the extraction cache.
+    """
+    if path is None:
+        return
+    os.makedirs(path, exist_ok=True)
+    file_name = cache_file(key, path)
+    # Written under a name of its own, so that concurrent workers never read half a file.
+    with gzip.open(f"{file_name}.{os.getpid()}.tmp", "wt", encoding="utf-8", compresslevel=6) as file:
+        for segment in segments:
+            file.write(json.dumps(segment) + "\n")
+    os.replace(f"{file_name}.{os.getpid()}.tmp", file_name)
+    evict_extractions(path, max_bytes)
+
+
+def evict_extractions(path=EXTRACTION_CACHE_PATH, max_bytes=EXTRACTION_CACHE_BYTES):
+    """
+    Deletes the least recently used texts until the cache fits into max_bytes.
+    Args:
+        path (str, optional): The folder of the extraction cache.
+        max_bytes (int, optional): The maximum size of the extraction cache.
+    Returns:
+        int: The number of deleted texts.
+    """
+    entries = []
+    for entry in os.scandir(path):
+        if entry.name.endswith(".jsonl.gz"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, file_name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted += 1
+    return evicted
+
+
+def cached_segments(file_path, max_pages=None, key=None):
+    """
+    Extracts the text of a file segment by segment, see
+    aimodelhub.documents.iter_segments. Files whose content was extracted before
+    are read from the extraction cache instead of being parsed again.
+    Args:
+        file_path (str): The path to the file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs.
+        key (str, optional): The key of the file, if already known, see extraction_key.
+    Returns:
+        list: Tuples of the page number (None for files without pages) and the text of every segment.
+    """
+    if EXTRACTION_CACHE_PATH is None:
+        return list(iter_segments(file_path, max_pages))
+    key = key or extraction_key(file_path, max_pages)
+    segments = load_extraction(key)
+    if segments is None:
+        segments = list(iter_segments(file_path, max_pages))
+        store_extraction(key, segments)
+    return segments
+
+
+def iter_cached_segments(file_path, max_pages=None):
+    """
+    Like cached_segments, but reads and extracts the text segment by segment, so
+    that it is never held in memory as a whole. Text extracted on the way is
+    stored in the extraction cache once the file was read to its end.
+    Args:
+        file_path (str): The path to the file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs.
+    Yields:
+        tuple: The page number (None for files without pages) and the text of the next segment.
+    """
+    if EXTRACTION_CACHE_PATH is None:
+        yield from iter_segments(file_path, max_pages)
+        return
+    file_name = cache_file(extraction_key(file_path, max_pages))
+    try:
+        file = gzip.open(file_name, "rt", encoding="utf-8")
+    except FileNotFoundError:
+        file = None
+    if file is not None:
+        with file:
+            for line in file:
+                yield tuple(json.loads(line))
+        os.utime(file_name)
+        return
+
+    os.makedirs(EXTRACTION_CACHE_PATH, exist_ok=True)
+    temporary = f"{file_name}.{os.getpid()}.tmp"
+    try:
+        with gzip.open(temporary, "wt", encoding="utf-8", compresslevel=6) as file:
+            for segment in iter_segments(file_path, max_pages):
+                file.write(json.dumps(segment) + "\n")
+                yield segment
+    except BaseException:
+        os.remove(temporary)
+        raise
+    os.replace(temporary, file_name)
+    evict_extractions()
+
+
+def plan_extraction(file_path, max_pages=None, shard_pages=PDF_SHARD_PAGES):
+    """
+    Decides how a file is extracted: PDFs with more than shard_pages pages, which
+    are not in the extraction cache, are split into ranges of pages extracted by
+    several processes.
+    Args:
+        file_path (str): The path to the file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs.
+        shard_pages (int, optional): The number of pages per range.
+    Returns:
+        tuple: The key of the file in the extraction cache (None without cache) and a list of
+            the first and the end position of every range of pages, or None if the file is
+            extracted as a whole.
+    """
+    key = extraction_key(file_path, max_pages) if EXTRACTION_CACHE_PATH is not None else None
+    if os.path.splitext(file_path)[1].lower() != '.pdf' or not shard_pages:
+        return key, None
+    if key is not None and os.path.isfile(cache_file(key)):
+        return key, None
+    num_pages = count_pdf_pages(file_path)
+    if max_pages is not None:
+        num_pages = min(num_pages, max_pages)
+    if num_pages <= shard_pages:
+        return key, None
+    return key, [(first, min(first + shard_pages, num_pages)) for first in range(0, num_pages, shard_pages)]
@@ -0,0 +1,343 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+from config import (
+    CLIENT_CHUNKING, COLLECTION_API_URL, HEADERS, INGEST_BACKOFF, INGEST_BATCH_BYTES, INGEST_QUEUE_SIZE,
+    INGEST_RETRIES, INGEST_STREAMING_BYTES, INGEST_UPLOADERS, INGEST_WORKERS,
+)
+from aimodelhub.async_vectordb import add_documents_to_collection, close_client
+from aimodelhub.chunking import chunk_segments
+from aimodelhub.documents import extract_pdf_range, iter_text
+from aimodelhub.extraction import cached_segments, iter_cached_segments, plan_extraction, store_extraction
+from aimodelhub.metrics import Trace
+from aimodelhub.payloads import document_item, iter_document_body, part_item
+
+
+def extract_items(file_path, file_name, max_pages=None, skip_parts=(), segments=None, key=None):
+    """
+    Extracts the text of a file and encodes it as document items. Runs in a worker
+    process. With CLIENT_CHUNKING the file is split into ordered part-documents,
+    otherwise it becomes a single document. Text extracted before is taken from
+    the extraction cache.
+    Args:
+        file_path (str): The path to the file.
+        file_name (str): The name of the document.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs.
+        skip_parts (Collection, optional): Positions of parts uploaded before, which are left out.
+        segments (list, optional): The segments of the file, if already extracted
+            (by ranges of pages). They are stored in the extraction cache.
+        key (str, optional): The key of the file in the extraction cache.
+    Returns:
+        tuple: The number of parts of the file and a list of tuples of the position and
+            the document item of each part to upload. No parts, if no text could be extracted.
+    """
+    if segments is None:
+        segments = cached_segments(file_path, max_pages, key)
+    elif key is not None:
+        store_extraction(key, segments)
+    if CLIENT_CHUNKING:
+        chunks = list(chunk_segments(segments))
+        items = [(part, part_item(file_name, part, chunk)) for part, chunk in enumerate(chunks) if part not in skip_parts]
+        return len(chunks), items
+    text = ''.join(text for _, text in segments)
+    return (1, [(0, document_item(file_name, text))]) if text else (0, [])
+
+
+def timed_call(function, *args):
+    """
+    Calls a function and measures its duration. Used to time work done in worker processes.
+    Args:
+        function (Callable): The function to call.
+        *args: The arguments of the function.
+    Returns:
+        tuple: The result of the function and the seconds it took.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def upload_stream(collection_id, file_path, file_name, max_pages=None):
+    """
+    Extracts a file and uploads it as a single document while the request body is
+    written, so memory stays bounded by the size of a page or block of text. Runs in
+    a worker process. Throttled or failed uploads are retried from the start.
+    Args:
+        collection_id (str): The ID of the collection.
+        file_path (str): The path to the file.
+        file_name (str): The name of the document.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs.
+    Returns:
+        str: The ID of the uploaded document or None, if no text could be extracted or the upload failed.
+    """
+    endpoint = f"{COLLECTION_API_URL}/collections/{collection_id}/documents"
+    for attempt in range(INGEST_RETRIES + 1):
+        segments = iter_text(file_path, max_pages)
+        first = next((segment for segment in segments if segment), None)
+        if first is None:
+            return None
+
+        body = iter_document_body(file_name, itertools.chain([first], segments))
+        response = requests.put(endpoint, headers=HEADERS, data=body)
+        if response.status_code == 200:
+            return response.json()['items'][0].get('id')
+        if (response.status_code != 429 and response.status_code < 500) or attempt == INGEST_RETRIES:
+            print(f"Error adding document '{file_name}': {response.status_code} - {response.text}")
+            return None
+        time.sleep(INGEST_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def item_size(item):
+    """
+    Args:
+        item (dict): A document item.
+    Returns:
+        int: Approximate number of bytes the item adds to the request body.
+    """
+    return len(json.dumps(item))
+
+
+def list_files(folder_path):
+    """
+    Args:
+        folder_path (str): The path to the folder containing the files.
+    Returns:
+        list: Tuples of the path and the name of every file in the folder.
+    """
+    return [
+        (os.path.join(folder_path, filename), filename)
+        for filename in sorted(os.listdir(folder_path))
+        if os.path.isfile(os.path.join(folder_path, filename))
+    ]
+
+
+def iter_chunks(files, max_pages=None):
+    """
+    Splits files into chunks like with CLIENT_CHUNKING, for the local indexes of a
+    collection, one file after the other. Files extracted before are read from the
+    extraction cache. Texts are read segment by segment, so that the text of a file
+    is never held in memory as a whole.
+    Args:
+        files (list): Tuples of the path and the name of every file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs.
+    Yields:
+        dict: The 'file_name', 'content' and 'pages' (first, last) of the next chunk.
+    """
+    for file_path, file_name in files:
+        for chunk in chunk_segments(iter_cached_segments(file_path, max_pages)):
+            pages = [chunk['page_start'], chunk['page_end']] if chunk['page_start'] is not None else None
+            yield {'file_name': file_name, 'content': chunk['text'], 'pages': pages}
+
+
+def chunk_files(files, max_pages=None):
+    """
+    Splits files into chunks, see iter_chunks.
+    Args:
+        files (list): Tuples of the path and the name of every file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs.
+    Returns:
+        list: Dicts with the 'file_name', 'content' and 'pages' (first, last) of every chunk.
+    """
+    return list(iter_chunks(files, max_pages))
+
+
+async def extract_files(collection_id, files, queue, max_pages, workers, uploaded, skip_parts):
+    """
+    Extracts the files in a process pool and puts the document items into the queue.
+    At most two extractions per worker are in flight, so that the extracted texts
+    waiting for upload are bounded by the queue size. Unless chunked on the client,
+    files larger than INGEST_STREAMING_BYTES bypass the queue and are streamed by
+    the worker itself. Large PDFs are extracted by ranges of pages in parallel, see
+    plan_extraction.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(2 * workers)
+
+    async def extract(executor, file_path, file_name):
+        async with slots:
+            print(f"Processing: {file_name}")
+            try:
+                if not CLIENT_CHUNKING and os.path.getsize(file_path) > INGEST_STREAMING_BYTES:
+                    document_id, seconds = await loop.run_in_executor(
+                        executor, timed_call, upload_stream, collection_id, file_path, file_name, max_pages
+                    )
+                    # Extraction and upload overlap when streaming, so both count as upload.
+                    uploaded['timings'][file_name] = {'extraction_seconds': 0.0, 'upload_seconds': seconds}
+                    if document_id is not None:
+                        print(f"Document '{file_name}' added to collection.")
+                        uploaded['document_ids'][file_name] = [document_id]
+                        uploaded['documents'] += 1
+                    return
+                start = time.perf_counter()
+                key, ranges = await loop.run_in_executor(executor, plan_extraction, file_path, max_pages)
+                segments = None
+                if ranges:
+                    pages = await asyncio.gather(*[
+                        loop.run_in_executor(executor, extract_pdf_range, file_path, first, end) for first, end in ranges
+                    ])
+                    segments = [segment for shard in pages for segment in shard]
+                parts, items = await loop.run_in_executor(
+                    executor, extract_items, file_path, file_name, max_pages, skip_parts.get(file_name, ()), segments, key
+                )
+                seconds = time.perf_counter() - start
+            except Exception as error:
+                print(f"Error processing '{file_name}': {error}")
+                return
+            uploaded['document_ids'][file_name] = [None] * parts
+            uploaded['timings'][file_name] = {'extraction_seconds': seconds, 'upload_seconds': 0.0}
+            for part, item in items:
+                await queue.put((file_name, part, item))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        await asyncio.gather(*[extract(executor, file_path, file_name) for file_path, file_name in files])
+
+
+async def upload_batches(collection_id, queue, batch_bytes, uploaded):
+    """
+    Takes document items from the queue, packs them into requests of at most
+    batch_bytes (a single larger document is sent alone) and uploads them. Stops
+    at the sentinel None. The parts of a batch whose upload failed stay None in
+    the document IDs, and the queue is drained on, so that the extraction never
+    waits for an uploader that is gone.
+    """
+    carry = None
+    while True:
+        entry = carry if carry is not None else await queue.get()
+        carry = None
+        if entry is None:
+            return
+
+        batch, size = [entry], item_size(entry[2])
+        while not queue.empty():
+            entry = queue.get_nowait()
+            if entry is None:
+                queue.put_nowait(None)
+                break
+            if size + item_size(entry[2]) > batch_bytes:
+                carry = entry
+                break
+            batch.append(entry)
+            size += item_size(entry[2])
+
+        start = time.perf_counter()
+        try:
+            returned = await add_documents_to_collection(collection_id, [item for _, _, item in batch])
+        except Exception as error:
+            names = sorted({item['properties']['name'] for _, _, item in batch})
+            print(f"Error adding documents {names}: {error}")
+            returned = None
+        # The duration of a request counts for every file with documents in the batch.
+        for file_name in {file_name for file_name, _, _ in batch}:
+            uploaded['timings'][file_name]['upload_seconds'] += time.perf_counter() - start
+        if returned is not None:
+            for (file_name, part, item), document in zip(batch, returned):
+                print(f"Document '{item['properties']['name']}' added to collection.")
+                uploaded['document_ids'][file_name][part] = document.get('id')
+            uploaded['documents'] += len(batch)
+            uploaded['bytes'] += size
+
+
+async def run_pipeline(collection_id, files, max_pages, workers, uploaders, batch_bytes, skip_parts):
+    queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    uploaded = {'documents': 0, 'bytes': 0, 'document_ids': {}, 'timings': {}}
+    upload_tasks = [
+        asyncio.create_task(upload_batches(collection_id, queue, batch_bytes, uploaded))
+        for _ in range(uploaders)
+    ]
+    await extract_files(collection_id, files, queue, max_pages, workers, uploaded, skip_parts)
+    for _ in upload_tasks:
+        await queue.put(None)
+    await asyncio.gather(*upload_tasks)
+    return uploaded
+
+
+def run(coroutine):
+    """
+    Runs a coroutine using the shared collections client in a new event loop and
+    closes the client afterwards.
+    Args:
+        coroutine (Coroutine): The coroutine to run.
+    Returns:
+        The result of the coroutine.
+    """
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await close_client()
+
+    return asyncio.run(main())
+
+
+def ingest_folder(collection_id, folder_path, max_pages=None, workers=INGEST_WORKERS,
+                  uploaders=INGEST_UPLOADERS, batch_bytes=INGEST_BATCH_BYTES):
+    """
+    Adds all files of a folder to a collection, see ingest_files.
+    Args:
+        collection_id (str): The ID of the collection.
+        folder_path (str): The path to the folder containing the files.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs. Defaults to None.
+        workers (int, optional): Number of extraction processes.
+        uploaders (int, optional): Number of concurrent upload requests.
+        batch_bytes (int, optional): Maximum size of the documents sent in one request.
+    Returns:
+        dict: Statistics of the ingestion run.
+    """
+    return ingest_files(collection_id, list_files(folder_path), max_pages, workers, uploaders, batch_bytes)
+
+
+def ingest_files(collection_id, files, max_pages=None, workers=INGEST_WORKERS,
+                 uploaders=INGEST_UPLOADERS, batch_bytes=INGEST_BATCH_BYTES, skip_parts=None):
+    """
+    Adds files to a collection. Text is extracted by a pool of processes, while
+    concurrent uploaders send the documents in batches, retrying throttled or
+    failed requests.
+    Args:
+        collection_id (str): The ID of the collection.
+        files (list): Tuples of the path and the document name of every file.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs. Defaults to None.
+        workers (int, optional): Number of extraction processes.
+        uploaders (int, optional): Number of concurrent upload requests.
+        batch_bytes (int, optional): Maximum size of the documents sent in one request.
+        skip_parts (dict, optional): Positions of the parts uploaded before by file name,
+            used to resume files whose upload was interrupted.
+    Returns:
+        dict: Number of 'documents' uploaded, the 'document_ids' of the parts of every file
+            by file name (None for parts which failed or were skipped), the 'timings' of the
+            extraction and upload of every file by file name, size of the source 'files' in
+            bytes and 'seconds' taken.
+    """
+    start = time.perf_counter()
+    uploaded = run(run_pipeline(collection_id, files, max_pages, workers, uploaders, batch_bytes, skip_parts or {}))
+    seconds = time.perf_counter() - start
+
+    for file_name, timings in uploaded['timings'].items():
+        print(
+            f"Timings of '{file_name}': extraction {timings['extraction_seconds']:.2f} s, "
+            f"upload {timings['upload_seconds']:.2f} s"
+        )
+        Trace('ingest').finish(
+            file=file_name, parts=len(uploaded['document_ids'].get(file_name, [])),
+            total_seconds=timings['extraction_seconds'] + timings['upload_seconds'], **timings
+        )
+
+    file_bytes = sum(os.path.getsize(file_path) for file_path, _ in files)
+    megabytes = file_bytes / 1024 / 1024
+    print(
+        f"Ingested {uploaded['documents']} documents from {len(files)} files ({megabytes:.1f} MB) in {seconds:.1f} s: "
+        f"{uploaded['documents'] / seconds:.1f} docs/sec, {megabytes / seconds:.2f} MB/sec"
+    )
+    return {
+        'documents': uploaded['documents'],
+        'document_ids': uploaded['document_ids'],
+        'timings': uploaded['timings'],
+        'files': file_bytes,
+        'seconds': seconds,
+    }
@@ -0,0 +1,430 @@
+import heapq
+import math
+import os
+import re
+import shutil
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from config import (
+    HYBRID_MATCH_OVERLAP, HYBRID_RRF_K, HYBRID_TOKEN_BUDGET, LEXICAL_INDEX_PATH, LEXICAL_INDEX_RUN_POSTINGS,
+)
+from aimodelhub.cache import invalidate_collection
+from aimodelhub.replica import ChunkFile, replace_folder, write_chunks
+from aimodelhub.tokens import count_tokens
+
+# Term frequency saturation of BM25.
+BM25_K1 = 1.2
+# Document length normalization of BM25.
+BM25_B = 0.75
+
+TERM_PATTERN = re.compile(r"\w+")
+# Term frequencies are stored as 16 bit integers.
+MAX_FREQUENCY = 2 ** 16 - 1
+
+# Lexical indexes loaded by this process by collection ID.
+_indexes = {}
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    """
+    Args:
+        text (str): A text.
+    Returns:
+        list: The lower cased words and numbers of the text.
+    """
+    return TERM_PATTERN.findall(text.lower())
+
+
+def index_path(collection_id, path=LEXICAL_INDEX_PATH):
+    """
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the indexes of all collections.
+    Returns:
+        str: The folder holding the lexical index of the collection.
+    """
+    return os.path.join(path, collection_id)
+
+
+def open_array(path, dtype, length):
+    """
+    Opens a file in the format of numpy.save for a one-dimensional array whose
+    items are written one part after the other.
+    Args:
+        path (str): The file.
+        dtype (numpy.dtype): The type of the items.
+        length (int): The number of items.
+    Returns:
+        file: The file, positioned after the header.
+    """
+    file = open(path, "wb")
+    np.lib.format.write_array_header_1_0(file, {
+        'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (length,),
+    })
+    return file
+
+
+def write_postings(folder, postings, prefix=""):
+    """
+    Writes postings as the sorted terms (terms.bin, term_offsets.npy), the position
+    of the first posting of every term (postings.npy) and the chunk rows (rows.npy)
+    and term frequencies (frequencies.npy) of all postings. The postings are written
+    to the files term by term and dropped on the way.
+    Args:
+        folder (str): The folder to write to.
+        postings (dict): Arrays of the rows and of the frequencies by term. It is emptied.
+        prefix (str, optional): Prefix of the file names.
+    """
+    terms = sorted(postings)
+    encoded = [term.encode("utf-8") for term in terms]
+    counts = np.array([len(postings[term][0]) for term in terms], dtype=np.int64)
+    with open(os.path.join(folder, f"{prefix}terms.bin"), "wb") as file:
+        file.write(b"".join(encoded))
+    np.save(
+        os.path.join(folder, f"{prefix}term_offsets.npy"),
+        np.cumsum([0] + [len(term) for term in encoded], dtype=np.int64),
+    )
+    np.save(os.path.join(folder, f"{prefix}postings.npy"), np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+    total = int(counts.sum())
+    with open_array(os.path.join(folder, f"{prefix}rows.npy"), np.uint32, total) as rows, \
+            open_array(os.path.join(folder, f"{prefix}frequencies.npy"), np.uint16, total) as frequencies:
+        for term in terms:
+            term_rows, term_frequencies = postings.pop(term)
+            term_rows.tofile(rows)
+            term_frequencies.tofile(frequencies)
+
+
+def merge_runs(folder, prefixes):
+    """
+    Merges postings written by write_postings under several prefixes, in the order
+    of their rows, into the files without prefix, and deletes them.
+    Args:
+        folder (str): The folder holding the runs.
+        prefixes (list): The prefixes of the runs, in the order they were written.
+    """
+    runs = [
+        {
+            name: np.load(os.path.join(folder, f"{prefix}{name}.npy"), mmap_mode='r')
+            for name in ['term_offsets', 'postings', 'rows', 'frequencies']
+        }
+        for prefix in prefixes
+    ]
+    for prefix, run in zip(prefixes, runs):
+        with open(os.path.join(folder, f"{prefix}terms.bin"), "rb") as file:
+            run['terms'] = file.read()
+
+    def terms(number, run):
+        offsets = run['term_offsets']
+        for position in range(len(offsets) - 1):
+            yield run['terms'][offsets[position]:offsets[position + 1]], number, position
+
+    total = sum(len(run['rows']) for run in runs)
+    term_offsets, postings = array('q', [0]), array('q', [0])
+    start, previous = 0, None
+    with open(os.path.join(folder, "terms.bin"), "wb") as file, \
+            open_array(os.path.join(folder, "rows.npy"), np.uint32, total) as rows, \
+            open_array(os.path.join(folder, "frequencies.npy"), np.uint16, total) as frequencies:
+        # Equal terms of several runs come in the order of the runs, so their rows stay sorted.
+        for term, number, position in heapq.merge(*[terms(number, run) for number, run in enumerate(runs)]):
+            if term != previous:
+                if previous is not None:
+                    postings.append(start)
+                file.write(term)
+                term_offsets.append(term_offsets[-1] + len(term))
+                previous = term
+            run = runs[number]
+            first, end = run['postings'][position], run['postings'][position + 1]
+            run['rows'][first:end].tofile(rows)
+            run['frequencies'][first:end].tofile(frequencies)
+            start += end - first
+    if previous is not None:
+        postings.append(start)
+    np.save(os.path.join(folder, "term_offsets.npy"), np.frombuffer(term_offsets, dtype=np.int64))
+    np.save(os.path.join(folder, "postings.npy"), np.frombuffer(postings, dtype=np.int64))
+    del runs
+    for prefix in prefixes:
+        for name in ['terms.bin', 'term_offsets.npy', 'postings.npy', 'rows.npy', 'frequencies.npy']:
+            os.remove(os.path.join(folder, f"{prefix}{name}"))
+
+
+def write_lexical_index(path, chunks, run_postings=LEXICAL_INDEX_RUN_POSTINGS):
+    """
+    Writes an inverted index of chunks: the sorted terms as one UTF-8 blob
+    (terms.bin) with their byte offsets (term_offsets.npy), the postings of all
+    terms as chunk rows (rows.npy) and term frequencies (frequencies.npy) with the
+    position of the first posting of every term (postings.npy), the number of terms
+    of every chunk (lengths.npy) and the chunks themselves. The chunks are written
+    as they come. Once run_postings postings were collected, they are written to
+    a run of their own, and the runs are merged at the end, so that the memory
+    needed does not grow with the number of chunks. An existing index is replaced
+    once the new one is complete.
+    Args:
+        path (str): The folder to write the index to.
+        chunks (Iterable): Dicts with the 'file_name', 'content' and 'pages' of every chunk.
+        run_postings (int, optional): Number of postings held in memory.
+    Returns:
+        int: The number of chunks in the index.
+    """
+    folder = f"{path}.tmp"
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    # Postings are kept as flat arrays of rows and frequencies per term, which take
+    # far less memory than lists of tuples.
+    postings, collected, runs = {}, 0, []
+    lengths = array('I')
+
+    def index(chunks):
+        nonlocal collected
+        for row, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk['content']))
+            lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                entries = postings.get(term)
+                if entries is None:
+                    entries = postings[term] = (array('I'), array('H'))
+                entries[0].append(row)
+                entries[1].append(min(frequency, MAX_FREQUENCY))
+            collected += len(terms)
+            if collected >= run_postings:
+                runs.append(f"run{len(runs)}-")
+                write_postings(folder, postings, runs[-1])
+                collected = 0
+            yield row, chunk
+
+    write_chunks(folder, index(chunks))
+    if runs:
+        if postings:
+            runs.append(f"run{len(runs)}-")
+            write_postings(folder, postings, runs[-1])
+        merge_runs(folder, runs)
+    else:
+        write_postings(folder, postings)
+    np.save(os.path.join(folder, "lengths.npy"), np.frombuffer(lengths, dtype=np.uint32))
+    replace_folder(folder, path)
+    return len(lengths)
+
+
+class LexicalIndex:
+    """
+    BM25 search over an index written by write_lexical_index. All arrays are
+    memory-mapped, so opening the index is cheap and only the postings of the
+    query terms are read.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The folder the index was written to.
+        """
+        self.path = path
+        self.terms = np.memmap(os.path.join(path, "terms.bin"), dtype=np.uint8, mode='r') \
+            if os.path.getsize(os.path.join(path, "terms.bin")) else np.zeros(0, dtype=np.uint8)
+        self.term_offsets = np.load(os.path.join(path, "term_offsets.npy"), mmap_mode='r')
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode='r')
+        self.rows = np.load(os.path.join(path, "rows.npy"), mmap_mode='r')
+        self.frequencies = np.load(os.path.join(path, "frequencies.npy"), mmap_mode='r')
+        self.lengths = np.load(os.path.join(path, "lengths.npy"), mmap_mode='r')
+        self.average_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+        self.chunks = ChunkFile(path)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def term(self, position):
+        return self.terms[self.term_offsets[position]:self.term_offsets[position + 1]].tobytes()
+
+    def find(self, term):
+        """
+        Args:
+            term (str): A term of a query.
+        Returns:
+            int: The position of the term in the sorted terms or None, if no chunk contains it.
+        """
+        key = term.encode("utf-8")
+        low, high = 0, len(self.term_offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self.term_offsets) - 1 and self.term(low) == key else None
+
+    def search(self, query, num_documents=3):
+        """
+        Finds the chunks matching the terms of a query best, ranked by BM25.
+        Args:
+            query (str): The natural language query.
+            num_documents (int, optional): The number of chunks to return.
+        Returns:
+            list: Dicts with the chunk 'id', the 'file_name', the 'content', the BM25 'score'
+                and the 'pages' of each chunk, best first.
+        """
+        rows, scores = [], []
+        for term in set(tokenize(query)):
+            position = self.find(term)
+            if position is None:
+                continue
+            start, end = self.postings[position], self.postings[position + 1]
+            matches = np.asarray(self.rows[start:end])
+            frequencies = np.asarray(self.frequencies[start:end], dtype=np.float32)
+            idf = math.log(1 + (len(self) - (end - start) + 0.5) / (end - start + 0.5))
+            norms = frequencies + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[matches] / self.average_length)
+            rows.append(matches)
+            scores.append(idf * frequencies * (BM25_K1 + 1) / norms)
+        if not rows:
+            return []
+        matches, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        best = np.argsort(totals)[::-1][:num_documents]
+        return [{**self.chunks[matches[position]], 'score': float(totals[position])} for position in best]
+
+
+def build_lexical_index(collection_id, chunks, path=LEXICAL_INDEX_PATH):
+    """
+    Writes the lexical index of a collection.
+    Args:
+        collection_id (str): The ID of the collection.
+        chunks (Iterable): Dicts with the 'file_name', 'content' and 'pages' of every chunk, see
+            aimodelhub.ingest.iter_chunks.
+        path (str, optional): The folder holding the indexes of all collections.
+    """
+    count = write_lexical_index(index_path(collection_id, path), chunks)
+    invalidate_collection(collection_id)
+    print(f"Built lexical index of collection {collection_id} with {count} chunks.")
+
+
+def delete_lexical_index(collection_id, path=LEXICAL_INDEX_PATH):
+    """
+    Deletes the lexical index of a collection, if there is one.
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the indexes of all collections.
+    """
+    shutil.rmtree(index_path(collection_id, path), ignore_errors=True)
+
+
+def get_lexical_index(collection_id, path=LEXICAL_INDEX_PATH):
+    """
+    Returns the lexical index of a collection, opening it on first use. An index
+    which was rebuilt in the meantime is opened again.
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the indexes of all collections.
+    Returns:
+        LexicalIndex: The index or None, if the collection has no lexical index.
+    """
+    lengths = os.path.join(index_path(collection_id, path), "lengths.npy")
+    if not os.path.isfile(lengths):
+        return None
+    version = os.stat(lengths).st_mtime_ns
+    with _lock:
+        loaded = _indexes.get(collection_id)
+        if loaded is None or loaded[0] != version:
+            loaded = (version, LexicalIndex(index_path(collection_id, path)))
+            _indexes[collection_id] = loaded
+    return loaded[1]
+
+
+def shingles(text, size=3):
+    """
+    Args:
+        text (str): A passage.
+        size (int, optional): Number of consecutive terms per shingle.
+    Returns:
+        set: The tuples of consecutive terms of the passage.
+    """
+    terms = tokenize(text)
+    return {tuple(terms[start:start + size]) for start in range(max(1, len(terms) - size + 1))}
+
+
+def same_passage(a, b, overlap=HYBRID_MATCH_OVERLAP):
+    """
+    Args:
+        a (set): The shingles of a passage.
+        b (set): The shingles of a passage of the same file.
+        overlap (float, optional): Share of the shingles of the shorter passage the other one must contain.
+    Returns:
+        bool: True, if the passages overlap enough to be the same passage.
+    """
+    return len(a & b) >= overlap * min(len(a), len(b))
+
+
+def fuse(rankings, k=HYBRID_RRF_K, overlap=HYBRID_MATCH_OVERLAP):
+    """
+    Merges rankings with reciprocal rank fusion. Passages of the same file which
+    share enough word triples (see same_passage) are the same passage, whichever
+    ranking they come from, and keep the text of the ranking listing them first.
+    Args:
+        rankings (list): Lists of matches, best first.
+        k (int, optional): Constant damping the weight of the first ranks.
+        overlap (float, optional): Minimum overlap of the shingles of the same passage.
+    Returns:
+        list: The matches of all rankings with the fused 'score', best first.
+    """
+    fused = []
+    for ranking in rankings:
+        # A passage of one ranking is matched by at most one passage of another.
+        matched = set()
+        for rank, match in enumerate(ranking):
+            passage = shingles(match['content'])
+            for position, (entry, entry_passage) in enumerate(fused):
+                if position not in matched and entry['file_name'] == match['file_name'] \
+                        and same_passage(entry_passage, passage, overlap):
+                    break
+            else:
+                position = len(fused)
+                fused.append(({**match, 'score': 0.0}, passage))
+            matched.add(position)
+            fused[position][0]['score'] += 1 / (k + rank + 1)
+    return sorted((entry for entry, _ in fused), key=lambda match: match['score'], reverse=True)
+
+
+def within_budget(matches, num_documents, max_tokens=HYBRID_TOKEN_BUDGET):
+    """
+    Args:
+        matches (list): Matches, best first.
+        num_documents (int): Maximum number of matches.
+        max_tokens (int, optional): Maximum number of tokens of all matches. The best match is always kept.
+    Returns:
+        list: The best matches whose passages fit into the budget.
+    """
+    selected, used = [], 0
+    for match in matches[:num_documents]:
+        tokens = count_tokens(match['content'])
+        if selected and used + tokens > max_tokens:
+            break
+        selected.append(match)
+        used += tokens
+    return selected
+
+
+def hybrid_matches(collection_id, query_string, vector_matches, num_documents):
+    """
+    Fuses the vector matches of a collection with the matches of its lexical index.
+    The fused matches take the scores of the vector matches in the order of their
+    ranks, so that they stay comparable with the matches of collections without a
+    lexical index.
+    Args:
+        collection_id (str): The ID of the collection.
+        query_string (str): The natural language query.
+        vector_matches (list): Matches of the vector search, best first, over-fetched.
+        num_documents (int): The number of documents to return.
+    Returns:
+        list: The best fused matches within HYBRID_TOKEN_BUDGET, or the best vector
+            matches if the collection has no lexical index.
+    """
+    index = get_lexical_index(collection_id)
+    if index is None:
+        return vector_matches[:num_documents]
+    lexical_matches = index.search(query_string, max(len(vector_matches), num_documents))
+    fused = fuse([vector_matches, lexical_matches])
+    scores = sorted((match['score'] for match in vector_matches), reverse=True)
+    if scores:
+        fused = [{**match, 'score': scores[min(rank, len(scores) - 1)]} for rank, match in enumerate(fused)]
+    return within_budget(fused, num_documents)
@@ -0,0 +1,189 @@
+import time
+
+import httpx
+
+from config import (
+    HTTP_KEEPALIVE_EXPIRY, HTTP_TIMEOUT, IONOS_API_TOKEN, LLM_BASE_URL, LLM_HTTP2,
+    LLM_MAX_CONCURRENT_STREAMS, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_NAME,
+    LLM_MAX_QUEUED_STREAMS, LLM_RATE_LIMIT, LLM_RATE_WINDOW,
+)
+from aimodelhub.admission import AdmissionController
+
+# Process-wide registry of LLM clients keyed on (model name, base url, token).
+_clients = {}
+
+
+class PooledLLM:
+    """
+    A long-lived streaming LLM client with a bounded HTTP connection pool and
+    admission control: a limit on the number of answers generated concurrently, a
+    fair queue per session for the answers beyond it and a rate limit per session.
+    """
+
+    def __init__(self, model_name, base_url, api_key):
+        """
+        Args:
+            model_name (str): Name of the large language model.
+            base_url (str): Base url of the OpenAI compatible endpoint.
+            api_key (str): Token used to authenticate at the endpoint.
+        """
+        # Imported with the first client, as it takes longer to import than the rest of the chat.
+        from langchain_openai import ChatOpenAI
+
+        self.model_name = model_name
+        self.base_url = base_url
+        self.http_client = httpx.AsyncClient(
+            http2=LLM_HTTP2,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.llm = ChatOpenAI(
+            model_name=model_name,
+            streaming=True,
+            base_url=base_url,
+            openai_api_key=api_key,
+            http_async_client=self.http_client,
+        )
+        self.admission = AdmissionController(
+            LLM_MAX_CONCURRENT_STREAMS, LLM_MAX_QUEUED_STREAMS, LLM_RATE_LIMIT, LLM_RATE_WINDOW,
+        )
+        self.active_streams = 0
+        self.waiting = 0
+        self.requests = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    async def admit(self, session_id=None, on_position=None):
+        """
+        Waits until an answer may be generated. Every admission is ended with release.
+        Args:
+            session_id (Hashable, optional): The session asking, for the fair queue and the rate limit.
+            on_position (callable, optional): Called with the position in the queue while waiting.
+        Raises:
+            Rejected: If the queue is full or the session exceeds its rate limit.
+        """
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self.admission.acquire(session_id, on_position)
+        finally:
+            self.waiting -= 1
+        wait_time = time.perf_counter() - start
+        self.requests += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def release(self):
+        """
+        Ends an admission, so that the next waiting answer is generated.
+        """
+        self.admission.release()
+
+    async def stream(self, prompt):
+        """
+        Streams the answer to a prompt of an admitted request, see admit.
+        Args:
+            prompt (list): Prompt to be used as the input of the LLM.
+        Yields:
+            AIMessageChunk: The chunks of the answer.
+        """
+        self.active_streams += 1
+        try:
+            async for chunk in self.llm.astream(prompt):
+                yield chunk
+        finally:
+            self.active_streams -= 1
+
+    async def astream(self, prompt, session_id=None, on_position=None):
+        """
+        Streams the answer to a prompt once it is admitted.
+        Args:
+            prompt (list): Prompt to be used as the input of the LLM.
+            session_id (Hashable, optional): The session asking, for the fair queue and the rate limit.
+            on_position (callable, optional): Called with the position in the queue while waiting.
+        Yields:
+            AIMessageChunk: The chunks of the answer.
+        Raises:
+            Rejected: If the queue is full or the session exceeds its rate limit.
+        """
+        await self.admit(session_id, on_position)
+        try:
+            async for chunk in self.stream(prompt):
+                yield chunk
+        finally:
+            self.release()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Connection and concurrency statistics of this client. The numbers of
+                connections are read from the internals of httpx and left out, if a
+                version of httpx does not have them.
+        """
+        stats = {
+            'model': self.model_name,
+            'base_url': self.base_url,
+        }
+        connections = getattr(getattr(getattr(self.http_client, '_transport', None), '_pool', None), 'connections', None)
+        try:
+            idle = sum(1 for connection in connections if connection.is_idle())
+        except (TypeError, AttributeError):
+            pass
+        else:
+            stats['active_connections'] = len(connections) - idle
+            stats['idle_connections'] = idle
+        stats.update({
+            'active_streams': self.active_streams,
+            'waiting_streams': self.waiting,
+            'requests': self.requests,
+            'wait_time_total': self.wait_time_total,
+            'wait_time_max': self.wait_time_max,
+            'wait_time_avg': self.wait_time_total / self.requests if self.requests else 0.0,
+        })
+        return stats
+
+
+def get_llm(model_name=LLM_NAME, base_url=LLM_BASE_URL, api_key=IONOS_API_TOKEN):
+    """
+    Returns the shared LLM client for a model and endpoint, creating it on first use.
+    Args:
+        model_name (str, optional): Name of the large language model.
+        base_url (str, optional): Base url of the OpenAI compatible endpoint.
+        api_key (str, optional): Token used to authenticate at the endpoint.
+    Returns:
+        PooledLLM: The shared client.
+    """
+    key = (model_name, base_url, api_key)
+    if key not in _clients:
+        _clients[key] = PooledLLM(model_name, base_url, api_key)
+    return _clients[key]
+
+
+def preload_llm():
+    """
+    Imports the LLM client library ahead of the first answer, e.g. in a background
+    thread once the chat is up, so that starting the chat does not wait for it.
+    """
+    import langchain_openai  # noqa: F401
+
+
+def pool_stats():
+    """
+    Statistics of all LLM clients in the registry, e.g. to size the connection pool.
+    Returns:
+        list: One dict of statistics per client.
+    """
+    return [client.stats() for client in _clients.values()]
+
+
+async def close_llm_clients():
+    """
+    Closes all LLM clients in the registry together with their connections.
+    """
+    for client in _clients.values():
+        await client.http_client.aclose()
+    _clients.clear()
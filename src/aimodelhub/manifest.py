@@ -0,0 +1,229 @@
+import json
+import os
+
+from config import INGEST_BATCH_BYTES, INGEST_UPLOADERS, INGEST_WORKERS, LEXICAL_INDEX, MANIFEST_PATH, REPLICA_PATH
+from aimodelhub.async_vectordb import delete_documents
+from aimodelhub.extraction import file_hash
+from aimodelhub.ingest import ingest_files, iter_chunks, list_files, run
+
+
+# File of the single manifest written before manifests were kept per collection.
+LEGACY_MANIFEST = 'data/manifest.json'
+
+
+def manifest_path(collection_id, path=MANIFEST_PATH):
+    """
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the manifests of all collections.
+    Returns:
+        str: The file holding the manifest of the collection.
+    """
+    return os.path.join(path, f"{collection_id}.json")
+
+
+def load_manifest(collection_id, path=MANIFEST_PATH):
+    """
+    Loads the manifest of the files uploaded to a collection. A manifest in the
+    former single file LEGACY_MANIFEST is used, if it belongs to the collection.
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the manifests of all collections.
+    Returns:
+        dict: The 'collection_id' and the uploaded 'files' by document name, each with
+            'path', 'size', 'mtime', 'sha256' and the 'document_ids' of its parts (None for
+            parts whose upload failed). None, if there is no manifest of the collection.
+    """
+    for filename in [manifest_path(collection_id, path), LEGACY_MANIFEST]:
+        if os.path.isfile(filename):
+            with open(filename) as file:
+                manifest = json.load(file)
+            if manifest.get('collection_id') == collection_id:
+                return manifest
+            if filename != LEGACY_MANIFEST:
+                print(f"Manifest {filename} belongs to collection {manifest.get('collection_id')}, not {collection_id}.")
+                return None
+    return None
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """
+    Persists the manifest of a collection. The file is replaced atomically, so an
+    interrupted run never leaves a truncated manifest behind.
+    Args:
+        manifest (dict): The manifest to persist, including its 'collection_id'.
+        path (str, optional): The folder holding the manifests of all collections.
+    """
+    filename = manifest_path(manifest['collection_id'], path)
+    os.makedirs(path, exist_ok=True)
+    with open(f"{filename}.tmp", "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(f"{filename}.tmp", filename)
+
+
+def delete_manifest(collection_id, path=MANIFEST_PATH):
+    """
+    Deletes the manifest of a collection, also from LEGACY_MANIFEST.
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the manifests of all collections.
+    """
+    filename = manifest_path(collection_id, path)
+    if os.path.isfile(filename):
+        os.remove(filename)
+    if os.path.isfile(LEGACY_MANIFEST):
+        with open(LEGACY_MANIFEST) as file:
+            legacy = json.load(file)
+        if legacy.get('collection_id') == collection_id:
+            os.remove(LEGACY_MANIFEST)
+
+
+def scan_files(files, previous=None):
+    """
+    Collects size, modification time and content hash of files. The hash of a file
+    whose size and modification time match its previous entry is reused, so only
+    new or touched files are read.
+    Args:
+        files (list): Tuples of the path and the document name of every file.
+        previous (dict, optional): Entries of the previous manifest by document name.
+    Returns:
+        dict: The manifest entries (without document IDs) by document name.
+    """
+    previous = previous or {}
+    entries = {}
+    for file_path, file_name in files:
+        stat = os.stat(file_path)
+        entry = {'path': file_path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        known = previous.get(file_name)
+        if known and known['size'] == entry['size'] and known['mtime'] == entry['mtime']:
+            entry['sha256'] = known['sha256']
+        else:
+            entry['sha256'] = file_hash(file_path)
+        entries[file_name] = entry
+    return entries
+
+
+def build_manifest(collection_id, files, document_ids):
+    """
+    Builds the manifest after uploading all files of a folder to a new collection.
+    Args:
+        collection_id (str): The ID of the collection.
+        files (list): Tuples of the path and the document name of every file.
+        document_ids (dict): IDs of the uploaded parts by document name.
+    Returns:
+        dict: The manifest. Files which could not be processed are left out.
+    """
+    entries = scan_files(files)
+    return {
+        'collection_id': collection_id,
+        'files': {
+            name: {**entry, 'document_ids': document_ids[name]}
+            for name, entry in entries.items() if name in document_ids
+        },
+    }
+
+
+def update_collection(collection_id, folder_path, max_pages=None, workers=INGEST_WORKERS,
+                      uploaders=INGEST_UPLOADERS, batch_bytes=INGEST_BATCH_BYTES, path=MANIFEST_PATH):
+    """
+    Synchronizes the collection with a folder using the manifest: only new or
+    changed files are extracted and uploaded, and documents whose source file
+    changed or vanished are deleted afterwards. Files whose parts were only partly
+    uploaded by an earlier run are resumed with the missing parts. The lexical index
+    (LEXICAL_INDEX) and an existing local replica are rebuilt, if anything changed.
+    Args:
+        collection_id (str): The ID of the collection.
+        folder_path (str): The path to the folder containing the files.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs. Defaults to None.
+        workers (int, optional): Number of extraction processes.
+        uploaders (int, optional): Number of concurrent upload requests.
+        batch_bytes (int, optional): Maximum size of the documents sent in one request.
+        path (str, optional): The folder holding the manifests of all collections.
+    Returns:
+        dict: Names of the 'added', 'changed', 'removed', 'incomplete' and 'unchanged' files
+            and whether the 'replica' was rebuilt, or None if there is no manifest for the collection.
+    """
+    manifest = load_manifest(collection_id, path)
+    if manifest is None:
+        print(f"No manifest for collection {collection_id} in {path}. Create the collection first.")
+        return None
+
+    previous = manifest['files']
+    files = list_files(folder_path)
+    current = scan_files(files, previous)
+    added = [name for name in current if name not in previous]
+    changed = [name for name in current if name in previous and current[name]['sha256'] != previous[name]['sha256']]
+    removed = [name for name in previous if name not in current]
+    incomplete = [
+        name for name in current
+        if name in previous and name not in changed and None in previous[name]['document_ids']
+    ]
+    unchanged = [name for name in current if name not in added + changed + incomplete]
+    print(
+        f"Added: {len(added)}, changed: {len(changed)}, removed: {len(removed)}, "
+        f"incomplete: {len(incomplete)}, unchanged: {len(unchanged)}"
+    )
+
+    for name in unchanged + incomplete:
+        previous[name].update(current[name])
+
+    uploads = added + changed + incomplete
+    if uploads:
+        # Parts uploaded before by an interrupted run are not uploaded again.
+        skip_parts = {
+            name: {part for part, document_id in enumerate(previous[name]['document_ids']) if document_id}
+            for name in incomplete
+        }
+        stats = ingest_files(
+            collection_id, [(file_path, name) for file_path, name in files if name in uploads],
+            max_pages, workers, uploaders, batch_bytes, skip_parts
+        )
+        for name, document_ids in stats['document_ids'].items():
+            entry = {**current[name], 'document_ids': document_ids}
+            known = previous.get(name)
+            if name in incomplete and len(known['document_ids']) == len(document_ids):
+                entry['document_ids'] = [new or old for new, old in zip(document_ids, known['document_ids'])]
+            elif known:
+                entry['stale_document_ids'] = known.get('stale_document_ids', []) + [
+                    document_id for document_id in known['document_ids'] if document_id
+                ]
+            previous[name] = entry
+        save_manifest(manifest, path)
+
+    # Stale documents left over by an interrupted run are deleted as well.
+    stale = [(name, document_id) for name, entry in previous.items() for document_id in entry.get('stale_document_ids', [])]
+    stale += [(name, document_id) for name in removed for document_id in previous[name]['document_ids'] if document_id]
+    if stale:
+        deleted = run(delete_documents(collection_id, [document_id for _, document_id in stale]))
+        failed = [(name, document_id) for (name, document_id), success in zip(stale, deleted) if not success]
+        for name in removed:
+            previous[name]['document_ids'] = [document_id for failed_name, document_id in failed if failed_name == name]
+        for name in current:
+            if 'stale_document_ids' in previous.get(name, {}):
+                previous[name]['stale_document_ids'] = [
+                    document_id for failed_name, document_id in failed if failed_name == name
+                ]
+                if not previous[name]['stale_document_ids']:
+                    del previous[name]['stale_document_ids']
+    # Removed files are forgotten once none of their documents is left, including
+    # files none of whose parts was ever uploaded.
+    for name in removed:
+        if not any(previous[name]['document_ids']):
+            del previous[name]
+    save_manifest(manifest, path)
+    if LEXICAL_INDEX and (uploads or removed):
+        # Imported here, as it loads numpy.
+        from aimodelhub.lexical import build_lexical_index
+
+        build_lexical_index(collection_id, iter_chunks(files, max_pages))
+    # A replica left as it is would keep answering with the documents before the update.
+    replica = bool(uploads or removed) and os.path.isdir(os.path.join(REPLICA_PATH, collection_id))
+    if replica:
+        from aimodelhub.vectordb import build_replica
+
+        build_replica(collection_id, folder_path, max_pages)
+
+    return {
+        'added': added, 'changed': changed, 'removed': removed, 'incomplete': incomplete, 'unchanged': unchanged,
+        'replica': replica,
+    }
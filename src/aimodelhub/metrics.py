@@ -0,0 +1,182 @@
+import bisect
+import contextlib
+import json
+import threading
+import time
+
+from config import METRICS_JSON_LOGS
+
+# Upper bounds of the buckets of latency histograms in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Upper bounds of the buckets of token count histograms.
+TOKEN_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+# Upper bounds of the buckets of token rate histograms in tokens per second.
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500)
+
+# All metrics of this process by name, in the order they were defined.
+_metrics = {}
+# Functions returning further samples as (name, type, help, value) tuples when the metrics are rendered.
+_collectors = []
+
+
+class Counter:
+    """
+    A monotonically increasing value in the Prometheus text format.
+    """
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+        self.lock = threading.Lock()
+        _metrics[name] = self
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets in the Prometheus text format.
+    """
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+        _metrics[name] = self
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+                total += count
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {total}')
+            lines.append(f"{self.name}_sum {self.sum}")
+            lines.append(f"{self.name}_count {total}")
+        return lines
+
+
+def register_collector(collector):
+    """
+    Adds a function whose samples are rendered with the metrics, e.g. to export
+    statistics kept elsewhere.
+    Args:
+        collector (Callable): Returns a list of (name, type, help, value) tuples.
+    """
+    _collectors.append(collector)
+
+
+def render_metrics():
+    """
+    Returns:
+        str: All metrics of this process in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _metrics.values():
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, kind, documentation, value in collector():
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
+
+
+def log_event(event, **fields):
+    """
+    Prints an event as a single JSON line, if METRICS_JSON_LOGS is enabled.
+    Args:
+        event (str): The name of the event.
+        **fields: Further fields of the event.
+    """
+    if METRICS_JSON_LOGS:
+        print(json.dumps({'event': event, 'time': time.time(), **fields}, default=str), flush=True)
+
+
+class Trace:
+    """
+    Measurements of a single request. When finished, every measurement named like a
+    histogram '<event>_<name>' is observed and the request is logged as JSON event.
+    """
+
+    def __init__(self, event):
+        """
+        Args:
+            event (str): The name of the request, e.g. 'chat'.
+        """
+        self.event = event
+        self.start = time.perf_counter()
+        self.fields = {}
+
+    def set(self, name, value):
+        self.fields[name] = value
+
+    def add(self, name, value):
+        self.fields[name] = self.fields.get(name, 0) + value
+
+    def elapsed(self):
+        """
+        Returns:
+            float: Seconds since the request started.
+        """
+        return time.perf_counter() - self.start
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """
+        Adds the seconds spent in the context to the measurement of the given name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def finish(self, **fields):
+        """
+        Observes the measurements and logs the request.
+        Args:
+            **fields: Further measurements of the request.
+        """
+        self.fields.update(fields)
+        self.fields.setdefault('total_seconds', self.elapsed())
+        for name, value in self.fields.items():
+            metric = _metrics.get(f"{self.event}_{name}")
+            if isinstance(metric, Histogram) and isinstance(value, (int, float)):
+                metric.observe(value)
+        log_event(self.event, **self.fields)
+
+
+chat_requests = Counter('chat_requests_total', "Chat messages answered.")
+chat_errors = Counter('chat_errors_total', "Chat messages whose answer failed.")
+chat_prefetch_hits = Counter('chat_prefetch_hits_total', "Chat messages answered with documents retrieved while typing.")
+chat_prefetch_misses = Counter('chat_prefetch_misses_total', "Documents retrieved while typing which were discarded.")
+chat_prefetch_errors = Counter('chat_prefetch_errors_total', "Retrievals while typing which failed and were repeated for the message.")
+chat_coalesced_streams = Counter('chat_coalesced_streams_total', "Chat answers shared with a concurrent identical question.")
+retrieval_coalesced = Counter('retrieval_coalesced_total', "Collection queries shared with a concurrent identical query.")
+chat_rejected_overloaded = Counter('chat_rejected_overloaded_total', "Chat messages not answered, because the queue was full.")
+chat_rejected_rate_limited = Counter('chat_rejected_rate_limited_total', "Chat messages not answered, because of the rate limit.")
+chat_cancelled = Counter('chat_cancelled_total', "Chat answers stopped, because the user sent another message or left.")
+chat_saved_tokens = Counter('chat_answer_cache_saved_tokens_total', "Prompt and answer tokens of cached answers.")
+Histogram('chat_retrieval_seconds', "Time to retrieve the relevant documents.")
+Histogram('chat_prompt_build_seconds', "Time to assemble the prompt.")
+Histogram('chat_prompt_tokens', "Tokens of the prompt sent to the LLM.", TOKEN_BUCKETS)
+Histogram('chat_time_to_first_token_seconds', "Time from the message of the user to the first token of the answer.")
+Histogram('chat_tokens_per_second', "Tokens of the answer per second after the first token.", RATE_BUCKETS)
+Histogram('chat_stream_seconds', "Time from the request to the LLM until the answer is complete.")
+Histogram('chat_ui_update_seconds', "Time spent rendering the chat for a message.")
+Histogram('chat_total_seconds', "Time from the message of the user until the answer is complete.")
+Histogram('ingest_extraction_seconds', "Time to extract and chunk the text of a file.")
+Histogram('ingest_upload_seconds', "Time of the upload requests carrying the documents of a file.")
@@ -0,0 +1,153 @@
+import base64
+import json
+
+from config import CHUNK_OVERLAP, CHUNK_SIZE, CLIENT_CHUNKING, EMBEDDING_MODEL, DATA_BACKEND
+
+
+def collection_body(collection_name, collection_description):
+    """
+    Builds the payload to create a collection in IONOS AI Model Hub. Chunking on
+    the server is disabled, if documents are chunked on the client (CLIENT_CHUNKING).
+    Args:
+        collection_name (str): The name of the collection.
+        collection_description (str): A description of the collection.
+    Returns:
+        dict: The request body.
+    """
+    return {
+        "type": "collection",
+        "properties": {
+            "name": collection_name,
+            "description": collection_description,
+            "chunking": {
+                "enabled": not CLIENT_CHUNKING,
+                "strategy": {
+                    "config": {
+                        "chunk_overlap": CHUNK_OVERLAP, 
+                        "chunk_size": CHUNK_SIZE
+                    }
+                }
+            },
+            "embedding": {
+                "model": EMBEDDING_MODEL
+            },
+            "engine": {
+                "db_type": DATA_BACKEND
+            }
+        }
+    }
+
+
+def document_item(file_name, text, labels=None):
+    """
+    Builds a single entry of the 'items' list used to add documents to a collection.
+    Args:
+        file_name (str): The name of the file (used for the document name).
+        text (str): The extracted text content of the file.
+        labels (dict, optional): String labels stored with the document.
+    Returns:
+        dict: The document item.
+    """
+    item = {
+        "type": "document",
+        "properties": {
+            "name": file_name,
+            "contentType": "text/plain",
+            "content": base64.b64encode(text.encode("utf-8")).decode("utf-8")
+        }
+    }
+    if labels:
+        item["properties"]["labels"] = labels
+    return item
+
+
+def part_item(file_name, part, chunk):
+    """
+    Builds the document item of a part of a file chunked on the client. The source
+    file, the position of the part and the pages it covers are stored as labels.
+    Args:
+        file_name (str): The name of the source file.
+        part (int): The position of the part in the file, starting at 0.
+        chunk (dict): The chunk as returned by aimodelhub.chunking.chunk_segments.
+    Returns:
+        dict: The document item.
+    """
+    labels = {"source": file_name, "part": str(part)}
+    if chunk['page_start'] is not None:
+        labels["page_start"] = str(chunk['page_start'])
+        labels["page_end"] = str(chunk['page_end'])
+    return document_item(f"{file_name}#{part:05d}", chunk['text'], labels)
+
+
+def iter_base64(segments):
+    """
+    Base64-encodes text segments as one continuous stream.
+    Args:
+        segments (Iterable): The text segments.
+    Yields:
+        bytes: The next part of the encoded stream. Parts are cut at multiples of
+            three input bytes, so they can be concatenated without padding in between.
+    """
+    rest = b''
+    for segment in segments:
+        data = rest + segment.encode('utf-8')
+        cut = len(data) - len(data) % 3
+        if cut:
+            yield base64.b64encode(data[:cut])
+        rest = data[cut:]
+    if rest:
+        yield base64.b64encode(rest)
+
+
+def iter_document_body(file_name, segments):
+    """
+    Writes the request body adding a single document to a collection as a stream, so
+    that neither the text nor its base64 encoding are ever held in memory as a whole.
+    Args:
+        file_name (str): The name of the file (used for the document name).
+        segments (Iterable): The text segments of the file.
+    Yields:
+        bytes: The next part of the JSON body.
+    """
+    yield (
+        '{"type": "collection", "items": [{"type": "document", "properties": '
+        f'{{"name": {json.dumps(file_name)}, "contentType": "text/plain", "content": "'
+    ).encode('utf-8')
+    yield from iter_base64(segments)
+    yield b'"}}]}'
+
+
+def parse_matches(response_json):
+    """
+    Converts the response of a collection query into a list of documents.
+    Args:
+        response_json (dict): The decoded JSON response of the query endpoint.
+    Returns:
+        list: Dicts with the document 'id', the 'file_name', the decoded 'content', the 'score'
+            and, for parts of paged files chunked on the client, the 'pages' (first, last) of each match.
+    """
+    documents = []
+    for entry in response_json['properties']['matches']:
+        properties = entry['document']['properties']
+        labels = properties.get('labels') or {}
+        documents.append({
+            'id': entry['document'].get('id'),
+            'file_name': labels.get('source', properties['name']),
+            'content': base64.b64decode(properties['content']).decode(),
+            'score': entry.get('score', 0.0),
+            'pages': (int(labels['page_start']), int(labels['page_end'])) if 'page_start' in labels else None,
+        })
+    return documents
+
+
+def citation(document):
+    """
+    Args:
+        document (dict): A document as returned by parse_matches.
+    Returns:
+        str: The file name of the document followed by the pages it covers, if known.
+    """
+    if not document.get('pages'):
+        return document['file_name']
+    first, last = document['pages']
+    return f"{document['file_name']} (p. {first})" if first == last else f"{document['file_name']} (p. {first}-{last})"
@@ -0,0 +1,81 @@
+from config import RETRIEVAL_COLLECTIONS
+from aimodelhub.async_vectordb import retrieve_from_collections
+from aimodelhub.metrics import Trace, chat_prefetch_errors
+from aimodelhub.payloads import citation
+from aimodelhub.prompt import build_prompt
+from aimodelhub.registry import collection_registry
+
+
+async def retrieve_relevant_documents(query):
+    """
+    Searches for the documents relevant to a query in the registered collections
+    (RETRIEVAL_COLLECTIONS).
+    Args:
+        query (str): The natural language query.
+    Returns:
+        list: The best matches of all collections.
+    """
+    collections = collection_registry.collections(RETRIEVAL_COLLECTIONS)
+    return await retrieve_from_collections(collections, query_string=query)
+
+
+async def get_relevant_documents(query, trace=None, prefetched=None):
+    """
+    Searches for all relevant documents in the registered collections
+    (RETRIEVAL_COLLECTIONS) and logs the files they come from.
+    Args:
+        query (str): Query the user entered into the chat window.
+        trace (Trace, optional): Measurements of the request, which get the retrieval time.
+        prefetched (asyncio.Task, optional): Retrieval started for a similar query
+            while the user was typing, see ui.prefetch. Its documents are used instead
+            of searching again, unless it failed.
+    Returns:
+        list: The best matches of all collections.
+    """
+    trace = trace or Trace('chat')
+    with trace.span('retrieval_seconds'):
+        relevant_docs = None
+        if prefetched is not None:
+            try:
+                relevant_docs = await prefetched
+            except Exception as error:
+                # The retrieval while typing is only an optimization, the message is still answered.
+                chat_prefetch_errors.inc()
+                print(f"Error retrieving documents while typing, retrieving them again: {error!r}")
+        trace.set('prefetched', relevant_docs is not None)
+        if relevant_docs is None:
+            relevant_docs = await retrieve_relevant_documents(query)
+    print(f"The most relevant content is in files: {[citation(entry) for entry in relevant_docs]}")
+    return relevant_docs
+
+
+async def get_llm_prompt(query, history, trace=None, prefetched=None, relevant_docs=None):
+    """
+    Takes a query as input, searches for all relevant documents in the registered
+    collections (RETRIEVAL_COLLECTIONS) and combines them with the chat history into
+    a prompt which fits into the context window of the LLM. The token counts of the
+    prompt are logged for every request.
+    Args:
+        query (str): Query the user entered into the chat window.
+        history (list): The messages to answer, the query being the last of them.
+        trace (Trace, optional): Measurements of the request, which get the retrieval
+            and prompt build time and the number of prompt tokens.
+        prefetched (asyncio.Task, optional): Retrieval started while the user was typing,
+            see get_relevant_documents.
+        relevant_docs (list, optional): Documents already retrieved for the query.
+    Returns:
+        list: Prompt to be used as the input of the LLM.
+    """
+    trace = trace or Trace('chat')
+    if relevant_docs is None:
+        relevant_docs = await get_relevant_documents(query, trace, prefetched)
+    with trace.span('prompt_build_seconds'):
+        prompt, tokens = build_prompt(history, [entry['content'] for entry in relevant_docs])
+    trace.set('prompt_tokens', tokens['total'])
+    print(
+        f"Prompt tokens: {tokens['total']} (instructions: {tokens['instructions']}, "
+        f"passages: {tokens['passages']}, summary: {tokens['summary']}, history: {tokens['history']}), "
+        f"dropped passages: {tokens['dropped_passages']}, summarized messages: {tokens['summarized_messages']}"
+    )
+
+    return [{'role': message['role'], 'content': message['content']} for message in prompt]
\ No newline at end of file
@@ -0,0 +1,204 @@
+import functools
+import re
+
+from config import (
+    LLM_CONTEXT_TOKENS, PROMPT_ANSWER_TOKENS, PROMPT_PASSAGES_SHARE, PROMPT_RECENT_MESSAGES, PROMPT_SUMMARY_TOKENS,
+    PROMPT_TOKEN_MARGIN,
+)
+from aimodelhub.tokens import count_tokens
+
+# Tokens the chat template adds around every message (role header and separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+# Passages are not truncated to fewer tokens than this, they are dropped instead.
+MIN_PASSAGE_TOKENS = 32
+
+SPEAKERS = {'user': 'User', 'system': 'Assistant'}
+
+
+@functools.lru_cache(maxsize=4096)
+def content_tokens(content):
+    """
+    Counts the tokens of a text. Results are cached, as the same history messages
+    are counted again for every new message of a chat.
+    Args:
+        content (str): The text.
+    Returns:
+        int: The number of tokens.
+    """
+    return count_tokens(content)
+
+
+def message_tokens(message):
+    """
+    Args:
+        message (dict): A chat message with 'role' and 'content'.
+    Returns:
+        int: The number of tokens the message adds to the prompt.
+    """
+    return content_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate(text, max_tokens):
+    """
+    Shortens a text to at most max_tokens tokens, cutting between words.
+    Args:
+        text (str): The text.
+        max_tokens (int): Maximum number of tokens.
+    Returns:
+        str: The text, followed by ' …' if it was shortened. Empty, if not even one word fits.
+    """
+    if content_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(' '.join(words[:middle]) + ' …') <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return ' '.join(words[:low]) + ' …' if low else ''
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in re.split(r'(?<=[.!?])\s+|\n+', text) if sentence.strip()]
+
+
+def select_passages(passages, max_tokens):
+    """
+    Picks retrieved passages in order of relevance until max_tokens are used.
+    Sentences already contained in a more relevant passage, like the overlap of
+    neighbouring chunks, are left out. The last passage is truncated to fit.
+    Args:
+        passages (list): The texts of the retrieved documents, most relevant first.
+        max_tokens (int): Maximum number of tokens of all selected passages.
+    Returns:
+        tuple: The list of selected texts and the number of passages dropped as
+            duplicates or for lack of budget.
+    """
+    seen, selected, used = set(), [], 0
+    for passage in passages:
+        sentences = []
+        for sentence in split_sentences(passage):
+            key = re.sub(r'\W+', ' ', sentence).strip().lower()
+            if key not in seen:
+                seen.add(key)
+                sentences.append(sentence)
+        if not sentences:
+            continue
+        text = ' '.join(sentences)
+        # Passages are joined with "; ", which is about one token.
+        remaining = max_tokens - used - (1 if selected else 0)
+        if content_tokens(text) > remaining:
+            text = truncate(text, remaining) if remaining >= MIN_PASSAGE_TOKENS else ''
+        if not text:
+            break
+        selected.append(text)
+        used += content_tokens(text) + (1 if len(selected) > 1 else 0)
+    return selected, len(passages) - len(selected)
+
+
+def summarize(messages, max_tokens):
+    """
+    Builds an extractive summary of chat messages from the first sentence of each
+    message. If the budget does not suffice, the oldest messages are left out.
+    Args:
+        messages (list): The chat messages to summarize, oldest first.
+        max_tokens (int): Maximum number of tokens of the summary message.
+    Returns:
+        dict: The summary as system message or None, if no message fits.
+    """
+    header = "Summary of the earlier conversation:"
+    used = content_tokens(header) + MESSAGE_OVERHEAD_TOKENS
+    lines = []
+    for message in reversed(messages):
+        sentences = split_sentences(message['content'])
+        line = f"- {SPEAKERS.get(message['role'], message['role'])}: {sentences[0] if sentences else ''}"
+        line = truncate(line, min(64, max_tokens - used - 1))
+        if not line:
+            break
+        lines.insert(0, line)
+        used += content_tokens(line) + 1
+    if not lines:
+        return None
+    return {'role': 'system', 'content': '\n'.join([header] + lines)}
+
+
+def fit_history(messages, max_tokens, recent=PROMPT_RECENT_MESSAGES, summary_tokens=PROMPT_SUMMARY_TOKENS):
+    """
+    Keeps the most recent chat messages verbatim as long as they fit into max_tokens.
+    Beyond the `recent` newest messages, room for a summary is held back and all
+    messages older than the first one not kept are summarized (or dropped).
+    The newest message, i.e. the current query, is truncated if it does not fit.
+    Args:
+        messages (list): The chat messages without instructions, oldest first.
+        max_tokens (int): Maximum number of tokens of the history in the prompt.
+        recent (int, optional): Number of newest messages not competing with the summary.
+        summary_tokens (int, optional): Maximum number of tokens of the summary. 0 drops older messages.
+    Returns:
+        tuple: The summary message (or None), the messages kept verbatim and the
+            number of messages summarized or dropped.
+    """
+    kept, used = [], 0
+    for position, message in enumerate(reversed(messages)):
+        tokens = message_tokens(message)
+        reserve = summary_tokens if position >= recent and position < len(messages) - 1 else 0
+        if position == 0 and tokens > max_tokens:
+            content = truncate(message['content'], max_tokens - MESSAGE_OVERHEAD_TOKENS)
+            message = {'role': message['role'], 'content': content}
+            tokens = message_tokens(message)
+        elif used + tokens + reserve > max_tokens:
+            break
+        kept.insert(0, message)
+        used += tokens
+
+    older = messages[:len(messages) - len(kept)]
+    summary = None
+    if older and summary_tokens:
+        summary = summarize(older, min(summary_tokens, max_tokens - used))
+    return summary, kept, len(older)
+
+
+def build_prompt(history, passages, context_tokens=LLM_CONTEXT_TOKENS, answer_tokens=PROMPT_ANSWER_TOKENS,
+                 margin=PROMPT_TOKEN_MARGIN):
+    """
+    Assembles the prompt for the LLM within its context window. The instructions
+    are always included, retrieved passages may use a share of the remaining
+    budget (PROMPT_PASSAGES_SHARE) and the chat history gets the rest, keeping the
+    most recent messages verbatim and summarizing older ones. Token counts only
+    approximate the tokenizer of the model, so a share of the window stays unused.
+    Args:
+        history (list): The chat history. Messages with role 'developer' are instructions.
+        passages (list): The texts of the retrieved documents, most relevant first.
+        context_tokens (int, optional): Size of the context window of the model.
+        answer_tokens (int, optional): Tokens of the context window kept free for the answer.
+        margin (float, optional): Share of the context window left unused.
+    Returns:
+        tuple: The prompt as list of messages and a dict with the token counts of the
+            'instructions', 'passages', 'summary' and 'history' in the prompt, the 'total'
+            and the number of 'dropped_passages' and 'summarized_messages'.
+    """
+    instructions = [message for message in history if message['role'] == 'developer']
+    turns = [message for message in history if message['role'] != 'developer' and message['content']]
+
+    instruction_tokens = sum(message_tokens(message) for message in instructions)
+    available = max(0, int(context_tokens * (1 - margin)) - answer_tokens - instruction_tokens)
+
+    texts, dropped = select_passages(passages, int(available * PROMPT_PASSAGES_SHARE) - MESSAGE_OVERHEAD_TOKENS)
+    context = [{'role': 'system', 'content': '; '.join(texts)}] if texts else []
+    passage_tokens = sum(message_tokens(message) for message in context)
+
+    summary, recent, summarized = fit_history(turns, available - passage_tokens)
+    summary_tokens = message_tokens(summary) if summary else 0
+    history_tokens = sum(message_tokens(message) for message in recent)
+
+    prompt = context + instructions + ([summary] if summary else []) + recent
+    return prompt, {
+        'instructions': instruction_tokens,
+        'passages': passage_tokens,
+        'summary': summary_tokens,
+        'history': history_tokens,
+        'total': instruction_tokens + passage_tokens + summary_tokens + history_tokens,
+        'dropped_passages': dropped,
+        'summarized_messages': summarized,
+    }
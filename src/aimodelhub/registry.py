@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+
+from config import COLLECTION_REGISTRY
+
+# Seconds between two checks whether the registry file changed.
+CHECK_INTERVAL = 1.0
+
+
+class CollectionRegistry:
+    """
+    Names and IDs of the collections the chat retrieves from.
+
+    The registry is read from a JSON file once and only read again when the
+    modification time of the file changes, which is checked at most once per
+    CHECK_INTERVAL. Without a registry file, the single collection persisted by
+    aimodelhub.vectordb.persist_id is registered as 'default'. A registry file which
+    cannot be read keeps the collections loaded before.
+    """
+
+    def __init__(self, filename, fallback_filename="data/collection_id.txt"):
+        """
+        Args:
+            filename (str): The JSON file mapping collection names to IDs.
+            fallback_filename (str, optional): The file holding a single collection ID.
+        """
+        self.filename = filename
+        self.fallback_filename = fallback_filename
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.source = None
+        self.checked_at = None
+
+    def load(self):
+        """
+        Reads the registry file again, if it changed since it was last read.
+        """
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < CHECK_INTERVAL:
+            return
+        self.checked_at = now
+
+        for filename in [self.filename, self.fallback_filename]:
+            if os.path.isfile(filename):
+                source = (filename, os.stat(filename).st_mtime_ns)
+                break
+        else:
+            source = None
+        if source == self.source:
+            return
+
+        if source is None:
+            entries = {}
+        elif source[0] == self.filename:
+            try:
+                entries = self.read()
+            except ValueError as error:
+                # A registry being edited by hand must not break the chat. It is read
+                # again once it changes.
+                self.entries, self.source = self.entries or self.read_fallback(), source
+                print(f"Error reading the collection registry {self.filename}, using {len(self.entries)} collections: {error}")
+                return
+        else:
+            entries = self.read_fallback()
+        self.entries, self.source = entries, source
+        print(f"Loaded {len(entries)} collections from {source[0] if source else 'nowhere'}.")
+
+    def read_fallback(self):
+        if not os.path.isfile(self.fallback_filename):
+            return {}
+        with open(self.fallback_filename) as file:
+            return {'default': file.read().strip()}
+
+    def collections(self, names=None):
+        """
+        Args:
+            names (list, optional): Names of the collections. Defaults to None, which selects all.
+        Returns:
+            dict: The IDs of the selected collections by name. Unknown names are left out.
+        """
+        with self.lock:
+            self.load()
+            entries = self.entries
+        if names is None:
+            return dict(entries)
+        return {name: entries[name] for name in names if name in entries}
+
+    def register(self, name, collection_id):
+        """
+        Adds a collection to the registry file or replaces the ID registered for its name.
+        Args:
+            name (str): The name of the collection.
+            collection_id (str): The ID of the collection.
+        """
+        with self.lock:
+            entries = self.read()
+            entries[name] = collection_id
+            self.write(entries)
+
+    def unregister(self, collection_id):
+        """
+        Removes all names of a collection from the registry file.
+        Args:
+            collection_id (str): The ID of the collection.
+        """
+        with self.lock:
+            entries = self.read()
+            self.write({name: entry for name, entry in entries.items() if entry != collection_id})
+
+    def read(self):
+        if not os.path.isfile(self.filename):
+            return {}
+        with open(self.filename) as file:
+            entries = json.load(file)
+        if not isinstance(entries, dict) or not all(isinstance(entry, str) for entry in entries.values()):
+            raise ValueError("The registry has to map collection names to IDs.")
+        return entries
+
+    def write(self, entries):
+        # The file is replaced atomically, so that a running chat never reads a partial registry.
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        with open(f"{self.filename}.tmp", "w") as file:
+            json.dump(entries, file, indent=1, sort_keys=True)
+        os.replace(f"{self.filename}.tmp", self.filename)
+        self.checked_at = None
+
+
+# Registry of the collections of this deployment.
+collection_registry = CollectionRegistry(COLLECTION_REGISTRY)
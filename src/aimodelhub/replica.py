@@ -0,0 +1,230 @@
+import json
+import math
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from config import REPLICA_NPROBE, REPLICA_PATH
+
+# Maximum number of vectors the centroids of the index are trained on.
+KMEANS_SAMPLE = 20000
+# Number of k-means iterations when training the centroids.
+KMEANS_ITERATIONS = 10
+
+# Replicas loaded by this process by collection ID.
+_replicas = {}
+_lock = threading.Lock()
+
+
+def replica_path(collection_id, path=REPLICA_PATH):
+    """
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the replicas of all collections.
+    Returns:
+        str: The folder holding the replica of the collection.
+    """
+    return os.path.join(path, collection_id)
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def assign(vectors, centroids, batch_size=8192):
+    """
+    Returns:
+        np.ndarray: The position of the most similar centroid of every vector.
+    """
+    return np.concatenate([
+        np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), batch_size)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+
+def train_centroids(vectors, lists, seed=0):
+    """
+    Trains the centroids of an inverted file index with spherical k-means on a
+    sample of the vectors.
+    Args:
+        vectors (np.ndarray): Normalized vectors, one per row.
+        lists (int): Number of centroids.
+        seed (int, optional): Seed of the random sample and initial centroids.
+    Returns:
+        np.ndarray: Normalized centroids, one per row.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), KMEANS_SAMPLE), replace=False)]
+    centroids = sample[rng.choice(len(sample), lists, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = np.bincount(labels, minlength=lists) == 0
+        # Empty lists are restarted at random vectors of the sample.
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def write_replica(path, chunks, embeddings, lists=None):
+    """
+    Writes a replica: the embeddings ordered by the list of the index they belong
+    to (embeddings.npy), the centroids of the lists (centroids.npy), the first row
+    of every list (lists.npy) and the chunks in the same order as JSON lines
+    (chunks.jsonl) with their byte offsets (offsets.npy). An existing replica is
+    replaced once the new one is complete, so processes using it are not disturbed.
+    Args:
+        path (str): The folder to write the replica to.
+        chunks (list): Dicts with the 'file_name', 'content' and 'pages' of every chunk.
+        embeddings (np.ndarray): The embedding of every chunk, one per row.
+        lists (int, optional): Number of lists of the index. Defaults to the square root
+            of the number of chunks.
+    """
+    embeddings = normalize(np.asarray(embeddings, dtype=np.float32))
+    lists = max(1, min(len(chunks), lists or round(math.sqrt(len(chunks)))))
+    centroids = train_centroids(embeddings, lists) if lists > 1 else normalize(embeddings.mean(axis=0, keepdims=True))
+    labels = assign(embeddings, centroids)
+    order = np.argsort(labels, kind='stable')
+
+    folder = f"{path}.tmp"
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    np.save(os.path.join(folder, "embeddings.npy"), embeddings[order])
+    np.save(os.path.join(folder, "centroids.npy"), centroids)
+    np.save(os.path.join(folder, "lists.npy"), np.searchsorted(labels[order], np.arange(lists + 1)))
+    write_chunks(folder, ((position, chunks[position]) for position in order))
+    replace_folder(folder, path)
+
+
+def write_chunks(folder, chunks):
+    """
+    Writes chunks as JSON lines (chunks.jsonl) with their byte offsets (offsets.npy).
+    Args:
+        folder (str): The folder to write to.
+        chunks (Iterable): Tuples of the position of every chunk, which becomes its 'id', and a dict
+            with its 'file_name', 'content' and 'pages', in the order they are written.
+    """
+    offsets = [0]
+    with open(os.path.join(folder, "chunks.jsonl"), "wb") as file:
+        for position, chunk in chunks:
+            line = json.dumps({
+                'id': str(position), 'file_name': chunk['file_name'],
+                'content': chunk['content'], 'pages': chunk.get('pages'),
+            }).encode("utf-8") + b"\n"
+            file.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(folder, "offsets.npy"), np.array(offsets, dtype=np.int64))
+
+
+def replace_folder(folder, path):
+    """
+    Moves a completely written folder to its path, replacing the folder there.
+    """
+    if os.path.isdir(path):
+        os.rename(path, f"{path}.old")
+    os.rename(folder, path)
+    shutil.rmtree(f"{path}.old", ignore_errors=True)
+
+
+class ChunkFile:
+    """
+    Chunks written by write_chunks, memory-mapped and decoded on access.
+    """
+
+    def __init__(self, folder):
+        self.offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode='r')
+        self.chunks = np.memmap(os.path.join(folder, "chunks.jsonl"), dtype=np.uint8, mode='r') \
+            if os.path.getsize(os.path.join(folder, "chunks.jsonl")) else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        chunk = json.loads(self.chunks[self.offsets[row]:self.offsets[row + 1]].tobytes())
+        return {**chunk, 'pages': tuple(chunk['pages']) if chunk['pages'] else None}
+
+
+class Replica:
+    """
+    Read-only local copy of a collection, answering queries with an inverted file
+    index over memory-mapped embeddings. Only the centroids are held in memory;
+    embeddings and chunk texts are paged in by the operating system on access.
+    """
+
+    def __init__(self, path, nprobe=REPLICA_NPROBE):
+        """
+        Args:
+            path (str): The folder the replica was written to, see write_replica.
+            nprobe (int, optional): Number of lists searched per query.
+        """
+        self.path = path
+        self.nprobe = nprobe
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.lists = np.load(os.path.join(path, "lists.npy"))
+        self.chunks = ChunkFile(path)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, embedding, num_documents=3):
+        """
+        Finds the chunks most similar to a query embedding.
+        Args:
+            embedding (list): The embedding of the query.
+            num_documents (int, optional): The number of chunks to return.
+        Returns:
+            list: Dicts with the chunk 'id', the 'file_name', the 'content', the cosine
+                similarity as 'score' and the 'pages' of each chunk, most similar first.
+        """
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        probes = np.argsort(self.centroids @ query)[::-1][:self.nprobe]
+        rows, scores = [], []
+        for probe in probes:
+            start, end = self.lists[probe], self.lists[probe + 1]
+            if start < end:
+                rows.append(np.arange(start, end))
+                scores.append(self.embeddings[start:end] @ query)
+        if not rows:
+            return []
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        best = np.argsort(scores)[::-1][:num_documents]
+
+        return [{**self.chunks[rows[position]], 'score': float(scores[position])} for position in best]
+
+
+def delete_replica(collection_id, path=REPLICA_PATH):
+    """
+    Deletes the replica of a collection, if there is one.
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the replicas of all collections.
+    """
+    shutil.rmtree(replica_path(collection_id, path), ignore_errors=True)
+
+
+def get_replica(collection_id, path=REPLICA_PATH):
+    """
+    Returns the replica of a collection, loading it on first use. A replica which
+    was rebuilt in the meantime is loaded again.
+    Args:
+        collection_id (str): The ID of the collection.
+        path (str, optional): The folder holding the replicas of all collections.
+    Returns:
+        Replica: The replica or None, if the collection has no replica.
+    """
+    folder = replica_path(collection_id, path)
+    offsets = os.path.join(folder, "offsets.npy")
+    if not os.path.isfile(offsets):
+        return None
+    version = os.stat(offsets).st_mtime_ns
+    with _lock:
+        loaded = _replicas.get(collection_id)
+        if loaded is None or loaded[0] != version:
+            loaded = (version, Replica(folder))
+            _replicas[collection_id] = loaded
+    return loaded[1]
@@ -0,0 +1,143 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: while a call is in flight, further
+    calls with its key wait for its result instead of running again.
+    """
+
+    def __init__(self, counter=None):
+        """
+        Args:
+            counter (Counter, optional): Metric counting the calls which were coalesced.
+        """
+        self.calls = {}
+        self.counter = counter
+
+    async def run(self, key, function, *args):
+        """
+        Args:
+            key (Hashable): Identifies calls with the same result.
+            function (Callable): Coroutine function to call, if no call with the key is in flight.
+            *args: Arguments of the function.
+        Returns:
+            The result of the call in flight.
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*args))
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self.forget(key, done))
+        elif self.counter is not None:
+            self.counter.inc()
+        # A caller giving up, e.g. on a timeout, does not cancel the call for the others.
+        return await asyncio.shield(task)
+
+    def forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()
+
+
+class SharedStream:
+    """
+    A stream consumed once in a task of its own, whose chunks are passed on to any
+    number of subscribers. Subscribers joining late get the chunks received so far
+    first. Once the last subscriber left, the stream is cancelled.
+    """
+
+    def __init__(self, stream):
+        """
+        Args:
+            stream (AsyncIterator): The source stream.
+        """
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self.consume(stream))
+
+    async def consume(self, stream):
+        try:
+            async for chunk in stream:
+                self.chunks.append(chunk)
+                self.notify()
+        except Exception as error:
+            self.error = error
+        finally:
+            self.done = True
+            self.notify()
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def subscribe(self):
+        """
+        Yields:
+            The chunks of the source stream.
+        """
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(self.chunks):
+                    position += 1
+                    yield self.chunks[position - 1]
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self.changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                self.task.cancel()
+
+
+class StreamFanout:
+    """
+    Coalesces concurrent streams with the same key: while a stream is running,
+    further requests for its key subscribe to it instead of opening a new one.
+    """
+
+    def __init__(self, counter=None):
+        """
+        Args:
+            counter (Counter, optional): Metric counting the streams which were coalesced.
+        """
+        self.streams = {}
+        self.counter = counter
+
+    def running(self, key):
+        """
+        Args:
+            key (Hashable): Identifies streams with the same chunks.
+        Returns:
+            bool: Whether a stream with the key is running, which stream(key) would subscribe to.
+        """
+        return key in self.streams
+
+    def stream(self, key, open_stream, on_close=None):
+        """
+        Args:
+            key (Hashable): Identifies streams with the same chunks.
+            open_stream (Callable): Returns the source stream, if no stream with the key is running.
+            on_close (Callable, optional): Called once a stream opened by this call ended or was
+                cancelled, even if it was cancelled before it started.
+        Returns:
+            AsyncIterator: The chunks of the running stream.
+        """
+        shared = self.streams.get(key)
+        if shared is None:
+            shared = SharedStream(open_stream())
+            self.streams[key] = shared
+            shared.task.add_done_callback(lambda _: self.streams.pop(key) if self.streams.get(key) is shared else None)
+            if on_close is not None:
+                shared.task.add_done_callback(lambda _: on_close())
+        elif self.counter is not None:
+            self.counter.inc()
+        return shared.subscribe()
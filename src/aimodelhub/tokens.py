@@ -0,0 +1,45 @@
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from config import TOKENIZER_ENCODING
+
+# Approximates a BPE tokenizer by splitting words into pieces of at most four
+# characters, used when tiktoken or its encoding files are not available.
+APPROXIMATE_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+_encoding = None
+
+
+def get_encoding():
+    """
+    Returns the tiktoken encoding used to count tokens, loading it on first use.
+    Returns:
+        tiktoken.Encoding: The encoding or None, if tiktoken or the encoding is not available.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    """
+    Counts the tokens of a text with TOKENIZER_ENCODING. This approximates the
+    tokenizer of LLM_NAME, which may split a text into more tokens, so budgets keep
+    a margin, see aimodelhub.prompt.build_prompt.
+    Args:
+        text (str): The text.
+    Returns:
+        int: The number of tokens, approximated more roughly if no tokenizer is available.
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(APPROXIMATE_TOKEN_PATTERN.findall(text))
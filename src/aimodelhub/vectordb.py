@@ -1,9 +1,12 @@
+import hashlib
 import requests
 import os
-import base64
 
-from config import HEADERS, CHUNK_OVERLAP, CHUNK_SIZE, EMBEDDING_MODEL, DATA_BACKEND
-from aimodelhub.documents import extract_text
+from config import COLLECTION_API_URL, HEADERS, INGEST_BATCH_BYTES, INGEST_WORKERS, LEXICAL_INDEX
+from aimodelhub import async_vectordb
+from aimodelhub.cache import invalidate_collection
+from aimodelhub.ingest import chunk_files, ingest_folder, iter_chunks, list_files, run
+from aimodelhub.payloads import collection_body
 
 
 def create_collection(collection_name, collection_description):
@@ -15,30 +18,8 @@ def create_collection(collection_name, collection_description):
     Returns:
         str: The ID of the created collection.
     """
-    endpoint = "https://inference.de-txl.ionos.com/collections"
-    # Define the payload for creating a collection
-    body = {
-        "type": "collection",
-        "properties": {
-            "name": collection_name,
-            "description": collection_description,
-            "chunking": {
-                "enabled": True,
-                "strategy": {
-                    "config": {
-                        "chunk_overlap": CHUNK_OVERLAP, 
-                        "chunk_size": CHUNK_SIZE
-                    }
-                }
-            },
-            "embedding": {
-                "model": EMBEDDING_MODEL
-            },
-            "engine": {
-                "db_type": DATA_BACKEND
-            }
-        }
-    }
+    endpoint = f"{COLLECTION_API_URL}/collections"
+    body = collection_body(collection_name, collection_description)
 
     # Send the request to create the collection
     response = requests.post(endpoint, headers=HEADERS, json=body)
@@ -50,63 +31,40 @@ def create_collection(collection_name, collection_description):
 
     # Get the collection ID from the response
     collection_id = response.json()["id"]
+    invalidate_collection(collection_id)
     print("Collection ID:", collection_id)
     return collection_id
 
 
-def add_files_to_collection(collection_id, folder_path, max_pages=None):
+def add_files_to_collection(collection_id, folder_path, max_pages=None, workers=INGEST_WORKERS,
+                            batch_bytes=INGEST_BATCH_BYTES):
     """
-    Adds files from a folder to the specified collection.
+    Adds files from a folder to the specified collection. Text is extracted in
+    parallel and documents are uploaded in batches, see aimodelhub.ingest. With
+    LEXICAL_INDEX, a local BM25 index of the files is built for hybrid retrieval.
     Args:
         collection_id (str): The ID of the collection.
         folder_path (str): The path to the folder containing the files.
         max_pages (int, optional): The maximum number of pages to extract from PDFs. Defaults to None.
+        workers (int, optional): Number of processes extracting text.
+        batch_bytes (int, optional): Maximum size of the documents sent in one request.
+    Returns:
+        dict: Statistics of the ingestion run.
     """
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        if os.path.isfile(file_path):
-            print(f"Processing: {filename}")
-            text = extract_text(file_path, max_pages)
-            if text:
-                add_document_to_collection(collection_id, filename, text)
-
+    stats = ingest_folder(collection_id, folder_path, max_pages, workers=workers, batch_bytes=batch_bytes)
+    if LEXICAL_INDEX:
+        # Imported here, as it loads numpy.
+        from aimodelhub.lexical import build_lexical_index
 
-def add_document_to_collection(collection_id, file_name, text):
-    """
-    Adds a single document to the collection.
-    Args:
-        collection_id (str): The ID of the collection.
-        file_name (str): The name of the file (used for the document name).
-        text (str): The extracted text content of the file.
-    """
-    endpoint = f"https://inference.de-txl.ionos.com/collections/{collection_id}/documents"
-    # Define the payload
-    body = {
-        "type": "collection",
-        "items": [
-            {
-                "type": "document",
-                "properties": {
-                    "name": file_name,
-                    "contentType": "text/plain",
-                    "content": base64.b64encode(text.encode("utf-8")).decode("utf-8")
-                }
-            }
-        ]
-    }
-    # Send the request to add the document
-    response = requests.put(endpoint, headers=HEADERS, json=body)
-
-    if response.status_code == 200:
-        print(f"Document '{file_name}' added to collection.")
-    else:
-        print(f"Error adding document '{file_name}': {response.status_code} - {response.text}")
+        build_lexical_index(collection_id, iter_chunks(list_files(folder_path), max_pages))
+    return stats
 
 
 def retrieve_documents(collection_id, query_string, num_documents=3):
     """
     Retrieves documents from the specified collection which are semantically most similar to the
-    query string.
+    query string, see aimodelhub.async_vectordb.retrieve_documents. For scripts only, as it runs
+    its own event loop.
     Args: 
         collection_id (str): The ID of the collection to query.
         query_string (str): The natural language query.
@@ -114,16 +72,52 @@ def retrieve_documents(collection_id, query_string, num_documents=3):
     Returns:
         list: The results from the document collection.
     """
-    endpoint = f"https://inference.de-txl.ionos.com/collections/{collection_id}/query"
-    body = {"query": query_string, "limit": num_documents }
-    relevant_documents = requests.post(endpoint, json=body, headers=HEADERS)
+    return run(async_vectordb.retrieve_documents(collection_id, query_string, num_documents))
+
+
+def build_replica(collection_id, folder_path, max_pages=None):
+    """
+    Builds the local replica of a collection from the files it was filled with. The
+    files are split into chunks like with CLIENT_CHUNKING, the chunks are embedded
+    with the embedding model of the collection and written to REPLICA_PATH. Chunks
+    of an existing replica whose content is unchanged keep their embedding.
+    Args:
+        collection_id (str): The ID of the collection.
+        folder_path (str): The path to the folder containing the files.
+        max_pages (int, optional): The maximum number of pages to extract from PDFs. Defaults to None.
+    Returns:
+        int: The number of chunks in the replica.
+    """
+    # Imported here, as they load numpy.
+    import numpy as np
+    from aimodelhub.replica import get_replica, replica_path, write_replica
+
+    chunks = chunk_files(list_files(folder_path), max_pages)
+    if not chunks:
+        print(f"No text found in {folder_path}, no replica built.")
+        return 0
+
+    previous = get_replica(collection_id)
+    known = {}
+    if previous is not None:
+        known = {content_digest(previous.chunks[row]['content']): row for row in range(len(previous))}
+    digests = [content_digest(chunk['content']) for chunk in chunks]
+    missing = [chunk['content'] for chunk, digest in zip(chunks, digests) if digest not in known]
+    embedded = iter(run(async_vectordb.embed_texts(missing)) if missing else [])
+    embeddings = np.array([
+        previous.embeddings[known[digest]] if digest in known else next(embedded) for digest in digests
+    ], dtype=np.float32)
+    write_replica(replica_path(collection_id), chunks, embeddings)
+    invalidate_collection(collection_id)
+    print(
+        f"Built local replica of collection {collection_id} with {len(chunks)} chunks, "
+        f"{len(missing)} of them embedded."
+    )
+    return len(chunks)
+
 
-    return [
-        {
-            'file_name': entry['document']['properties']['name'],
-            'content': base64.b64decode(entry['document']['properties']['content']).decode()
-        } for entry in relevant_documents.json()['properties']['matches']
-    ]
+def content_digest(content):
+    return hashlib.sha256(content.encode('utf-8')).digest()
 
 
 def delete_collection(collection_id):
@@ -133,9 +127,10 @@ def delete_collection(collection_id):
         collection_id (str): The ID of the collection to delete.
     """
     response = requests.delete(
-        f"https://inference.de-txl.ionos.com/collections/{collection_id}", 
+        f"{COLLECTION_API_URL}/collections/{collection_id}", 
         headers=HEADERS
     )
+    invalidate_collection(collection_id)
 
     if response.status_code == 204:
         print(f"Deleted collection: {collection_id}")
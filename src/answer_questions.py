@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from aimodelhub.async_vectordb import close_client
+from aimodelhub.llm import close_llm_clients, get_llm
+from aimodelhub.metrics import Trace
+from aimodelhub.payloads import citation
+from aimodelhub.pipeline import get_llm_prompt, get_relevant_documents
+from aimodelhub.tokens import count_tokens
+from config import BATCH_CONCURRENCY, CHAT_INSTRUCTIONS
+
+# Measurements of every question written to the answers, in seconds.
+STAGES = ['retrieval_seconds', 'prompt_build_seconds', 'time_to_first_token_seconds', 'generation_seconds', 'total_seconds']
+
+
+def load_questions(filename):
+    """
+    Reads the questions to answer.
+    Args:
+        filename (str): JSONL file with one object per line with the 'question' and
+            optionally its 'id'. The line number is the ID of questions without one.
+    Returns:
+        list: Tuples of the ID and the text of every question.
+    """
+    questions = []
+    with open(filename) as file:
+        for number, line in enumerate(file, start=1):
+            if line.strip():
+                entry = json.loads(line)
+                questions.append((str(entry.get('id', number)), entry['question']))
+    return questions
+
+
+def load_answered(filename):
+    """
+    Reads the IDs of the questions answered by an earlier run, which are skipped
+    when the run is resumed. A last line cut off by an interruption is removed.
+    Args:
+        filename (str): JSONL file the answers are written to.
+    Returns:
+        set: The IDs of the answered questions.
+    """
+    if not os.path.isfile(filename):
+        return set()
+    with open(filename, "rb+") as file:
+        content = file.read()
+        end = content.rfind(b"\n") + 1
+        if end < len(content):
+            file.truncate(end)
+    return {json.loads(line)['id'] for line in content[:end].decode("utf-8").splitlines() if line.strip()}
+
+
+async def answer_question(question):
+    """
+    Answers a question like the chat answers the first message of a user: the
+    relevant documents are retrieved from the registered collections and combined
+    with CHAT_INSTRUCTIONS into the prompt of the LLM.
+    Args:
+        question (str): The question.
+    Returns:
+        dict: The 'answer', the 'files' it is based on, the 'prompt_tokens' and 'answer_tokens'
+            and the 'latencies' of every stage in seconds.
+    """
+    trace = Trace('batch')
+    relevant_docs = await get_relevant_documents(question, trace)
+    history = [{'role': 'developer', 'content': CHAT_INSTRUCTIONS}, {'role': 'user', 'content': question}]
+    prompt = await get_llm_prompt(question, history, trace, relevant_docs=relevant_docs)
+    chunks = []
+    with trace.span('generation_seconds'):
+        async for chunk in get_llm().astream(prompt):
+            if 'time_to_first_token_seconds' not in trace.fields:
+                trace.set('time_to_first_token_seconds', trace.elapsed())
+            chunks.append(chunk.content)
+    answer = ''.join(chunks)
+    trace.finish(answer_tokens=count_tokens(answer))
+    return {
+        'answer': answer,
+        'files': [citation(entry) for entry in relevant_docs],
+        'prompt_tokens': trace.fields['prompt_tokens'],
+        'answer_tokens': trace.fields['answer_tokens'],
+        'latencies': {name: trace.fields[name] for name in STAGES if name in trace.fields},
+    }
+
+
+async def answer_questions(questions, output, concurrency=BATCH_CONCURRENCY):
+    """
+    Answers questions concurrently and appends every answer to the output as soon
+    as it is complete, so that an interrupted run can be resumed. Questions whose
+    answer failed are not written and are answered again by the next run.
+    Args:
+        questions (list): Tuples of the ID and the text of every question.
+        output (str): JSONL file the answers are appended to.
+        concurrency (int, optional): Number of questions answered at the same time.
+    Returns:
+        dict: The number of questions 'answered' and 'failed'.
+    """
+    queue = asyncio.Queue()
+    for entry in questions:
+        queue.put_nowait(entry)
+    stats = {'answered': 0, 'failed': 0}
+
+    async def worker(file):
+        while not queue.empty():
+            question_id, question = queue.get_nowait()
+            try:
+                result = await answer_question(question)
+            except Exception as error:
+                print(f"Error answering question {question_id}: {error}")
+                stats['failed'] += 1
+                continue
+            file.write(json.dumps({'id': question_id, 'question': question, **result}, ensure_ascii=False) + "\n")
+            file.flush()
+            stats['answered'] += 1
+
+    try:
+        with open(output, "a") as file:
+            await asyncio.gather(*[worker(file) for _ in range(concurrency)])
+    finally:
+        await close_client()
+        await close_llm_clients()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answers questions from a JSONL file with the documents of the registered collections.")
+    parser.add_argument('--input_path', type=str, default='questions.jsonl', help="JSONL file with a 'question' and optionally an 'id' per line.")
+    parser.add_argument('--output_path', type=str, default='answers.jsonl', help="JSONL file the answers are written to. An interrupted run is resumed from it.")
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY, help="Number of questions answered at the same time.")
+
+    args = parser.parse_args()
+
+    questions = load_questions(args.input_path)
+    answered = load_answered(args.output_path)
+    pending = [(question_id, question) for question_id, question in questions if question_id not in answered]
+    print(f"Answering {len(pending)} of {len(questions)} questions, {len(questions) - len(pending)} were answered before.")
+
+    start = time.perf_counter()
+    stats = asyncio.run(answer_questions(pending, args.output_path, args.concurrency))
+    seconds = time.perf_counter() - start
+    print(
+        f"Answered {stats['answered']} questions in {seconds:.1f} s ({stats['answered'] / seconds:.1f} questions/s), "
+        f"{stats['failed']} failed and are answered again by the next run."
+    )
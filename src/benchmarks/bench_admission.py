@@ -0,0 +1,116 @@
+"""
+Measures answer latency under a load spike with and without admission control.
+
+The LLM endpoint is simulated: it generates a fixed number of tokens per second
+which are shared by all running answers, so every answer slows down when more
+of them run at once, like a throttled inference endpoint. Requests arrive at a
+constant rate above its capacity for a while. Without admission control all of
+them run at once; with it, at most --max_concurrent run, at most --max_queue wait
+and the rest are rejected right away.
+
+A second scenario measures fairness: one session sends a burst of requests
+while other sessions send one request each. The wait of the other sessions is
+compared between a single FIFO queue and the round robin queues per session.
+
+Run from the src folder:
+    python -m benchmarks.bench_admission
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.stubs import percentile
+from aimodelhub.admission import AdmissionController, Rejected
+
+
+class SimulatedEndpoint:
+    def __init__(self, tokens_per_second):
+        self.tokens_per_second = tokens_per_second
+        self.running = 0
+
+    async def generate(self, tokens, step=0.01):
+        self.running += 1
+        try:
+            while tokens > 0:
+                await asyncio.sleep(step)
+                tokens -= self.tokens_per_second * step / self.running
+        finally:
+            self.running -= 1
+
+
+async def spike(controller, rate, seconds, tokens, capacity):
+    endpoint = SimulatedEndpoint(capacity)
+    latencies, rejected = [], 0
+
+    async def request(number):
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            await controller.acquire(number)
+        except Rejected:
+            rejected += 1
+            return
+        try:
+            await endpoint.generate(tokens)
+        finally:
+            controller.release()
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    for number in range(int(rate * seconds)):
+        tasks.append(asyncio.create_task(request(number)))
+        await asyncio.sleep(1 / rate)
+    await asyncio.gather(*tasks)
+    return latencies, rejected
+
+
+async def fairness(fair, burst, others, seconds_per_answer):
+    controller = AdmissionController(1)
+    waits = {'burst': [], 'others': []}
+
+    async def request(session_id, group):
+        start = time.perf_counter()
+        # A FIFO queue is the same as the fair queue with one session for all.
+        await controller.acquire(session_id if fair else 'all')
+        waits[group].append(time.perf_counter() - start)
+        try:
+            await asyncio.sleep(seconds_per_answer)
+        finally:
+            controller.release()
+
+    tasks = [asyncio.create_task(request('heavy', 'burst')) for _ in range(burst)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(request(f"user {number}", 'others')) for number in range(others)]
+    await asyncio.gather(*tasks)
+    return waits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark admission control of answer generation.")
+    parser.add_argument('--rate', type=float, default=20, help="Requests per second during the spike.")
+    parser.add_argument('--seconds', type=float, default=10, help="Duration of the spike.")
+    parser.add_argument('--tokens', type=int, default=200, help="Tokens of every answer.")
+    parser.add_argument('--capacity', type=float, default=2000, help="Tokens per second of the endpoint.")
+    parser.add_argument('--max_concurrent', type=int, default=10, help="Answers generated at once.")
+    parser.add_argument('--max_queue', type=int, default=20, help="Answers waiting for a slot.")
+    args = parser.parse_args()
+
+    print(f"Spike of {args.rate:.0f} requests/s for {args.seconds:.0f} s, endpoint capacity "
+          f"{args.capacity / args.tokens:.0f} answers/s")
+    for name, controller in [
+        ("no admission control", AdmissionController(10 ** 9)),
+        ("admission control", AdmissionController(args.max_concurrent, args.max_queue)),
+    ]:
+        latencies, rejected = asyncio.run(spike(controller, args.rate, args.seconds, args.tokens, args.capacity))
+        print(
+            f"{name:>21}: answered {len(latencies):4d}  rejected {rejected:4d}  "
+            f"p50={percentile(latencies, 50):6.2f} s  p99={percentile(latencies, 99):6.2f} s"
+        )
+
+    print("Burst of 20 requests of one session and 1 request of 10 other sessions, one slot")
+    for name, fair in [("FIFO queue", False), ("fair queue", True)]:
+        waits = asyncio.run(fairness(fair, 20, 10, 0.05))
+        print(
+            f"{name:>21}: wait of the other sessions p50={percentile(waits['others'], 50):5.2f} s  "
+            f"max={max(waits['others']):5.2f} s, of the burst max={max(waits['burst']):5.2f} s"
+        )
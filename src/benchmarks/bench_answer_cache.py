@@ -0,0 +1,94 @@
+"""
+Compares answering FAQ traffic with and without the answer cache.
+
+Every simulated user opens a new chat and asks a single question. A share of the
+questions is drawn from a small set of frequently asked questions, the rest is
+unique. The time until the answer is complete is measured per message, and the
+hit rate and the tokens saved are taken from the answer cache and the metrics.
+
+Run from the src folder:
+    python -m benchmarks.bench_answer_cache --users 40 --faq_share 0.7
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from benchmarks.stubs import collections_app, free_port, openai_app, percentile, serve
+
+COLLECTION_PORT, OPENAI_PORT = free_port(), free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{COLLECTION_PORT}"
+os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{OPENAI_PORT}"
+
+from nicegui import core, ui  # noqa: E402
+from nicegui.client import Client  # noqa: E402
+from nicegui.page import page  # noqa: E402
+
+from aimodelhub.async_vectordb import close_client  # noqa: E402
+from aimodelhub.cache import answer_cache  # noqa: E402
+from aimodelhub.llm import close_llm_clients  # noqa: E402
+from aimodelhub.metrics import chat_saved_tokens  # noqa: E402
+from aimodelhub.registry import collection_registry  # noqa: E402
+from ui import components  # noqa: E402
+
+FAQ = [
+    "What are the opening hours of the support?",
+    "How do I reset my password?",
+    "Which payment methods are accepted?",
+    "Where are the data centers located?",
+    "How can I cancel my contract?",
+]
+
+
+async def answer_users(enabled, users, faq_share, concurrency, seed=0):
+    core.loop = asyncio.get_running_loop()
+    components.ANSWER_CACHE_ENABLED = enabled
+    rng = random.Random(seed)
+    queries = [
+        rng.choice(FAQ) if rng.random() < faq_share else f"Unique question {time.time()} {number}"
+        for number in range(users)
+    ]
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def user(query):
+        async with slots:
+            client = Client(page('/'))
+            with client:
+                await components.show_chat()
+                start = time.perf_counter()
+                await components.post_message(ui.input(value=query))
+                latencies.append(time.perf_counter() - start)
+            client.delete()
+
+    await asyncio.gather(*[user(query) for query in queries])
+    await close_client()
+    await close_llm_clients()
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the answer cache with FAQ traffic.")
+    parser.add_argument('--users', type=int, default=40, help="Number of chats, each asking one question.")
+    parser.add_argument('--faq_share', type=float, default=0.7, help="Share of questions drawn from the FAQ.")
+    parser.add_argument('--concurrency', type=int, default=4, help="Number of chats answered concurrently.")
+    parser.add_argument('--tokens', type=int, default=150, help="Tokens of every answer of the stub LLM.")
+    args = parser.parse_args()
+
+    collection_registry.collections = lambda names=None: {'benchmark': 'benchmark'}
+    with (
+        serve(collections_app(latency=0.05), port=COLLECTION_PORT),
+        serve(openai_app(time_to_first_token=0.3, tokens=args.tokens, token_interval=0.01), port=OPENAI_PORT),
+    ):
+        for name, enabled in [("off", False), ("cache", True)]:
+            before, saved = answer_cache.stats(), chat_saved_tokens.value
+            latencies = asyncio.run(answer_users(enabled, args.users, args.faq_share, args.concurrency))
+            after = answer_cache.stats()
+            hits = after['hits'] + after['semantic_hits'] - before['hits'] - before['semantic_hits']
+            print(
+                f"{name:>5}: mean={sum(latencies) / len(latencies) * 1000:7.1f} ms  "
+                f"p50={percentile(latencies, 50) * 1000:7.1f} ms  p95={percentile(latencies, 95) * 1000:7.1f} ms  "
+                f"hit rate={hits / len(latencies):5.1%}  saved tokens={chat_saved_tokens.value - saved}"
+            )
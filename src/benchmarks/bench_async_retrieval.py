@@ -0,0 +1,73 @@
+"""
+Compares the chat latency of the blocking and the async retrieval path.
+
+Every simulated session sends a number of messages. Each message retrieves the
+relevant documents from a local stub of the collections API and then waits for
+a simulated LLM answer. With the blocking client every retrieval stalls the
+event loop, so all sessions queue up behind each other.
+
+Run from the src folder:
+    python -m benchmarks.bench_async_retrieval --sessions 50
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.stubs import collections_app, free_port, percentile, serve
+
+PORT = free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{PORT}"
+
+import requests  # noqa: E402
+
+from config import COLLECTION_API_URL, HEADERS  # noqa: E402
+from aimodelhub import async_vectordb  # noqa: E402
+
+
+def blocking_retrieve(collection_id, query_string, num_documents=3):
+    # The blocking request the chat handler sent before the async client.
+    endpoint = f"{COLLECTION_API_URL}/collections/{collection_id}/query"
+    response = requests.post(endpoint, json={"query": query_string, "limit": num_documents}, headers=HEADERS)
+    return response.json()
+
+
+async def run_session(session, mode, messages, generation_time, latencies):
+    for message in range(messages):
+        start = time.perf_counter()
+        if mode == "sync":
+            blocking_retrieve("benchmark", f"{mode} {session} question {message}")
+        else:
+            await async_vectordb.retrieve_documents("benchmark", f"{mode} {session} question {message}")
+        await asyncio.sleep(generation_time)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(mode, sessions, messages, generation_time):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        run_session(session, mode, messages, generation_time, latencies) for session in range(sessions)
+    ])
+    elapsed = time.perf_counter() - start
+    await async_vectordb.close_client()
+    return latencies, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark blocking vs. async retrieval in the chat handler.")
+    parser.add_argument('--sessions', type=int, default=50, help="Number of concurrent chat sessions.")
+    parser.add_argument('--messages', type=int, default=5, help="Messages sent per session.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Latency of the stub collections API in seconds.")
+    parser.add_argument('--generation_time', type=float, default=0.2, help="Simulated LLM answer time in seconds.")
+    args = parser.parse_args()
+
+    with serve(collections_app(latency=args.latency), port=PORT):
+        for mode in ["sync", "async"]:
+            latencies, elapsed = asyncio.run(run(mode, args.sessions, args.messages, args.generation_time))
+            print(
+                f"{mode:>5}: p50={percentile(latencies, 50) * 1000:8.1f} ms  "
+                f"p99={percentile(latencies, 99) * 1000:8.1f} ms  "
+                f"throughput={len(latencies) / elapsed:7.1f} msg/s"
+            )
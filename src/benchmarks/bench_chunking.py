@@ -0,0 +1,69 @@
+"""
+Compares the ingestion throughput of server-side and client-side chunking.
+
+The files of the input folder are copied a number of times into a temporary
+folder, with one copy of every file inflated into a large document. Each mode
+ingests the folder into a local stub of the collections API which spends time
+proportional to the size of every uploaded document, standing in for chunking
+and embedding on the server. Server-side, every file is a single document
+whose cost is paid by one request; client-side, the parts of a file spread
+over concurrent batches.
+
+Run from the src folder:
+    python -m benchmarks.bench_chunking --copies 20
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from benchmarks.stubs import collections_app, free_port, serve
+
+PORT = free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{PORT}"
+
+from aimodelhub import ingest  # noqa: E402
+
+
+def build_corpus(source, target, copies, inflate):
+    """
+    Copies the text files of the source folder into the target folder. Other files
+    are copied as they are. The first copy of every text file is repeated inflate times.
+    """
+    for copy in range(copies):
+        for file_name in sorted(os.listdir(source)):
+            target_path = os.path.join(target, f"{copy:03d}_{file_name}")
+            if copy == 0 and file_name.endswith(".txt"):
+                with open(os.path.join(source, file_name)) as file:
+                    text = file.read()
+                with open(target_path, "w") as file:
+                    file.write("\n\n".join([text] * inflate))
+            else:
+                shutil.copy(os.path.join(source, file_name), target_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark server-side vs. client-side chunking during ingestion.")
+    parser.add_argument('--input_path', type=str, default="../input", help="Folder with the source files.")
+    parser.add_argument('--copies', type=int, default=20, help="Number of copies of the input folder.")
+    parser.add_argument('--inflate', type=int, default=500, help="Repetitions of the text in the large documents.")
+    parser.add_argument('--rate', type=float, default=500_000, help="Bytes chunked and embedded per second by the stub.")
+    parser.add_argument('--workers', type=int, default=ingest.INGEST_WORKERS, help="Number of extraction processes.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder, serve(collections_app(latency=0.02, processing_rate=args.rate), port=PORT):
+        build_corpus(args.input_path, folder, args.copies, args.inflate)
+        results = {}
+        for mode, client_chunking in [("server", False), ("client", True)]:
+            # Worker processes are forked after the switch, so they see it as well.
+            ingest.CLIENT_CHUNKING = client_chunking
+            results[mode] = ingest.ingest_folder("benchmark", folder, workers=args.workers)
+
+        for mode, stats in results.items():
+            megabytes = stats['files'] / 1024 / 1024
+            print(
+                f"{mode:>6}-side chunking: {stats['documents']:5d} documents in {stats['seconds']:6.2f} s  "
+                f"{megabytes / stats['seconds']:6.2f} MB/sec  "
+                f"{len(stats['document_ids']) / stats['seconds']:6.1f} files/sec"
+            )
@@ -0,0 +1,81 @@
+"""
+Measures the upstream load of a spike of identical questions with and without
+request coalescing.
+
+A number of users open a new chat at the same time and ask the same question.
+The requests reaching the stub collections API and the stub LLM are counted,
+together with the time until all answers are complete.
+
+Run from the src folder:
+    python -m benchmarks.bench_coalescing --users 50
+"""
+import argparse
+import asyncio
+import collections
+import os
+import time
+
+from benchmarks.stubs import collections_app, count_requests, free_port, openai_app, percentile, serve
+
+COLLECTION_PORT, OPENAI_PORT = free_port(), free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{COLLECTION_PORT}"
+os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{OPENAI_PORT}"
+
+from nicegui import core, ui  # noqa: E402
+from nicegui.client import Client  # noqa: E402
+from nicegui.page import page  # noqa: E402
+
+from aimodelhub import async_vectordb  # noqa: E402
+from aimodelhub.llm import close_llm_clients  # noqa: E402
+from aimodelhub.registry import collection_registry  # noqa: E402
+from ui import components  # noqa: E402
+
+
+async def spike(coalescing, users):
+    core.loop = asyncio.get_running_loop()
+    components.REQUEST_COALESCING = coalescing
+    async_vectordb.REQUEST_COALESCING = coalescing
+    # A new question per run, so that no answer is cached yet.
+    query = f"What changed with the announcement of {time.time()}?"
+    latencies = []
+
+    async def user():
+        client = Client(page('/'))
+        with client:
+            await components.show_chat()
+            start = time.perf_counter()
+            await components.post_message(ui.input(value=query))
+            latencies.append(time.perf_counter() - start)
+        client.delete()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[user() for _ in range(users)])
+    seconds = time.perf_counter() - start
+    await async_vectordb.close_client()
+    await close_llm_clients()
+    return latencies, seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark request coalescing with a spike of identical questions.")
+    parser.add_argument('--users', type=int, default=50, help="Number of users asking at the same time.")
+    parser.add_argument('--tokens', type=int, default=100, help="Tokens of every answer of the stub LLM.")
+    args = parser.parse_args()
+
+    collection_registry.collections = lambda names=None: {'benchmark': 'benchmark'}
+    counts = collections.Counter()
+    with (
+        serve(count_requests(collections_app(latency=0.1), counts), port=COLLECTION_PORT),
+        serve(count_requests(openai_app(time_to_first_token=0.3, tokens=args.tokens), counts), port=OPENAI_PORT),
+    ):
+        for name, coalescing in [("off", False), ("coalesced", True)]:
+            counts.clear()
+            latencies, seconds = asyncio.run(spike(coalescing, args.users))
+            queries = sum(count for path, count in counts.items() if path.endswith("/query"))
+            completions = counts["/chat/completions"]
+            print(
+                f"{name:>9}: collection queries={queries:4d}  LLM streams={completions:4d}  "
+                f"p50={percentile(latencies, 50) * 1000:7.1f} ms  p95={percentile(latencies, 95) * 1000:7.1f} ms  "
+                f"all answered in {seconds:5.2f} s"
+            )
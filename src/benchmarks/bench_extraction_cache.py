@@ -0,0 +1,74 @@
+"""
+Measures ingestion with page-sharded PDF extraction and the extraction cache.
+
+A corpus of copies of the input folder and a synthetic PDF with many pages is
+ingested into a local stub of the collections API, each run timing the
+extraction of every file:
+
+    cold, unsharded   empty extraction cache, every PDF extracted by one process
+    cold, sharded     empty extraction cache, large PDFs split into PDF_SHARD_PAGES ranges
+    warm              unchanged files, texts read from the extraction cache
+
+Sharding gains scale with the number of CPU cores (reported below). The size of
+the extraction cache on disk is compared with the size of the source files.
+
+Run from the src folder:
+    python -m benchmarks.bench_extraction_cache --pages 2000 --workers 4
+"""
+import argparse
+import functools
+import os
+import shutil
+import tempfile
+
+from benchmarks.stubs import collections_app, free_port, serve
+
+COLLECTION_PORT = free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{COLLECTION_PORT}"
+
+from benchmarks.bench_extraction_memory import generate_pdf  # noqa: E402
+from config import EXTRACTION_CACHE_PATH  # noqa: E402
+from aimodelhub import extraction, ingest  # noqa: E402
+
+
+def folder_bytes(folder):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sharded PDF extraction and the extraction cache.")
+    parser.add_argument('--input_path', type=str, default="../input", help="Folder with the source files.")
+    parser.add_argument('--copies', type=int, default=10, help="Number of copies of the input folder.")
+    parser.add_argument('--pages', type=int, default=2000, help="Pages of the synthetic PDF.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Number of extraction processes.")
+    args = parser.parse_args()
+
+    input_path = os.path.abspath(args.input_path)
+    with tempfile.TemporaryDirectory() as folder, serve(collections_app(latency=0.0), port=COLLECTION_PORT):
+        # The extraction cache is written below the temporary folder.
+        os.chdir(folder)
+        os.makedirs("corpus")
+        for copy in range(args.copies):
+            for file_name in sorted(os.listdir(input_path)):
+                shutil.copy(os.path.join(input_path, file_name), os.path.join("corpus", f"{copy:03d}_{file_name}"))
+        generate_pdf(os.path.join("corpus", "big.pdf"), args.pages)
+        print(f"Corpus: {len(os.listdir('corpus'))} files, {folder_bytes('corpus') / 1024 / 1024:.1f} MB, "
+              f"{os.cpu_count()} CPU cores, {args.workers} workers")
+
+        unsharded = functools.partial(extraction.plan_extraction, shard_pages=None)
+        for name, plan, clear in [
+            ("cold, unsharded", unsharded, True),
+            ("cold, sharded", extraction.plan_extraction, True),
+            ("warm", extraction.plan_extraction, False),
+        ]:
+            if clear:
+                shutil.rmtree(EXTRACTION_CACHE_PATH, ignore_errors=True)
+            ingest.plan_extraction = plan
+            stats = ingest.ingest_folder("benchmark", "corpus", workers=args.workers)
+            extraction_seconds = sum(timings['extraction_seconds'] for timings in stats['timings'].values())
+            print(
+                f"{name:>16}: total {stats['seconds']:6.2f} s  extraction of all files {extraction_seconds:6.2f} s  "
+                f"of big.pdf {stats['timings']['big.pdf']['extraction_seconds']:6.2f} s"
+            )
+        print(f"Extraction cache: {folder_bytes(EXTRACTION_CACHE_PATH) / 1024 / 1024:.2f} MB")
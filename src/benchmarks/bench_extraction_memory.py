@@ -0,0 +1,83 @@
+"""
+Compares the peak memory of building an upload body in memory with streaming it.
+
+A synthetic PDF is generated, then each mode runs in a fresh process which
+extracts the text and writes the request body adding the document to a
+collection into a sink that only counts bytes, so the numbers cover the client
+side only. Peak RSS is reported next to the RSS after importing the modules.
+
+Run from the src folder:
+    python -m benchmarks.bench_extraction_memory --pages 20000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz
+
+from aimodelhub.documents import extract_text, iter_text
+from aimodelhub.payloads import document_item, iter_document_body
+
+LINE = "The Magnificent Hoster keeps growing and serves customers all over Europe. "
+
+
+def generate_pdf(file_path, pages, lines_per_page=40):
+    """
+    Writes a PDF with the given number of pages full of text.
+    """
+    with fitz.open() as doc:
+        for page_number in range(pages):
+            page = doc.new_page()
+            text = "\n".join(f"{page_number}: {LINE}" for _ in range(lines_per_page))
+            page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=7)
+        doc.save(file_path)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(mode, file_path):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "in-memory":
+        body = json.dumps({"type": "collection", "items": [document_item("big.pdf", extract_text(file_path))]})
+        size = len(body.encode("utf-8"))
+    else:
+        size = sum(len(part) for part in iter_document_body("big.pdf", iter_text(file_path)))
+    print(json.dumps({
+        "mode": mode, "body_mb": size / 1024 / 1024, "baseline_mb": baseline,
+        "peak_mb": peak_rss_mb(), "seconds": time.perf_counter() - start,
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the peak memory of extracting and uploading a large PDF.")
+    parser.add_argument('--pages', type=int, default=20000, help="Number of pages of the synthetic PDF.")
+    parser.add_argument('--child', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--file', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.file)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as folder:
+        file_path = os.path.join(folder, "big.pdf")
+        generate_pdf(file_path, args.pages)
+        print(f"Synthetic PDF: {args.pages} pages, {os.path.getsize(file_path) / 1024 / 1024:.1f} MB")
+        for mode in ["in-memory", "streaming"]:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_extraction_memory", "--child", mode, "--file", file_path],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:>10}: body={result['body_mb']:7.1f} MB  peak RSS={result['peak_mb']:7.1f} MB  "
+                f"(+{result['peak_mb'] - result['baseline_mb']:6.1f} MB over imports)  time={result['seconds']:5.1f} s"
+            )
@@ -0,0 +1,77 @@
+"""
+Measures the retrieval latency of querying one or several collections per chat message.
+
+Every simulated session sends a number of messages, each of which queries the
+collections of a local stub of the collections API. Several collections are
+queried sequentially or concurrently (fan-out). In the last scenario one of the
+collections is slow, which the per-collection timeout cuts short. The stub runs
+in the same process, so with many sessions on few cores the numbers include
+its CPU time as well.
+
+Run from the src folder:
+    python -m benchmarks.bench_fanout --collections 5
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.stubs import collections_app, free_port, percentile, serve
+
+PORT = free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{PORT}"
+
+from aimodelhub import async_vectordb  # noqa: E402
+
+
+async def retrieve(mode, collections, query, timeout):
+    if mode == "sequential":
+        matches = []
+        for collection_id in collections.values():
+            matches += await async_vectordb.retrieve_documents(collection_id, query)
+        return sorted(matches, key=lambda match: match['score'], reverse=True)[:3]
+    return await async_vectordb.retrieve_from_collections(collections, query, timeout=timeout)
+
+
+async def run(name, mode, collections, sessions, messages, timeout):
+    latencies = []
+
+    async def session(number):
+        for message in range(messages):
+            start = time.perf_counter()
+            await retrieve(mode, collections, f"{name} {number} question {message}", timeout)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[session(number) for number in range(sessions)])
+    await async_vectordb.close_client()
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fan-out retrieval over several collections.")
+    parser.add_argument('--sessions', type=int, default=1, help="Number of concurrent chat sessions.")
+    parser.add_argument('--messages', type=int, default=20, help="Messages sent per session.")
+    parser.add_argument('--collections', type=int, default=5, help="Number of collections of the fan-out.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Latency of the stub collections API in seconds.")
+    parser.add_argument('--slow_latency', type=float, default=3.0, help="Latency of the slow collection in seconds.")
+    parser.add_argument('--timeout', type=float, default=0.5, help="Per-collection timeout in seconds.")
+    args = parser.parse_args()
+
+    collections = {f"collection-{number}": f"collection-{number}" for number in range(args.collections)}
+    scenarios = [
+        ("1 collection", "fan-out", dict(list(collections.items())[:1])),
+        (f"{args.collections} sequential", "sequential", collections),
+        (f"{args.collections} fan-out", "fan-out", collections),
+        (f"{args.collections} fan-out, 1 slow", "fan-out", collections),
+    ]
+    query_latencies = {}
+    with serve(collections_app(latency=args.latency, query_latencies=query_latencies), port=PORT):
+        for name, mode, selected in scenarios:
+            if name.endswith("slow"):
+                query_latencies["collection-0"] = args.slow_latency
+            latencies = asyncio.run(run(name, mode, selected, args.sessions, args.messages, args.timeout))
+            print(
+                f"{name:>22}: p50={percentile(latencies, 50) * 1000:7.1f} ms  "
+                f"p95={percentile(latencies, 95) * 1000:7.1f} ms  max={max(latencies) * 1000:7.1f} ms"
+            )
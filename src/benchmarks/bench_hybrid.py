@@ -0,0 +1,93 @@
+"""
+Measures the lexical index and what fusing it into the vector search gains for
+queries about exact terms, like product codes, names or years.
+
+A synthetic corpus is generated in which every chunk mentions a unique product
+code among common words. Queries ask for the code of a random chunk. The vector
+ranking is simulated by a ranking which finds the chunk only with a given
+probability (--vector_recall), as embeddings represent such codes poorly. Hit@3
+of the vector ranking alone is compared with the hybrid ranking (reciprocal rank
+fusion and token budget of hybrid_matches). Build time, size on disk, opening
+time and search latency of the index are reported as well.
+
+Run from the src folder:
+    python -m benchmarks.bench_hybrid --chunks 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.stubs import percentile
+from aimodelhub.lexical import LexicalIndex, fuse, within_budget, write_lexical_index
+
+WORDS = (
+    "hosting server domain customer support cloud backup storage network security panel "
+    "plan premium email database migration uptime traffic bandwidth certificate account"
+).split()
+
+
+def synthetic_chunks(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            'file_name': f"file-{row // 100}.txt",
+            'content': ' '.join(rng.choices(WORDS, k=60)) + f" The product code is HX{row:07d}.",
+            'pages': None,
+        }
+        for row in range(count)
+    ]
+
+
+def vector_ranking(chunks, target, recall, depth, rng):
+    """
+    Returns:
+        list: Random chunks, containing the target at a random rank with the probability recall.
+    """
+    ranking = [chunks[row] for row in rng.sample(range(len(chunks)), depth)]
+    if rng.random() < recall:
+        ranking[rng.randrange(depth)] = chunks[target]
+    return ranking
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the lexical index and hybrid retrieval.")
+    parser.add_argument('--chunks', type=int, default=100000, help="Number of chunks of the synthetic corpus.")
+    parser.add_argument('--queries', type=int, default=500, help="Number of queries.")
+    parser.add_argument('--vector_recall', type=float, default=0.5, help="Probability that the vector search finds the chunk.")
+    parser.add_argument('--overfetch', type=int, default=3, help="Factor by which the vector search is over-fetched.")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    chunks = synthetic_chunks(args.chunks)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "index")
+        start = time.perf_counter()
+        write_lexical_index(path, chunks)
+        print(f"Built lexical index of {args.chunks} chunks in {time.perf_counter() - start:.1f} s")
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print(f"Size on disk: {size / 1024 / 1024:.1f} MB")
+
+        start = time.perf_counter()
+        index = LexicalIndex(path)
+        print(f"Opened index in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        vector_hits, hybrid_hits, latencies = 0, 0, []
+        for _ in range(args.queries):
+            target = rng.randrange(args.chunks)
+            query = f"Which plan has the product code HX{target:07d}?"
+            expected = chunks[target]['content']
+            vector_matches = vector_ranking(chunks, target, args.vector_recall, 3 * args.overfetch, rng)
+            start = time.perf_counter()
+            lexical_matches = index.search(query, len(vector_matches))
+            latencies.append(time.perf_counter() - start)
+            hybrid = within_budget(fuse([vector_matches, lexical_matches]), 3)
+            vector_hits += any(match['content'] == expected for match in vector_matches[:3])
+            hybrid_hits += any(match['content'] == expected for match in hybrid)
+
+        print(
+            f"Search p50={percentile(latencies, 50) * 1000:.2f} ms  p95={percentile(latencies, 95) * 1000:.2f} ms  "
+            f"p99={percentile(latencies, 99) * 1000:.2f} ms"
+        )
+        print(f"Hit@3 vector only: {vector_hits / args.queries:.3f}  hybrid: {hybrid_hits / args.queries:.3f}")
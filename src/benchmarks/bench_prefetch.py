@@ -0,0 +1,88 @@
+"""
+Measures the retrieval time left after pressing enter, with and without
+retrieving documents while the user is typing.
+
+A NiceGUI client is built in-process and a user is simulated typing questions
+character by character, pausing before pressing enter. With prefetch, every
+keystroke goes to ui.prefetch.start_prefetch as the input field would do. The
+reported time is what `get_llm_prompt` still waits for retrieval after the
+message was sent, taken from the 'chat_retrieval_seconds' histogram.
+
+Run from the src folder:
+    python -m benchmarks.bench_prefetch --latency 0.2 --pause 0.5
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.stubs import collections_app, free_port, openai_app, percentile, serve
+
+COLLECTION_PORT, OPENAI_PORT = free_port(), free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{COLLECTION_PORT}"
+os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{OPENAI_PORT}"
+
+from nicegui import core, ui  # noqa: E402
+from nicegui.client import Client  # noqa: E402
+from nicegui.page import page  # noqa: E402
+
+from aimodelhub import metrics  # noqa: E402
+from aimodelhub.async_vectordb import close_client  # noqa: E402
+from aimodelhub.llm import close_llm_clients  # noqa: E402
+from aimodelhub.registry import collection_registry  # noqa: E402
+from ui import components  # noqa: E402
+from ui.prefetch import start_prefetch  # noqa: E402
+
+QUESTIONS = [
+    "When was the company founded and by whom?",
+    "Which products does the company sell in Europe?",
+    "How many people work in the data centers?",
+    "What is the revenue of the cloud business?",
+]
+
+
+async def chat(prefetch, messages, keystroke_interval, pause):
+    core.loop = asyncio.get_running_loop()
+    histogram = metrics._metrics['chat_retrieval_seconds']
+    waits, hits = [], metrics.chat_prefetch_hits.value
+    client = Client(page('/'))
+    with client:
+        await components.show_chat()
+        query_field = ui.input()
+        for number in range(messages):
+            # Unique queries, so that the retrieval cache does not answer them.
+            query = f"{QUESTIONS[number % len(QUESTIONS)]} ({time.time():.0f}-{number})"
+            for position in range(1, len(query) + 1):
+                query_field.value = query[:position]
+                if prefetch:
+                    start_prefetch(query_field.value)
+                await asyncio.sleep(keystroke_interval)
+            await asyncio.sleep(pause)
+            before = histogram.sum
+            await components.post_message(query_field)
+            waits.append(histogram.sum - before)
+    await close_client()
+    await close_llm_clients()
+    return waits, metrics.chat_prefetch_hits.value - hits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval prefetch while typing.")
+    parser.add_argument('--messages', type=int, default=8, help="Number of messages sent.")
+    parser.add_argument('--latency', type=float, default=0.2, help="Latency of the stub collections API in seconds.")
+    parser.add_argument('--keystroke_interval', type=float, default=0.02, help="Seconds between two keystrokes.")
+    parser.add_argument('--pause', type=float, default=0.5, help="Seconds between the last keystroke and enter.")
+    args = parser.parse_args()
+
+    collection_registry.collections = lambda names=None: {'benchmark': 'benchmark'}
+    with (
+        serve(collections_app(latency=args.latency), port=COLLECTION_PORT),
+        serve(openai_app(time_to_first_token=0.01, tokens=10, token_interval=0.001), port=OPENAI_PORT),
+    ):
+        for name, prefetch in [("off", False), ("prefetch", True)]:
+            waits, hits = asyncio.run(chat(prefetch, args.messages, args.keystroke_interval, args.pause))
+            print(
+                f"{name:>8}: retrieval after enter p50={percentile(waits, 50) * 1000:7.1f} ms  "
+                f"p95={percentile(waits, 95) * 1000:7.1f} ms  prefetch hits={hits}/{len(waits)}"
+            )
@@ -0,0 +1,104 @@
+"""
+Measures recall@3 and latency of the local replica against the remote query path.
+
+A synthetic corpus of clustered embeddings is written as replica. Recall@3 of
+the approximate nearest neighbour index is measured against an exact search for
+several numbers of searched lists (nprobe). Afterwards retrieve_documents is
+timed without the replica (query sent to a local stub of the collections API),
+with the replica (query embedded by a local OpenAI compatible stub) and with the
+replica and a cached query embedding. The result cache is disabled.
+
+Run from the src folder:
+    python -m benchmarks.bench_replica --chunks 100000
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks.stubs import collections_app, free_port, openai_app, percentile, serve
+
+COLLECTION_PORT, OPENAI_PORT = free_port(), free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{COLLECTION_PORT}"
+os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{OPENAI_PORT}"
+
+from aimodelhub import async_vectordb  # noqa: E402
+from aimodelhub.replica import Replica, delete_replica, replica_path, write_replica  # noqa: E402
+
+
+def synthetic_corpus(chunks, dimensions, topics, seed=0):
+    """
+    Returns:
+        tuple: Embeddings scattered around a number of topics and queries close to random chunks.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    embeddings = centers[rng.integers(0, topics, chunks)] + 1.0 * rng.standard_normal((chunks, dimensions)).astype(np.float32)
+    queries = embeddings[rng.integers(0, chunks, 200)] + 0.5 * rng.standard_normal((200, dimensions)).astype(np.float32)
+    return embeddings, queries
+
+
+async def time_retrieval(collection_id, local, queries, prefix):
+    async_vectordb.LOCAL_REPLICA = local
+    async_vectordb.RETRIEVAL_CACHE_ENABLED = False
+    latencies = []
+    for number in range(queries):
+        start = time.perf_counter()
+        await async_vectordb.retrieve_documents(collection_id, f"{prefix} question {number}")
+        latencies.append(time.perf_counter() - start)
+    await async_vectordb.close_client()
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local replica against the remote query path.")
+    parser.add_argument('--chunks', type=int, default=100000, help="Number of chunks of the synthetic corpus.")
+    parser.add_argument('--dimensions', type=int, default=384, help="Number of dimensions of the embeddings.")
+    parser.add_argument('--topics', type=int, default=2000, help="Number of clusters of the synthetic corpus.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Latency of the stub collections API in seconds.")
+    parser.add_argument('--embedding_latency', type=float, default=0.02, help="Latency of the stub embeddings API in seconds.")
+    parser.add_argument('--queries', type=int, default=100, help="Number of timed retrievals per path.")
+    args = parser.parse_args()
+
+    collection_id = f"benchmark-{uuid.uuid4()}"
+    embeddings, queries = synthetic_corpus(args.chunks, args.dimensions, args.topics)
+    chunks = [{'file_name': f"file-{row // 100}.txt", 'content': f"chunk {row}", 'pages': None} for row in range(args.chunks)]
+
+    start = time.perf_counter()
+    write_replica(replica_path(collection_id), chunks, embeddings)
+    print(f"Built replica of {args.chunks} chunks in {time.perf_counter() - start:.1f} s")
+
+    try:
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        exact = [set(np.argsort(normalized @ query)[::-1][:3].astype(str)) for query in queries]
+        for nprobe in [1, 4, 8, 16, 32]:
+            replica = Replica(replica_path(collection_id), nprobe=nprobe)
+            found, latencies = 0, []
+            for query, expected in zip(queries, exact):
+                start = time.perf_counter()
+                results = replica.search(query, 3)
+                latencies.append(time.perf_counter() - start)
+                found += len(expected & {result['id'] for result in results})
+            print(
+                f"nprobe={nprobe:3d}: recall@3={found / (3 * len(queries)):.3f}  "
+                f"search p50={percentile(latencies, 50) * 1000:6.2f} ms  p95={percentile(latencies, 95) * 1000:6.2f} ms"
+            )
+
+        with (
+            serve(collections_app(latency=args.latency), port=COLLECTION_PORT),
+            serve(openai_app(dimensions=args.dimensions, embedding_latency=args.embedding_latency), port=OPENAI_PORT),
+        ):
+            for name, local, prefix in [
+                ("remote query", False, "remote"), ("replica", True, "local"), ("replica, cached", True, "local"),
+            ]:
+                latencies = asyncio.run(time_retrieval(collection_id, local, args.queries, prefix))
+                print(
+                    f"{name:>15}: p50={percentile(latencies, 50) * 1000:7.2f} ms  "
+                    f"p95={percentile(latencies, 95) * 1000:7.2f} ms"
+                )
+    finally:
+        delete_replica(collection_id)
@@ -0,0 +1,100 @@
+"""
+Measures the import time and memory of the entry points and the cold start of a
+chat worker.
+
+Every measurement runs in a fresh interpreter. For launch_ui.py and the CLIs the
+time to import the module (its __main__ block does not run) and the RSS
+afterwards are reported together with the heavy libraries it loaded. The cold
+start of a chat worker is the time from starting `launch_ui.py` as worker 0
+until its page answers, its RSS at that time and its RSS a few seconds later,
+once the LLM client library was imported in the background (LLM_PRELOAD).
+
+Run from the src folder:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.stubs import free_port
+
+ENTRY_POINTS = ['launch_ui', 'create_collection', 'delete_collection', 'answer_questions']
+HEAVY_MODULES = ['nicegui', 'langchain_openai', 'openai', 'langchain_core', 'fitz', 'docx', 'numpy', 'tiktoken', 'requests']
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+with open('/proc/self/statm') as file:
+    rss = int(file.read().split()[1]) * 4096 / 1024 / 1024
+print(json.dumps({{'seconds': seconds, 'rss_mb': rss, 'loaded': [name for name in {heavy} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module):
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True, env={**os.environ, 'IONOS_API_TOKEN': 'benchmark'},
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def process_rss_mb(pid):
+    with open(f"/proc/{pid}/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def measure_worker(settle=5.0, timeout=60):
+    """
+    Returns:
+        tuple: Seconds until the page of a fresh worker answered, its RSS in MB then and settle seconds later.
+    """
+    port = free_port()
+    env = {**os.environ, 'IONOS_API_TOKEN': 'benchmark', 'UI_WORKERS': '2', 'UI_WORKER': '0', 'UI_PORT': str(port)}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, 'launch_ui.py'], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+            except OSError:
+                time.sleep(0.02)
+                continue
+            ready, rss = time.perf_counter() - start, process_rss_mb(process.pid)
+            time.sleep(settle)
+            return ready, rss, process_rss_mb(process.pid)
+        raise TimeoutError("The worker did not start")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the import time and cold start of the entry points.")
+    parser.add_argument('--runs', type=int, default=5, help="Number of fresh interpreters per measurement.")
+    args = parser.parse_args()
+
+    baseline = statistics.median(measure_import('os')['rss_mb'] for _ in range(args.runs))
+    print(f"RSS of a bare interpreter: {baseline:.1f} MB")
+    for module in ENTRY_POINTS:
+        results = [measure_import(module) for _ in range(args.runs)]
+        print(
+            f"{module:>18}: import {statistics.median(result['seconds'] for result in results) * 1000:7.1f} ms  "
+            f"RSS {statistics.median(result['rss_mb'] for result in results):6.1f} MB  "
+            f"loaded: {', '.join(results[0]['loaded']) or '-'}"
+        )
+
+    starts = [measure_worker() for _ in range(args.runs)]
+    print(
+        f"{'chat worker':>18}: ready after {statistics.median(start[0] for start in starts) * 1000:7.1f} ms  "
+        f"RSS {statistics.median(start[1] for start in starts):6.1f} MB, "
+        f"settled {statistics.median(start[2] for start in starts):6.1f} MB"
+    )
@@ -0,0 +1,82 @@
+"""
+Compares full-chat refreshes with incremental streaming of the last bot message.
+
+A NiceGUI client is built in-process with a pre-filled chat history and
+`post_message` answers a question from a local OpenAI compatible stub. Instead of
+a browser, a drain task empties the client's outbox at the cadence of NiceGUI's
+own outbox loop and counts the websocket messages, serialized elements and bytes
+that would have been sent. CPU time is measured for the event loop thread only,
+so the stub servers running in background threads are not included.
+
+Run from the src folder:
+    python -m benchmarks.bench_streaming --history 40 --tokens 500
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.measure import drain_outbox
+from benchmarks.stubs import collections_app, free_port, openai_app, serve
+
+COLLECTION_PORT, OPENAI_PORT = free_port(), free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{COLLECTION_PORT}"
+os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{OPENAI_PORT}"
+
+from nicegui import core, ui  # noqa: E402
+from nicegui.client import Client  # noqa: E402
+from nicegui.page import page  # noqa: E402
+
+from aimodelhub.async_vectordb import close_client  # noqa: E402
+from aimodelhub.llm import close_llm_clients  # noqa: E402
+from ui import components  # noqa: E402
+from ui.history import append_to_history  # noqa: E402
+
+OUTBOX_INTERVAL = 0.01
+
+
+async def answer(incremental, history_length):
+    core.loop = asyncio.get_running_loop()
+    client = Client(page('/'))
+    with client:
+        for turn in range(history_length):
+            await append_to_history({'role': 'user' if turn % 2 else 'system', 'content': f'message {turn}', 'sent': bool(turn % 2)})
+        await components.show_chat()
+        query_field = ui.input(value='When was the company founded?')
+        await asyncio.sleep(OUTBOX_INTERVAL)
+        client.outbox.updates.clear()
+        client.outbox.messages.clear()
+
+        counts = {'messages': 0, 'elements': 0, 'bytes': 0}
+        drainer = asyncio.create_task(drain_outbox(client.outbox, counts, OUTBOX_INTERVAL))
+        components.CHAT_INCREMENTAL_STREAMING = incremental
+        cpu_start, wall_start = time.thread_time(), time.perf_counter()
+        await components.post_message(query_field)
+        await asyncio.sleep(2 * OUTBOX_INTERVAL)
+        counts['cpu_ms'] = (time.thread_time() - cpu_start) * 1000
+        counts['wall_s'] = time.perf_counter() - wall_start
+        drainer.cancel()
+    await close_client()
+    await close_llm_clients()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the rendering cost of a streamed answer.")
+    parser.add_argument('--history', type=int, default=40, help="Number of messages already in the chat.")
+    parser.add_argument('--tokens', type=int, default=500, help="Number of tokens in the streamed answer.")
+    parser.add_argument('--token_interval', type=float, default=0.005, help="Seconds between two streamed tokens.")
+    args = parser.parse_args()
+
+    with (
+        serve(collections_app(latency=0.01), port=COLLECTION_PORT),
+        serve(openai_app(time_to_first_token=0.05, tokens=args.tokens, token_interval=args.token_interval), port=OPENAI_PORT),
+    ):
+        for name, incremental in [("refresh", False), ("incremental", True)]:
+            counts = asyncio.run(answer(incremental, args.history))
+            print(
+                f"{name:>11}: websocket messages={counts['messages']:6d}  "
+                f"elements sent={counts['elements']:7d}  bytes={counts['bytes']:9d}  "
+                f"cpu={counts['cpu_ms']:8.1f} ms  wall={counts['wall_s']:5.2f} s"
+            )
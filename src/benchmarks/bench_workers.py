@@ -0,0 +1,93 @@
+"""
+Measures how the chat throughput scales with the number of worker processes
+sharing one SQLite history database (HISTORY_BACKEND 'sqlite').
+
+Every worker is a forked process answering concurrent in-process chat sessions
+through `post_message` against the shared stub servers, and keeps its histories
+in the same database file in write-ahead log mode. Messages per second are
+counted over all workers from the first start to the last finish. Scaling is
+bounded by the CPU cores of the machine (reported below).
+
+Run from the src folder:
+    python -m benchmarks.bench_workers --workers 1 2 4 --sessions 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.stubs import collections_app, free_port, openai_app, percentile, serve
+
+COLLECTION_PORT, OPENAI_PORT = free_port(), free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{COLLECTION_PORT}"
+os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{OPENAI_PORT}"
+
+from nicegui import core, ui  # noqa: E402
+from nicegui.client import Client  # noqa: E402
+from nicegui.page import page  # noqa: E402
+
+from aimodelhub.async_vectordb import close_client  # noqa: E402
+from aimodelhub.llm import close_llm_clients  # noqa: E402
+from aimodelhub.registry import collection_registry  # noqa: E402
+from ui import components, store  # noqa: E402
+
+
+async def chat(worker, sessions, messages):
+    core.loop = asyncio.get_running_loop()
+    latencies = []
+
+    async def session(number):
+        client = Client(page('/'))
+        with client:
+            await components.show_chat()
+            query_field = ui.input()
+            for message in range(messages):
+                query_field.value = f"Worker {worker} session {number} asks question {message} at {time.time()}"
+                start = time.perf_counter()
+                await components.post_message(query_field)
+                latencies.append(time.perf_counter() - start)
+        client.delete()
+
+    await asyncio.gather(*[session(number) for number in range(sessions)])
+    await close_client()
+    await close_llm_clients()
+    return latencies
+
+
+def run_worker(arguments):
+    worker, database, sessions, messages = arguments
+    store._store = store.SQLiteHistoryStore(database)
+    start = time.time()
+    latencies = asyncio.run(chat(worker, sessions, messages))
+    return start, time.time(), latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the chat throughput with several worker processes.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="Numbers of workers to compare.")
+    parser.add_argument('--sessions', type=int, default=10, help="Concurrent chat sessions per worker.")
+    parser.add_argument('--messages', type=int, default=3, help="Messages sent per chat session.")
+    parser.add_argument('--tokens', type=int, default=200, help="Tokens of every answer of the stub LLM.")
+    args = parser.parse_args()
+
+    print(f"CPU cores: {os.cpu_count()}")
+    collection_registry.collections = lambda names=None: {'benchmark': 'benchmark'}
+    with (
+        tempfile.TemporaryDirectory() as folder,
+        serve(collections_app(latency=0.05), port=COLLECTION_PORT),
+        serve(openai_app(time_to_first_token=0.2, tokens=args.tokens, token_interval=0.005), port=OPENAI_PORT),
+    ):
+        for workers in args.workers:
+            database = os.path.join(folder, f"history-{workers}.db")
+            store.SQLiteHistoryStore(database)
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.map(run_worker, [(worker, database, args.sessions, args.messages) for worker in range(workers)])
+            seconds = max(end for _, end, _ in results) - min(start for start, _, _ in results)
+            latencies = [latency for _, _, worker_latencies in results for latency in worker_latencies]
+            print(
+                f"{workers:2d} workers: {len(latencies) / seconds:6.1f} messages/s  "
+                f"p50={percentile(latencies, 50) * 1000:7.1f} ms  p95={percentile(latencies, 95) * 1000:7.1f} ms"
+            )
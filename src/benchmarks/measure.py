@@ -0,0 +1,68 @@
+import asyncio
+import json
+import resource
+import time
+
+from nicegui.element import Element
+
+
+def rss_mb():
+    """
+    Returns:
+        float: The current resident set size of this process in MB.
+    """
+    with open("/proc/self/statm") as file:
+        pages = int(file.read().split()[1])
+    return pages * resource.getpagesize() / 1024 / 1024
+
+
+def peak_rss_mb():
+    """
+    Returns:
+        float: The peak resident set size of this process in MB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task sleeping for a fixed interval,
+    which is the time other coroutines blocked the loop.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        self.task.cancel()
+
+
+async def drain_outbox(outbox, counts, interval=0.01):
+    """
+    Empties the outbox of a NiceGUI client like NiceGUI's outbox loop does and counts
+    the websocket messages, serialized elements and bytes that would have been sent.
+    """
+    while True:
+        if outbox.updates:
+            data = {
+                element_id: element._to_dict() if isinstance(element, Element) else None
+                for element_id, element in outbox.updates.items()
+            }
+            counts['messages'] += 1
+            counts['elements'] += len(data)
+            counts['bytes'] += len(json.dumps(data, default=str))
+            outbox.updates.clear()
+        counts['messages'] += len(outbox.messages)
+        outbox.messages.clear()
+        await asyncio.sleep(interval)
@@ -0,0 +1,219 @@
+import asyncio
+import base64
+import contextlib
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+import zlib
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+def collections_app(latency=0.05, content_bytes=2000, error_rate=0.0, processing_rate=None, query_latencies=None):
+    """
+    Builds a local stub of the IONOS AI Model Hub collections API.
+    Args:
+        latency (float, optional): Seconds every request waits before answering.
+        content_bytes (int, optional): Size of the content of every returned match.
+        error_rate (float, optional): Share of document uploads rejected with 429.
+        processing_rate (float, optional): Bytes of document content chunked and embedded
+            per second. The documents of one request are processed one after another,
+            while separate requests are processed concurrently. Defaults to None (no cost).
+        query_latencies (dict, optional): Seconds queries of single collections wait before
+            answering by collection ID, overriding latency.
+    Returns:
+        Starlette: The stub application.
+    """
+    collections = {}
+    content = base64.b64encode(b"x" * content_bytes).decode()
+
+    async def create(request: Request):
+        await asyncio.sleep(latency)
+        collection_id = str(uuid.uuid4())
+        collections[collection_id] = {}
+        return JSONResponse({"id": collection_id}, status_code=201)
+
+    async def add_documents(request: Request):
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return JSONResponse({"message": "Too many requests"}, status_code=429)
+        body = await request.json()
+        documents = collections.setdefault(request.path_params["collection_id"], {})
+        items = []
+        for item in body["items"]:
+            if processing_rate:
+                await asyncio.sleep(len(item["properties"]["content"]) / processing_rate)
+            document_id = str(uuid.uuid4())
+            documents[document_id] = item
+            items.append({"id": document_id, **item})
+        return JSONResponse({"type": "collection", "items": items})
+
+    async def query(request: Request):
+        body = await request.json()
+        await asyncio.sleep((query_latencies or {}).get(request.path_params["collection_id"], latency))
+        matches = [
+            {
+                "score": 1.0 - rank / 10 - random.random() / 20,
+                "document": {
+                    "id": f"document-{rank}",
+                    "properties": {"name": f"file-{rank}.txt", "content": content},
+                },
+            } for rank in range(body.get("limit", 3))
+        ]
+        return JSONResponse({"properties": {"matches": matches}})
+
+    async def delete_document(request: Request):
+        await asyncio.sleep(latency)
+        documents = collections.get(request.path_params["collection_id"], {})
+        if documents.pop(request.path_params["document_id"], None) is None:
+            return Response(status_code=404)
+        return Response(status_code=204)
+
+    async def delete(request: Request):
+        await asyncio.sleep(latency)
+        if collections.pop(request.path_params["collection_id"], None) is None:
+            return Response(status_code=404)
+        return Response(status_code=204)
+
+    return Starlette(routes=[
+        Route("/collections", create, methods=["POST"]),
+        Route("/collections/{collection_id}/documents", add_documents, methods=["PUT"]),
+        Route("/collections/{collection_id}/documents/{document_id}", delete_document, methods=["DELETE"]),
+        Route("/collections/{collection_id}/query", query, methods=["POST"]),
+        Route("/collections/{collection_id}", delete, methods=["DELETE"]),
+    ])
+
+
+def openai_app(time_to_first_token=0.1, tokens=100, token_interval=0.01, dimensions=64, embedding_latency=0.0,
+               counts=None):
+    """
+    Builds a local stub of an OpenAI compatible endpoint. Chat completions stream a
+    fixed number of tokens, embeddings are hashed bags of words, so that queries
+    sharing most of their words get similar embeddings.
+    Args:
+        time_to_first_token (float, optional): Seconds before the first token is sent.
+        tokens (int, optional): Number of tokens in every answer.
+        token_interval (float, optional): Seconds between two tokens.
+        dimensions (int, optional): Number of dimensions of the embeddings.
+        embedding_latency (float, optional): Seconds every embedding request waits before answering.
+        counts (collections.Counter, optional): Receives the number of answers started
+            ('answers') and of tokens sent ('tokens'), which stops when the client closes the stream.
+    Returns:
+        Starlette: The stub application.
+    """
+    def embed(text):
+        vector = [0.0] * dimensions
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % dimensions] += 1.0
+        return vector
+
+    def chunk(model, delta, finish_reason=None):
+        payload = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+
+        async def events():
+            if counts is not None:
+                counts['answers'] += 1
+            await asyncio.sleep(time_to_first_token)
+            yield chunk(model, {"role": "assistant", "content": ""})
+            for token in range(tokens):
+                if counts is not None:
+                    counts['tokens'] += 1
+                yield chunk(model, {"content": f"token{token} "})
+                await asyncio.sleep(token_interval)
+            yield chunk(model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def embeddings(request: Request):
+        body = await request.json()
+        await asyncio.sleep(embedding_latency)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = [{"object": "embedding", "index": i, "embedding": embed(text)} for i, text in enumerate(inputs)]
+        return JSONResponse({"object": "list", "data": data, "model": body.get("model", "stub")})
+
+    return Starlette(routes=[
+        Route("/chat/completions", completions, methods=["POST"]),
+        Route("/embeddings", embeddings, methods=["POST"]),
+    ])
+
+
+def free_port():
+    """
+    Returns:
+        int: A TCP port on localhost which is currently not in use.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def count_requests(app, counts):
+    """
+    Wraps an ASGI application to count the HTTP requests it receives by path.
+    Args:
+        app: The ASGI application.
+        counts (collections.Counter): Receives the number of requests by path.
+    Returns:
+        The wrapped ASGI application.
+    """
+    async def counting(scope, receive, send):
+        if scope["type"] == "http":
+            counts[scope["path"]] += 1
+        await app(scope, receive, send)
+    return counting
+
+
+@contextlib.contextmanager
+def serve(app, port=None):
+    """
+    Runs an ASGI application in a background thread for the duration of the context.
+    Args:
+        app: The ASGI application to serve.
+        port (int, optional): Port to listen on. Defaults to a free port.
+    Yields:
+        str: The base url of the running server.
+    """
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a list of values.
+    Args:
+        values (list): The measured values.
+        p (float): The percentile between 0 and 100.
+    Returns:
+        float: The value at the given percentile.
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
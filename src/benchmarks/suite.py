@@ -0,0 +1,297 @@
+"""
+Offline load test of the whole app against stub AI Model Hub servers.
+
+Local stubs of the collections API and of an OpenAI compatible endpoint are
+started with configurable latency and payload sizes, then three scenarios run:
+
+    ingest     create_collection.prepare_collection on a scaled-up copy of input/
+    retrieval  concurrent async retrieve_documents calls with unique queries
+    chat       concurrent in-process NiceGUI chat sessions answering through post_message
+    churn      chat sessions which send another message or leave while the answer streams
+
+Every scenario reports its throughput, p50/p95/p99 latency, event-loop lag and
+RSS. The report can be written as JSON and compared against an earlier report;
+metrics which got worse by more than the tolerance are flagged and make the
+run fail, so regressions are caught before deploying.
+
+Run from the src folder:
+    python -m benchmarks.suite --output report.json
+    python -m benchmarks.suite --baseline report.json
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.measure import LoopLagMonitor, drain_outbox, peak_rss_mb, rss_mb
+from benchmarks.stubs import collections_app, free_port, openai_app, percentile, serve
+
+COLLECTION_PORT, OPENAI_PORT = free_port(), free_port()
+os.environ.setdefault("IONOS_API_TOKEN", "benchmark")
+os.environ["COLLECTION_API_URL"] = f"http://127.0.0.1:{COLLECTION_PORT}"
+os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{OPENAI_PORT}"
+
+from nicegui import core, ui  # noqa: E402
+from nicegui.client import Client  # noqa: E402
+from nicegui.page import page  # noqa: E402
+
+from aimodelhub import async_vectordb  # noqa: E402
+from aimodelhub.llm import close_llm_clients, preload_llm  # noqa: E402
+from aimodelhub.registry import collection_registry  # noqa: E402
+from create_collection import prepare_collection  # noqa: E402
+from ui import components  # noqa: E402
+from ui.history import delete_history  # noqa: E402
+
+# Direction in which every reported metric gets better.
+HIGHER_IS_BETTER = {'throughput', 'tokens_saved_share'}
+LOWER_IS_BETTER = {'p50_ms', 'p95_ms', 'p99_ms', 'loop_lag_p99_ms', 'loop_lag_max_ms', 'rss_mb'}
+
+
+def summarize(latencies, seconds, unit, lags, **extra):
+    """
+    Returns:
+        dict: Throughput, latency percentiles, event-loop lag and RSS of a scenario.
+    """
+    return {
+        'throughput': len(latencies) / seconds,
+        'unit': unit,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'loop_lag_p99_ms': percentile(lags, 99) * 1000 if lags else 0.0,
+        'loop_lag_max_ms': max(lags) * 1000 if lags else 0.0,
+        'rss_mb': rss_mb(),
+        **extra,
+    }
+
+
+def build_corpus(source, target, copies):
+    os.makedirs(target)
+    for copy in range(copies):
+        for file_name in sorted(os.listdir(source)):
+            shutil.copy(os.path.join(source, file_name), os.path.join(target, f"{copy:03d}_{file_name}"))
+
+
+def run_ingest(input_path, copies, workers):
+    """
+    Creates a collection from copies of the input folder. Every file counts as one
+    request, with the total time of the run as its latency.
+    """
+    build_corpus(input_path, "corpus", copies)
+    start = time.perf_counter()
+    collection_id = prepare_collection("benchmark", "corpus", workers=workers)
+    seconds = time.perf_counter() - start
+    collection_registry.register("benchmark", collection_id)
+    megabytes = sum(os.path.getsize(os.path.join("corpus", name)) for name in os.listdir("corpus")) / 1024 / 1024
+    files = len(os.listdir("corpus"))
+    return collection_id, summarize([seconds] * files, seconds, "files/s", [], mb_per_second=megabytes / seconds)
+
+
+async def run_retrieval(collection_id, requests, concurrency):
+    """
+    Sends unique queries with a fixed number of concurrent callers.
+    """
+    monitor = LoopLagMonitor()
+    monitor.start()
+    latencies, queue = [], asyncio.Queue()
+    for number in range(requests):
+        queue.put_nowait(f"suite question {time.time()} {number}")
+
+    async def caller():
+        while not queue.empty():
+            query = queue.get_nowait()
+            start = time.perf_counter()
+            await async_vectordb.retrieve_documents(collection_id, query)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[caller() for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+    monitor.stop()
+    await async_vectordb.close_client()
+    return summarize(latencies, seconds, "requests/s", monitor.lags)
+
+
+async def run_chat(sessions, messages):
+    """
+    Opens concurrent chat sessions, each sending a number of messages one after
+    another. The latency of a message is the time until its answer is complete.
+    """
+    core.loop = asyncio.get_running_loop()
+    # Like with LLM_PRELOAD, the LLM client library is not imported by the first answer.
+    preload_llm()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    latencies = []
+    counts = {'messages': 0, 'elements': 0, 'bytes': 0}
+
+    async def session(number):
+        client = Client(page('/'))
+        with client:
+            await components.show_chat()
+            query_field = ui.input()
+            drainer = asyncio.create_task(drain_outbox(client.outbox, counts))
+            for message in range(messages):
+                query_field.value = f"Session {number} asks question {message}: when was the company founded?"
+                start = time.perf_counter()
+                await components.post_message(query_field)
+                latencies.append(time.perf_counter() - start)
+            drainer.cancel()
+        client.delete()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[session(number) for number in range(sessions)])
+    seconds = time.perf_counter() - start
+    monitor.stop()
+    await async_vectordb.close_client()
+    await close_llm_clients()
+    return summarize(latencies, seconds, "messages/s", monitor.lags, websocket_messages=counts['messages'])
+
+
+async def run_churn(sessions, llm_counts, tokens, interrupt_after):
+    """
+    Opens concurrent chat sessions which interrupt their first answer after a
+    while: even sessions send a second message, odd sessions close the tab. The
+    latency is the time until the second answer is complete. The tokens streamed
+    by the stub LLM are compared with the tokens of complete answers to all
+    messages, the difference was saved by stopping the interrupted answers.
+    """
+    core.loop = asyncio.get_running_loop()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    latencies = []
+    counts = {'messages': 0, 'elements': 0, 'bytes': 0}
+    llm_counts.clear()
+
+    async def session(number):
+        client = Client(page('/'))
+        with client:
+            await components.show_chat()
+            query_field = ui.input()
+            drainer = asyncio.create_task(drain_outbox(client.outbox, counts))
+            query_field.value = f"Churn session {number} at {time.time()}: when was the company founded?"
+
+            async def first_message():
+                with client:
+                    await components.post_message(query_field)
+
+            first = asyncio.create_task(first_message())
+            await asyncio.sleep(interrupt_after)
+            if number % 2:
+                # Like a deleted client of a closed browser tab, see launch_ui.py.
+                delete_history(client)
+                await components.cancel_generation(client)
+            else:
+                query_field.value = f"Churn session {number} at {time.time()}: who founded it?"
+                start = time.perf_counter()
+                await components.post_message(query_field)
+                latencies.append(time.perf_counter() - start)
+            await asyncio.gather(first, return_exceptions=True)
+            drainer.cancel()
+        client.delete()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[session(number) for number in range(sessions)])
+    seconds = time.perf_counter() - start
+    monitor.stop()
+    await async_vectordb.close_client()
+    await close_llm_clients()
+    # Tokens still in flight are counted by the stub once the stream is closed.
+    await asyncio.sleep(0.5)
+    complete = llm_counts['answers'] * tokens
+    return summarize(
+        latencies, seconds, "messages/s", monitor.lags, upstream_tokens=llm_counts['tokens'],
+        tokens_saved=complete - llm_counts['tokens'], tokens_saved_share=1 - llm_counts['tokens'] / complete,
+    )
+
+
+def compare(report, baseline, tolerance):
+    """
+    Prints the change of every metric against the baseline.
+    Returns:
+        list: Descriptions of the metrics which got worse by more than the tolerance.
+    """
+    regressions = []
+    for scenario, metrics in report['scenarios'].items():
+        for name, value in metrics.items():
+            previous = baseline.get('scenarios', {}).get(scenario, {}).get(name)
+            if not isinstance(value, (int, float)) or not previous:
+                continue
+            change = (value - previous) / previous
+            worse = -change if name in HIGHER_IS_BETTER else change if name in LOWER_IS_BETTER else 0
+            flag = "  REGRESSION" if worse > tolerance else ""
+            print(f"{scenario:>10} {name:>16}: {previous:10.2f} -> {value:10.2f} ({change:+7.1%}){flag}")
+            if flag:
+                regressions.append(f"{scenario} {name} {change:+.1%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the app against local stub servers.")
+    parser.add_argument('--input_path', type=str, default="../input", help="Folder with the source files.")
+    parser.add_argument('--copies', type=int, default=10, help="Number of copies of the input folder to ingest.")
+    parser.add_argument('--workers', type=int, default=2, help="Number of extraction processes.")
+    parser.add_argument('--requests', type=int, default=500, help="Number of retrievals.")
+    parser.add_argument('--concurrency', type=int, default=50, help="Number of concurrent retrievals.")
+    parser.add_argument('--sessions', type=int, default=20, help="Number of concurrent chat sessions.")
+    parser.add_argument('--messages', type=int, default=3, help="Messages sent per chat session.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Latency of the stub collections API in seconds.")
+    parser.add_argument('--content_bytes', type=int, default=2000, help="Size of every document returned by queries.")
+    parser.add_argument('--time_to_first_token', type=float, default=0.2, help="Seconds until the stub LLM answers.")
+    parser.add_argument('--tokens', type=int, default=200, help="Tokens of every answer of the stub LLM.")
+    parser.add_argument('--token_interval', type=float, default=0.01, help="Seconds between two tokens of the stub LLM.")
+    parser.add_argument('--churn_sessions', type=int, default=20, help="Number of chat sessions interrupting answers.")
+    parser.add_argument('--interrupt_after', type=float, default=1.0, help="Seconds after which they interrupt.")
+    parser.add_argument('--output', type=str, default=None, help="Write the report as JSON to this file.")
+    parser.add_argument('--baseline', type=str, default=None, help="Compare against a report written earlier.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Share by which a metric may get worse.")
+    args = parser.parse_args()
+
+    input_path = os.path.abspath(args.input_path)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    llm_counts = collections.Counter()
+    stubs = (
+        serve(collections_app(latency=args.latency, content_bytes=args.content_bytes), port=COLLECTION_PORT),
+        serve(openai_app(args.time_to_first_token, args.tokens, args.token_interval, counts=llm_counts), port=OPENAI_PORT),
+    )
+    # Collection IDs, manifests and the registry are written below a temporary folder.
+    with tempfile.TemporaryDirectory() as folder, stubs[0], stubs[1]:
+        os.chdir(folder)
+        scenarios = {}
+        collection_id, scenarios['ingest'] = run_ingest(input_path, args.copies, args.workers)
+        scenarios['retrieval'] = asyncio.run(run_retrieval(collection_id, args.requests, args.concurrency))
+        scenarios['chat'] = asyncio.run(run_chat(args.sessions, args.messages))
+        scenarios['churn'] = asyncio.run(run_churn(args.churn_sessions, llm_counts, args.tokens, args.interrupt_after))
+
+    report = {'created': time.strftime("%Y-%m-%dT%H:%M:%S"), 'arguments': vars(args), 'scenarios': scenarios,
+              'peak_rss_mb': peak_rss_mb()}
+    print()
+    print(f"{'scenario':>10} {'throughput':>20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'lag p99':>8} {'lag max':>8} {'RSS MB':>7}")
+    for name, metrics in scenarios.items():
+        print(
+            f"{name:>10} {metrics['throughput']:9.1f} {metrics['unit']:>10} {metrics['p50_ms']:9.1f} "
+            f"{metrics['p95_ms']:9.1f} {metrics['p99_ms']:9.1f} {metrics['loop_lag_p99_ms']:8.1f} "
+            f"{metrics['loop_lag_max_ms']:8.1f} {metrics['rss_mb']:7.1f}"
+        )
+    print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+    churn = scenarios['churn']
+    print(f"Churn: {churn['upstream_tokens']} tokens streamed by the LLM, {churn['tokens_saved']} "
+          f"({churn['tokens_saved_share']:.0%}) saved by stopping interrupted answers")
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=1)
+    if baseline:
+        with open(baseline) as file:
+            print()
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
@@ -14,9 +14,110 @@ HEADERS = {
     'Authorization': f'Bearer {IONOS_API_TOKEN}',
 }
 
+# Base url of the IONOS AI Model Hub collections API. Can be overridden with the
+# environment variable of the same name, e.g. to point at a local stub server.
+COLLECTION_API_URL = os.environ.get('COLLECTION_API_URL', 'https://inference.de-txl.ionos.com')
+# Maximum number of connections the async HTTP client keeps open to the collections API.
+HTTP_MAX_CONNECTIONS = 100
+# Maximum number of idle keep-alive connections kept in the pool.
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+# Seconds an idle keep-alive connection stays in the pool before it is closed.
+HTTP_KEEPALIVE_EXPIRY = 30
+# Timeout in seconds for a single request to the collections API.
+HTTP_TIMEOUT = 60
+
+# Let concurrent identical collection queries share one request and concurrent identical
+# first questions of chats (see ANSWER_CACHE_FIRST_TURN_ONLY) share one answer of the LLM.
+REQUEST_COALESCING = True
+
+# Cache the results of collection queries, so that repeated questions skip the round-trip.
+RETRIEVAL_CACHE_ENABLED = True
+# Maximum number of cached query results.
+RETRIEVAL_CACHE_SIZE = 1000
+# Seconds a cached query result stays valid.
+RETRIEVAL_CACHE_TTL = 600
+# Reuse cached results for queries whose embedding has at least this cosine similarity
+# with a cached query. Costs one embedding request per cache miss. None disables it.
+RETRIEVAL_CACHE_SIMILARITY = None
+# Folder through which the processes sharing the data folder (e.g. the chat workers and
+# create_collection.py) tell each other which cached results a changed collection invalidated.
+# None invalidates the caches of the current process only.
+CACHE_INVALIDATION_PATH = 'data/cache_invalidations'
+# Seconds between two checks of the invalidations of other processes.
+CACHE_INVALIDATION_INTERVAL = 1.0
+
+# JSON file mapping the names of the collections (e.g. per department or product line)
+# to their IDs. It is reloaded when it changes. If it does not exist, the collection
+# persisted in data/collection_id.txt is used.
+COLLECTION_REGISTRY = 'data/collections.json'
+# Names of the registered collections queried for every chat message. None queries all of them.
+RETRIEVAL_COLLECTIONS = None
+# Seconds to wait for the results of a single collection. Results of slower collections are left out.
+RETRIEVAL_TIMEOUT = 2.0
+
+# Answer queries from a local replica of the collection, if create_collection.py built one
+# (--replica). Only the query is embedded remotely. Without a replica, the collection is queried.
+LOCAL_REPLICA = True
+# Folder holding the local replicas of the collections.
+REPLICA_PATH = 'data/replicas'
+# Number of lists of the approximate nearest neighbour index searched per query.
+# Higher values find more of the exact nearest neighbours, but take longer.
+REPLICA_NPROBE = 8
+# Number of chunks embedded with a single request when building a replica.
+REPLICA_EMBEDDING_BATCH = 64
+
+# Build a local BM25 index of the files added to a collection and fuse its matches with
+# the vector matches of the collection (hybrid retrieval), so that questions about exact
+# terms like names or years find the passages mentioning them.
+LEXICAL_INDEX = True
+# Folder holding the lexical indexes of the collections.
+LEXICAL_INDEX_PATH = 'data/lexical'
+# Number of postings (chunk and term pairs) held in memory while building a lexical index.
+# Beyond it, the postings are written to a temporary run and all runs are merged at the end.
+LEXICAL_INDEX_RUN_POSTINGS = 2_000_000
+# Factor by which more matches are fetched from the collection and the lexical index than
+# are returned, as candidates for the fusion.
+HYBRID_OVERFETCH = 3
+# Constant of the reciprocal rank fusion. Higher values give lower ranks more weight.
+HYBRID_RRF_K = 60
+# Share of the word triples of the shorter of two passages of the same file which the other
+# one must contain, for both to count as the same passage in the fusion. The collection and
+# the lexical index chunk files differently, so their passages rarely match exactly.
+HYBRID_MATCH_OVERLAP = 0.3
+# Maximum number of tokens of the passages retrieved from one collection.
+HYBRID_TOKEN_BUDGET = 1500
+
 # The maximum number of pages to extract from a PDF when filling the vector db.
 MAX_PAGES = 10
 
+# Number of processes extracting text from documents in parallel when filling the vector db.
+INGEST_WORKERS = os.cpu_count() or 1
+# Number of concurrent upload requests to the collections API when filling the vector db.
+INGEST_UPLOADERS = 4
+# Maximum size in bytes of the documents packed into a single upload request.
+INGEST_BATCH_BYTES = 4 * 1024 * 1024
+# Number of extracted documents waiting for upload before the extraction pauses.
+INGEST_QUEUE_SIZE = 32
+# Files larger than this number of bytes are extracted and uploaded as a stream by a
+# single worker process instead of being batched, which keeps the memory usage bounded.
+INGEST_STREAMING_BYTES = 50 * 1024 * 1024
+# Folder caching the texts extracted from files by the hash of their content, so that
+# unchanged files are not parsed again when they are ingested or indexed. None disables the cache.
+EXTRACTION_CACHE_PATH = 'data/extraction_cache'
+# Maximum size in bytes of the compressed texts in the extraction cache. The least
+# recently used texts are evicted beyond it.
+EXTRACTION_CACHE_BYTES = 512 * 1024 * 1024
+# Folder holding the manifests of the files uploaded to every collection, which
+# create_collection.py --update compares with the input folder.
+MANIFEST_PATH = 'data/manifests'
+# PDFs with more pages are extracted in ranges of this many pages by several extraction
+# processes in parallel. None extracts every PDF in a single process.
+PDF_SHARD_PAGES = 50
+# Number of retries of a request rejected with 429 or 5xx by the collections API.
+INGEST_RETRIES = 5
+# Seconds to wait before the first retry. The wait doubles with every further retry.
+INGEST_BACKOFF = 1.0
+
 # Data backend to be used. Chose from 'chromadb' and 'pgvector'
 DATA_BACKEND = 'pgvector'
 # Embedding model to be used when writing embeddings to the vector db.
@@ -25,11 +126,76 @@ EMBEDDING_MODEL = 'BAAI/bge-m3'
 CHUNK_SIZE = 1000
 # Number of tokens for which the chunks overlap when loading them to the vector db.
 CHUNK_OVERLAP = 50
+# Split documents on the client into ordered part-documents of at most CLIENT_CHUNK_TOKENS
+# tokens, respecting page and paragraph boundaries, instead of letting the collection
+# chunk whole documents. Parts are uploaded in parallel and retrieval can cite pages.
+CLIENT_CHUNKING = False
+# Maximum number of tokens of a part-document when chunking on the client.
+CLIENT_CHUNK_TOKENS = CHUNK_SIZE
+# Maximum number of tokens a part-document repeats from the previous one.
+CLIENT_CHUNK_OVERLAP = CHUNK_OVERLAP
+# tiktoken encoding used to count tokens. It is not the tokenizer of LLM_NAME, so counts
+# are approximations (see PROMPT_TOKEN_MARGIN), and rougher if it is not available.
+TOKENIZER_ENCODING = 'cl100k_base'
 
 # Name of the large language model to be used when generating answers.
 LLM_NAME = 'meta-llama/Meta-Llama-3.1-8B-Instruct'
-# Base url of the OpenAI endpoint to be used when applying the Large Language Model
-LLM_BASE_URL = 'https://openai.inference.de-txl.ionos.com/v1'
+# Base url of the OpenAI endpoint to be used when applying the Large Language Model.
+# Can be overridden with the environment variable of the same name.
+LLM_BASE_URL = os.environ.get('LLM_BASE_URL', 'https://openai.inference.de-txl.ionos.com/v1')
+# Use HTTP/2 for the LLM endpoint, so that concurrent answers share connections.
+LLM_HTTP2 = True
+# Maximum number of connections opened to the LLM endpoint per model and endpoint.
+LLM_MAX_CONNECTIONS = 50
+# Maximum number of idle keep-alive connections kept open to the LLM endpoint.
+LLM_MAX_KEEPALIVE_CONNECTIONS = 20
+# Maximum number of answers generated concurrently. Further requests wait for a free
+# slot in a queue per chat, served round robin, so that every user gets a fair share.
+LLM_MAX_CONCURRENT_STREAMS = 50
+# Maximum number of answers waiting for a free slot. Further messages are answered
+# with CHAT_OVERLOAD_MESSAGE instead. None for no limit.
+LLM_MAX_QUEUED_STREAMS = 100
+# Maximum number of answers generated for one chat within LLM_RATE_WINDOW seconds.
+# Further messages are answered with CHAT_RATE_LIMIT_MESSAGE. None for no limit.
+LLM_RATE_LIMIT = 10
+# Seconds of the window of LLM_RATE_LIMIT.
+LLM_RATE_WINDOW = 60
+# Number of questions answered concurrently by answer_questions.py.
+BATCH_CONCURRENCY = 8
+# Import the LLM client library in the background once the chat is up instead of with
+# the first answer. It is never imported while the chat starts.
+LLM_PRELOAD = True
+# Number of tokens of the context window of the deployed LLM_NAME model.
+LLM_CONTEXT_TOKENS = 8192
+
+# Tokens of the context window kept free for the answer when building the prompt.
+PROMPT_ANSWER_TOKENS = 1024
+# Share of the prompt budget left after the instructions which retrieved passages may
+# use. Tokens not needed by the passages are given to the chat history.
+PROMPT_PASSAGES_SHARE = 0.5
+# Number of most recent chat messages kept verbatim. Older messages are kept verbatim
+# only while the budget allows, otherwise they are summarized.
+PROMPT_RECENT_MESSAGES = 6
+# Maximum number of tokens of the summary of older chat messages. 0 drops them instead.
+PROMPT_SUMMARY_TOKENS = 256
+# Share of the context window left unused when building the prompt, as tokens are counted
+# with TOKENIZER_ENCODING instead of the tokenizer of LLM_NAME and may be underestimated.
+PROMPT_TOKEN_MARGIN = 0.1
+
+# Cache complete answers of the LLM, so that frequently asked questions are replayed
+# instead of being generated again. Answers are cached per query, retrieved documents,
+# instructions and model.
+ANSWER_CACHE_ENABLED = True
+# Maximum number of cached answers.
+ANSWER_CACHE_SIZE = 1000
+# Seconds a cached answer stays valid.
+ANSWER_CACHE_TTL = 3600
+# Reuse cached answers for paraphrased queries whose embedding has at least this cosine
+# similarity, given the same documents were retrieved. Costs one embedding request per
+# query, unless it is cached. None disables it.
+ANSWER_CACHE_SIMILARITY = None
+# Only cache answers to the first question of a chat, as later answers depend on the history.
+ANSWER_CACHE_FIRST_TURN_ONLY = True
 
 # Instructions how the chat should behave when answering queries. Notice,
 # that these instructions can be used to enforce answering in certain 
@@ -47,6 +213,71 @@ CHAT_HEADER_TITLE = 'My first chat powered by IONOS AI Model Hub'
 # Background color of the title bar of the chat.
 CHAT_HEADER_COLOR = '#061A3E'
 
+# Shown in the answer while it waits for a free slot, {position} is replaced by its place in the queue.
+CHAT_QUEUE_MESSAGE = "Viele Anfragen gerade, du bist Nummer {position} in der Warteschlange..."
+# Answer to a message which could not be queued, because too many answers are waiting.
+CHAT_OVERLOAD_MESSAGE = "Gerade sind sehr viele Anfragen offen. Bitte versuche es in einem Moment noch einmal."
+# Answer to a message exceeding the rate limit of a chat (LLM_RATE_LIMIT).
+CHAT_RATE_LIMIT_MESSAGE = "Du hast in kurzer Zeit sehr viele Fragen gestellt. Bitte warte einen Moment."
+
+# Stop generating an answer once the user sent another message or closed the chat, so
+# that the LLM does not generate tokens nobody reads.
+CHAT_CANCEL_GENERATION = True
+# Appended to an answer which was stopped before it was complete.
+CHAT_TRUNCATED_SUFFIX = "\n\n(Antwort abgebrochen)"
+
+# Update only the text of the answer being streamed instead of re-rendering the
+# complete chat for every chunk received from the LLM.
+CHAT_INCREMENTAL_STREAMING = True
+# Seconds to collect streamed chunks before the answer in the browser is updated.
+CHAT_STREAM_FLUSH_INTERVAL = 0.05
+# Number of collected characters after which the answer is updated regardless of the interval.
+CHAT_STREAM_FLUSH_CHARS = 200
+# Seconds between two saves of a streamed answer to the history store. The complete
+# answer is always saved.
+CHAT_STREAM_SAVE_INTERVAL = 2.0
+
+# Start retrieving documents for the query while the user is still typing and reuse
+# the result when the message is sent, if the final query is similar enough.
+CHAT_PREFETCH = False
+# Seconds without typing before the documents for the partial query are retrieved.
+CHAT_PREFETCH_DEBOUNCE = 0.3
+# Minimum number of characters of a partial query worth retrieving documents for.
+CHAT_PREFETCH_MIN_CHARS = 12
+# Minimum similarity (0 to 1) of the partial and the final query to reuse the prefetched documents.
+CHAT_PREFETCH_SIMILARITY = 0.8
+
+# Where the chat histories are kept: 'memory' for the process memory, 'sqlite' for the
+# database file HISTORY_DATABASE or 'kv' for the key-value store at HISTORY_KV_URL.
+# With 'sqlite' and 'kv', histories are shared by all worker processes (UI_WORKERS)
+# and survive restarts and page reloads, as they are kept per browser instead of per page.
+HISTORY_BACKEND = os.environ.get('HISTORY_BACKEND', 'memory')
+# SQLite database file of the 'sqlite' history backend.
+HISTORY_DATABASE = 'data/history.db'
+# URL of the Redis compatible key-value store of the 'kv' history backend.
+HISTORY_KV_URL = os.environ.get('HISTORY_KV_URL', 'redis://localhost:6379/0')
+# Prefix of the keys of the histories in the key-value store.
+HISTORY_KV_PREFIX = 'chat-history:'
+# Seconds after which the history of a chat without any activity is evicted.
+HISTORY_IDLE_TIMEOUT = 3600
+# Seconds between two checks for idle chats.
+HISTORY_EVICTION_INTERVAL = 60
+# Number of messages rendered when the chat is shown and loaded per page when scrolling up.
+HISTORY_PAGE_SIZE = 20
+
+# Number of processes serving the chat, one per CPU core. Worker i listens on port
+# UI_PORT + i; a load balancer with sticky sessions has to distribute the users, see
+# launch_ui.py. More than one worker needs a shared HISTORY_BACKEND.
+UI_WORKERS = int(os.environ.get('UI_WORKERS', 1))
+# Port of the chat, or of the first worker.
+UI_PORT = int(os.environ.get('UI_PORT', 8080))
+
+# Path of the endpoint exporting latency metrics of the chat in the Prometheus text
+# format. None disables the endpoint.
+METRICS_ENDPOINT = '/metrics'
+# Print a JSON line with the measurements of every chat message and ingested file.
+METRICS_JSON_LOGS = False
+
 # Placeholder to be shown in the input area before the user entered the first query.
 CHAT_FOOTER_PLACEHOLDER = 'start typing...'
 # Background color of the footer.
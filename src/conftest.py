@@ -0,0 +1 @@
+# Tests import the modules of this folder like the entry points do, e.g. `from ui import components`.
@@ -1,15 +1,23 @@
 import argparse
+import sys
 
-from aimodelhub.vectordb import create_collection, add_files_to_collection, persist_id
-from config import MAX_PAGES
+from aimodelhub.ingest import list_files
+from aimodelhub.registry import collection_registry
+from aimodelhub.manifest import build_manifest, save_manifest, update_collection
+from aimodelhub.vectordb import create_collection, add_files_to_collection, build_replica, persist_id, retrieve_id
+from config import INGEST_BATCH_BYTES, INGEST_WORKERS, MAX_PAGES
 
 
-def prepare_collection(collection_name, input_path):
+def prepare_collection(collection_name, input_path, workers=INGEST_WORKERS, batch_bytes=INGEST_BATCH_BYTES):
     """
     Prepares the collection by creating it and uploading all documents in the input path.
+    A manifest of the uploaded files is persisted, so that the collection can later be
+    updated incrementally.
     Args:
         collection_name (str): The name of the collection to create.
         input_path (str): The input path with all documents to upload.
+        workers (int, optional): Number of processes extracting text from the documents.
+        batch_bytes (int, optional): Maximum size of the documents uploaded in one request.
     Returns:
         str: The ID of the collection. This ID will be used to query the collection.
     """
@@ -17,7 +25,8 @@ def prepare_collection(collection_name, input_path):
     collection_id = create_collection(collection_name, collection_description)
 
     if collection_id:
-        add_files_to_collection(collection_id, input_path, MAX_PAGES)
+        stats = add_files_to_collection(collection_id, input_path, MAX_PAGES, workers=workers, batch_bytes=batch_bytes)
+        save_manifest(build_manifest(collection_id, list_files(input_path), stats['document_ids']))
 
     return collection_id
 
@@ -26,8 +35,38 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate an image based on input text and specified orientation.")
     parser.add_argument('--collection_name', type=str, default='Test collection', help="Name of the collection to persist data.")
     parser.add_argument('--input_path', type=str, default='input', help="Path to search for documents to upload to document collection")
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS, help="Number of processes extracting text from the documents.")
+    parser.add_argument('--batch_bytes', '--batch-bytes', type=int, default=INGEST_BATCH_BYTES, help="Maximum size in bytes of the documents uploaded in one request.")
+    parser.add_argument('--replica', action='store_true', help="Build a local replica of the collection, from which the chat answers queries.")
+    parser.add_argument('--update', action='store_true', help="Only upload new or changed files to the collection registered as collection_name (or the persisted one) and delete documents of removed files.")
     
     args = parser.parse_args()
 
-    collection_id = prepare_collection(collection_name=args.collection_name, input_path=args.input_path)
-    persist_id(collection_id=collection_id)
+    if args.update:
+        registered = collection_registry.collections([args.collection_name])
+        collection_id = registered.get(args.collection_name) or retrieve_id()
+        if not collection_id:
+            sys.exit(f"No collection registered as '{args.collection_name}' or persisted to update.")
+        updated = update_collection(
+            collection_id=collection_id, 
+            folder_path=args.input_path, 
+            max_pages=MAX_PAGES, 
+            workers=args.workers, 
+            batch_bytes=args.batch_bytes
+        )
+    else:
+        collection_id = prepare_collection(
+            collection_name=args.collection_name, 
+            input_path=args.input_path, 
+            workers=args.workers, 
+            batch_bytes=args.batch_bytes
+        )
+        if not collection_id:
+            sys.exit("The collection could not be created, nothing was registered or persisted.")
+        persist_id(collection_id=collection_id)
+        collection_registry.register(args.collection_name, collection_id)
+        updated = None
+
+    # An update rebuilds an existing replica by itself.
+    if args.replica and collection_id and not (updated and updated['replica']):
+        build_replica(collection_id=collection_id, folder_path=args.input_path, max_pages=MAX_PAGES)
@@ -1,5 +1,7 @@
 import argparse
 
+from aimodelhub.manifest import delete_manifest
+from aimodelhub.registry import collection_registry
 from aimodelhub.vectordb import retrieve_id, delete_collection, delete_persisted_id
 
 if __name__ == "__main__":
@@ -14,4 +16,13 @@ if __name__ == "__main__":
         collection_id = args.collection_id
 
     delete_collection(collection_id=collection_id)
-    delete_persisted_id()
\ No newline at end of file
+    collection_registry.unregister(collection_id)
+    # Imported here, as they load numpy.
+    from aimodelhub.lexical import delete_lexical_index
+    from aimodelhub.replica import delete_replica
+
+    delete_replica(collection_id)
+    delete_lexical_index(collection_id)
+    delete_manifest(collection_id)
+    if collection_id == retrieve_id():
+        delete_persisted_id()
\ No newline at end of file
@@ -1,18 +1,129 @@
-from nicegui import ui
+import os
+import signal
+import subprocess
+import sys
+import threading
 
-from config import STORAGE_SECRET
-from ui.components import show_header, show_footer, show_chat
+from nicegui import app, ui
+from starlette.responses import PlainTextResponse
+
+from aimodelhub.async_vectordb import close_client
+from aimodelhub.cache import answer_cache, retrieval_cache
+from aimodelhub.llm import close_llm_clients, pool_stats, preload_llm
+from aimodelhub.metrics import register_collector, render_metrics
+from config import (
+    CHAT_CANCEL_GENERATION, HISTORY_BACKEND, HISTORY_EVICTION_INTERVAL, LLM_PRELOAD, METRICS_ENDPOINT, STORAGE_SECRET, UI_PORT, UI_WORKERS,
+)
+from ui.components import cancel_generation, init_chat, show_header, show_footer, show_chat
+from ui.history import delete_history, evict_idle_histories
 
 @ui.page('/')
-def show():
+async def show():
     """
     Show chat in browser.
     """
     ui.page_title("AI Model Hub - Testbot")
     show_header()
     show_footer()
-    show_chat()
-    
+    await show_chat()
+    init_chat()
+
+
+def collect_stats():
+    """
+    Exports the statistics of the retrieval and answer caches and the LLM connection pools.
+    """
+    samples = []
+    for prefix, cache in [('retrieval_cache', retrieval_cache), ('answer_cache', answer_cache)]:
+        stats = cache.stats()
+        samples.extend(
+            (f"{prefix}_{name}_total", "counter", f"{prefix.replace('_', ' ').capitalize()} {name}.", stats[name])
+            for name in ['hits', 'semantic_hits', 'misses', 'evictions', 'expirations', 'invalidations']
+        )
+        samples.append((f"{prefix}_entries", "gauge", f"Entries in the {prefix.replace('_', ' ')}.", stats['size']))
+    pools = pool_stats()
+    for name in ['active_connections', 'idle_connections', 'active_streams', 'waiting_streams']:
+        values = [pool[name] for pool in pools if name in pool]
+        if values:
+            samples.append((f"llm_{name}", "gauge", f"LLM {name.replace('_', ' ')}.", sum(values)))
+    return samples
+
+
+if METRICS_ENDPOINT:
+    register_collector(collect_stats)
+
+    @app.get(METRICS_ENDPOINT)
+    def metrics():
+        """
+        Latency metrics of the chat in the Prometheus text format.
+        """
+        return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4')
+
+
+if LLM_PRELOAD:
+    app.on_startup(lambda: threading.Thread(target=preload_llm, daemon=True).start())
+app.on_shutdown(close_client)
+app.on_shutdown(close_llm_clients)
+app.on_delete(delete_history)
+if CHAT_CANCEL_GENERATION:
+    # Not on disconnect: a client reconnecting within its reconnect_timeout keeps its answer.
+    app.on_delete(cancel_generation)
+app.timer(HISTORY_EVICTION_INTERVAL, evict_idle_histories, immediate=False)
+
+
+
+def run_workers(workers=UI_WORKERS, port=UI_PORT):
+    """
+    Starts the chat in several processes, worker i listening on port + i, and waits
+    for them to exit. The chat histories have to be shared (HISTORY_BACKEND 'sqlite'
+    on a single host or 'kv' across hosts).
+
+    A load balancer in front of the workers has to use sticky sessions: the page
+    and the websocket of a browser tab have to reach the same worker, as the page
+    elements live in its memory. With nginx, for example:
+
+        upstream chat {
+            ip_hash;
+            server 127.0.0.1:8080;
+            server 127.0.0.1:8081;
+        }
+        server {
+            listen 80;
+            location / {
+                proxy_pass http://chat;
+                proxy_http_version 1.1;
+                proxy_set_header Upgrade $http_upgrade;
+                proxy_set_header Connection "upgrade";
+                proxy_set_header Host $host;
+            }
+        }
+
+    Each worker exports its own metrics, so every port has to be scraped.
+    Args:
+        workers (int, optional): Number of worker processes.
+        port (int, optional): Port of the first worker.
+    """
+    if HISTORY_BACKEND == 'memory':
+        print("Warning: chat histories are kept per worker, users lose their chat when sent to another worker.")
+    processes = [
+        subprocess.Popen([sys.executable, __file__], env={**os.environ, 'UI_WORKER': str(worker)})
+        for worker in range(workers)
+    ]
+    print(f"Started {workers} workers on ports {port} to {port + workers - 1}.")
+    # Workers are stopped with the launcher, also when it is terminated.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
 
-if __name__ in {"__main__", "__mp_main__"}:
-    ui.run(storage_secret=STORAGE_SECRET)
\ No newline at end of file
+if __name__ == "__main__" and UI_WORKERS > 1 and 'UI_WORKER' not in os.environ:
+    run_workers()
+elif __name__ in {"__main__", "__mp_main__"}:
+    # Workers are not reloaded on code changes, only a single process is.
+    ui.run(storage_secret=STORAGE_SECRET, port=UI_PORT + int(os.environ.get('UI_WORKER', 0)), reload=UI_WORKERS == 1)
\ No newline at end of file
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from aimodelhub.admission import AdmissionController, Rejected
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_overloaded_requests_do_not_count_against_the_rate_limit():
+    async def scenario():
+        admission = AdmissionController(1, max_queue=0, rate_limit=2, rate_window=60.0, clock=Clock())
+        await admission.acquire('busy')
+        for _ in range(3):
+            with pytest.raises(Rejected) as rejection:
+                await admission.acquire('session')
+            assert rejection.value.reason == 'overloaded'
+        admission.release()
+
+        await admission.acquire('session')
+        admission.release()
+        await admission.acquire('session')
+        admission.release()
+        with pytest.raises(Rejected) as rejection:
+            await admission.acquire('session')
+        assert rejection.value.reason == 'rate_limited'
+
+    asyncio.run(scenario())
+
+
+def test_sessions_are_served_round_robin():
+    async def scenario():
+        admission = AdmissionController(1)
+        order = []
+
+        async def request(session_id, name):
+            await admission.acquire(session_id)
+            order.append(name)
+            await asyncio.sleep(0)
+            admission.release()
+
+        await admission.acquire('running')
+        tasks = [asyncio.create_task(request('burst', f'burst {number}')) for number in range(3)]
+        tasks.append(asyncio.create_task(request('other', 'other')))
+        await asyncio.sleep(0)
+        admission.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ['burst 0', 'other', 'burst 1', 'burst 2']
+
+
+def test_positions_are_reported_while_waiting():
+    async def scenario():
+        admission = AdmissionController(1)
+        positions = {'first': [], 'second': []}
+        await admission.acquire('running')
+        first = asyncio.create_task(admission.acquire('first', positions['first'].append))
+        second = asyncio.create_task(admission.acquire('second', positions['second'].append))
+        await asyncio.sleep(0)
+        admission.release()
+        await first
+        admission.release()
+        await second
+        admission.release()
+        return positions
+
+    assert asyncio.run(scenario()) == {'first': [1], 'second': [2, 1]}
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        admission = AdmissionController(1, max_queue=1)
+        await admission.acquire('running')
+        waiting = asyncio.create_task(admission.acquire('first'))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert admission.waiting == 0 and not admission.queues
+
+        # The freed place in the queue is taken by the next request.
+        next_request = asyncio.create_task(admission.acquire('second'))
+        await asyncio.sleep(0)
+        admission.release()
+        await next_request
+        assert admission.running == 1
+
+    asyncio.run(scenario())
+
+
+def test_rate_limit_window_slides():
+    async def scenario():
+        clock = Clock()
+        admission = AdmissionController(10, rate_limit=2, rate_window=60.0, clock=clock)
+        for _ in range(2):
+            await admission.acquire('session')
+            admission.release()
+        with pytest.raises(Rejected):
+            await admission.acquire('session')
+        # Other sessions have limits of their own.
+        await admission.acquire('other')
+        clock.now = 61.0
+        await admission.acquire('session')
+
+    asyncio.run(scenario())
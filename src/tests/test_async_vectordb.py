@@ -0,0 +1,23 @@
+import asyncio
+
+import httpx
+import pytest
+
+from aimodelhub import async_vectordb
+
+
+def test_failed_query_raises_a_clear_error(monkeypatch):
+    def handler(request):
+        return httpx.Response(503, text="Service Unavailable")
+
+    async def scenario():
+        monkeypatch.setattr(async_vectordb, '_client', httpx.AsyncClient(
+            base_url='http://collections', transport=httpx.MockTransport(handler),
+        ))
+        try:
+            with pytest.raises(RuntimeError, match="503 - Service Unavailable"):
+                await async_vectordb.query_collection('missing-collection', 'When was the company founded?')
+        finally:
+            await async_vectordb.close_client()
+
+    asyncio.run(scenario())
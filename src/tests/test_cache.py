@@ -0,0 +1,91 @@
+from aimodelhub import cache
+from aimodelhub.cache import QueryCache
+
+
+class Time:
+    """
+    Stand-in for the time module of aimodelhub.cache with a clock moved by the tests.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    clock = Time()
+    monkeypatch.setattr(cache, 'time', clock)
+    queries = QueryCache(10, ttl=60)
+    queries.put(('collection', 3), 'When was the company founded?', ['result'])
+
+    clock.now += 59
+    assert queries.get(('collection', 3), 'when was the company founded') == ['result']
+    clock.now += 2
+    assert queries.get(('collection', 3), 'When was the company founded?') is None
+    assert queries.stats()['expirations'] == 1
+    assert queries.stats()['size'] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    queries = QueryCache(2, ttl=60)
+    queries.put(('collection',), 'first', 1)
+    queries.put(('collection',), 'second', 2)
+    queries.get(('collection',), 'first')
+    queries.put(('collection',), 'third', 3)
+
+    assert queries.get(('collection',), 'second') is None
+    assert queries.get(('collection',), 'first') == 1
+    assert queries.stats()['evictions'] == 1
+
+
+def test_invalidate_drops_the_entries_of_a_scope():
+    queries = QueryCache(10, ttl=60)
+    queries.put(('first', 3), 'query', 1)
+    queries.put(('first', 5), 'query', 2)
+    queries.put(('second', 3), 'query', 3)
+
+    queries.invalidate('first')
+    assert queries.get(('first', 3), 'query') is None
+    assert queries.get(('first', 5), 'query') is None
+    assert queries.get(('second', 3), 'query') == 3
+
+    queries.invalidate()
+    assert queries.get(('second', 3), 'query') is None
+
+
+def test_similar_queries_hit_within_their_scope():
+    queries = QueryCache(10, ttl=60, similarity_threshold=0.9)
+    queries.put(('first',), 'When was the company founded?', 1, [1.0, 0.0, 0.0])
+
+    assert queries.get(('first',), 'In which year was the company founded?', [0.99, 0.1, 0.0]) == 1
+    assert queries.get(('first',), 'Who founded the company?', [0.0, 1.0, 0.0]) is None
+    assert queries.get(('second',), 'In which year was the company founded?', [0.99, 0.1, 0.0]) is None
+    assert queries.stats()['semantic_hits'] == 1
+
+    queries.invalidate('first')
+    assert queries.get(('first',), 'In which year was the company founded?', [0.99, 0.1, 0.0]) is None
+
+
+def test_invalidations_reach_other_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_INVALIDATION_PATH', str(tmp_path))
+    monkeypatch.setattr(cache, 'CACHE_INVALIDATION_INTERVAL', 0)
+    # Two caches with the same name stand for the caches of two processes.
+    writer, reader = QueryCache(10, ttl=600, name='retrieval'), QueryCache(10, ttl=600, name='retrieval')
+    other = QueryCache(10, ttl=600, name='answer')
+    for queries in [writer, reader, other]:
+        queries.put(('first', 3), 'query', 1)
+        queries.put(('second', 3), 'query', 2)
+
+    writer.invalidate('first')
+    assert reader.get(('first', 3), 'query') is None
+    assert reader.get(('second', 3), 'query') == 2
+    assert other.get(('first', 3), 'query') == 1
+
+    # Entries cached after the invalidation are kept.
+    reader.put(('first', 3), 'query', 3)
+    assert reader.get(('first', 3), 'query') == 3
@@ -0,0 +1,42 @@
+import asyncio
+from types import SimpleNamespace
+
+from nicegui import app, core, ui
+from nicegui.client import Client
+from nicegui.page import page
+
+from config import HISTORY_PAGE_SIZE
+from ui import components
+from ui.history import append_to_history
+
+
+async def chunks(texts, during=None):
+    for number, text in enumerate(texts):
+        if number == len(texts) // 2 and during is not None:
+            await during()
+        await asyncio.sleep(0)
+        yield SimpleNamespace(content=text)
+
+
+def test_streamed_answer_survives_loading_older_messages():
+    async def scenario():
+        core.loop = asyncio.get_running_loop()
+        client = Client(page('/'))
+        with client:
+            for turn in range(2 * HISTORY_PAGE_SIZE):
+                await append_to_history({'role': 'user' if turn % 2 else 'system', 'content': f'message {turn}', 'sent': bool(turn % 2)})
+            await components.show_chat()
+            message = await components.show_bot_message()
+            first_label = app.storage.client['labels'][message.position]
+
+            # Like scrolling to the top while the answer is streamed.
+            texts = [f'token {number} ' for number in range(10)]
+            await components.stream_to_last_message(chunks(texts, components.load_older_messages), message)
+
+            label = app.storage.client['labels'][message.position]
+            assert label is not first_label
+            assert label.text == ''.join(texts)
+            assert len(app.storage.client['labels']) > HISTORY_PAGE_SIZE
+        client.delete()
+
+    asyncio.run(scenario())
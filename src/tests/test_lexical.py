@@ -0,0 +1,43 @@
+import os
+
+from aimodelhub.lexical import LexicalIndex, write_lexical_index
+
+WORDS = ["revenue", "growth", "company", "founded", "office", "berlin", "report", "annual", "employees", "product"]
+
+
+def chunks():
+    for number in range(60):
+        words = [WORDS[(number * step) % len(WORDS)] for step in range(1, 8)] + [f"chunk{number}"]
+        yield {'file_name': f"file{number % 4}.pdf", 'content': " ".join(words), 'pages': [number % 9 + 1]}
+
+
+def read_files(path):
+    return {name: open(os.path.join(path, name), 'rb').read() for name in sorted(os.listdir(path))}
+
+
+def test_merged_runs_give_the_same_index(tmp_path):
+    assert write_lexical_index(str(tmp_path / "single"), chunks()) == 60
+    assert write_lexical_index(str(tmp_path / "runs"), chunks(), run_postings=20) == 60
+
+    assert read_files(tmp_path / "single") == read_files(tmp_path / "runs")
+    single, runs = LexicalIndex(str(tmp_path / "single")), LexicalIndex(str(tmp_path / "runs"))
+    for query in ["company founded in berlin", "annual revenue growth", "chunk17", "unknown"]:
+        assert single.search(query, 5) == runs.search(query, 5)
+
+
+def test_search_ranks_the_matching_chunk_first(tmp_path):
+    write_lexical_index(str(tmp_path), chunks())
+    index = LexicalIndex(str(tmp_path))
+
+    results = index.search("chunk17 report", 3)
+    assert results[0]['file_name'] == "file1.pdf"
+    assert "chunk17" in results[0]['content']
+    assert list(results[0]['pages']) == [9]
+    assert index.search("unknown words", 3) == []
+
+
+def test_empty_index(tmp_path):
+    assert write_lexical_index(str(tmp_path), []) == 0
+    index = LexicalIndex(str(tmp_path))
+    assert len(index) == 0
+    assert index.search("company", 3) == []
@@ -0,0 +1,42 @@
+import json
+
+from aimodelhub import manifest
+
+
+def test_manifests_are_kept_per_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, 'LEGACY_MANIFEST', str(tmp_path / 'manifest.json'))
+    path = str(tmp_path / 'manifests')
+    manifest.save_manifest({'collection_id': 'first', 'files': {'a.txt': {}}}, path)
+    manifest.save_manifest({'collection_id': 'second', 'files': {'b.txt': {}}}, path)
+
+    assert manifest.load_manifest('first', path)['files'] == {'a.txt': {}}
+    assert manifest.load_manifest('second', path)['files'] == {'b.txt': {}}
+    assert manifest.load_manifest('third', path) is None
+
+    manifest.delete_manifest('first', path)
+    assert manifest.load_manifest('first', path) is None
+    assert manifest.load_manifest('second', path) is not None
+
+
+def test_manifest_of_another_collection_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, 'LEGACY_MANIFEST', str(tmp_path / 'manifest.json'))
+    path = str(tmp_path / 'manifests')
+    manifest.save_manifest({'collection_id': 'first', 'files': {}}, path)
+    (tmp_path / 'manifests' / 'first.json').rename(tmp_path / 'manifests' / 'second.json')
+
+    assert manifest.load_manifest('second', path) is None
+    assert manifest.update_collection('second', str(tmp_path), path=path) is None
+
+
+def test_legacy_manifest_of_the_collection_is_used(tmp_path, monkeypatch):
+    legacy = tmp_path / 'manifest.json'
+    legacy.write_text(json.dumps({'collection_id': 'first', 'files': {'a.txt': {}}}))
+    monkeypatch.setattr(manifest, 'LEGACY_MANIFEST', str(legacy))
+    path = str(tmp_path / 'manifests')
+
+    assert manifest.load_manifest('first', path)['files'] == {'a.txt': {}}
+    assert manifest.load_manifest('second', path) is None
+    manifest.delete_manifest('second', path)
+    assert legacy.exists()
+    manifest.delete_manifest('first', path)
+    assert not legacy.exists()
@@ -0,0 +1,26 @@
+import base64
+import json
+
+from aimodelhub.payloads import document_item, iter_base64, iter_document_body
+
+
+def test_base64_stream_matches_encoding_the_whole_text():
+    # Segments of every length modulo three, with multibyte characters split between them.
+    segments = ["a", "bc", "Größe ", "über", "", "€ 100", "x" * 7, "日本語"]
+    text = "".join(segments)
+
+    encoded = b"".join(iter_base64(segments))
+    assert encoded == base64.b64encode(text.encode('utf-8'))
+    assert base64.b64decode(encoded).decode('utf-8') == text
+
+
+def test_document_body_matches_the_document_item():
+    segments = ["First page of the \"report\".\n", "Zweite Seite: Größe ", "€"]
+
+    body = json.loads(b"".join(iter_document_body('report "2024".pdf', segments)))
+    assert body == {"type": "collection", "items": [document_item('report "2024".pdf', "".join(segments))]}
+
+
+def test_empty_document_body():
+    body = json.loads(b"".join(iter_document_body("empty.txt", [])))
+    assert body['items'][0]['properties']['content'] == ""
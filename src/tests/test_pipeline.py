@@ -0,0 +1,39 @@
+import asyncio
+
+from aimodelhub import pipeline
+from aimodelhub.metrics import Trace, chat_prefetch_errors
+
+DOCUMENTS = [{'content': 'The company was founded in 1988.', 'file_name': 'history.txt', 'score': 0.9}]
+
+
+def test_failed_prefetch_falls_back_to_retrieval(monkeypatch):
+    async def retrieve(query):
+        return DOCUMENTS
+
+    async def fail():
+        raise TimeoutError("collection did not answer")
+
+    async def scenario():
+        monkeypatch.setattr(pipeline, 'retrieve_relevant_documents', retrieve)
+        prefetched = asyncio.create_task(fail())
+        trace = Trace('test')
+        errors = chat_prefetch_errors.value
+        assert await pipeline.get_relevant_documents('When was the company founded?', trace, prefetched) == DOCUMENTS
+        assert chat_prefetch_errors.value == errors + 1
+        assert trace.fields['prefetched'] is False
+
+    asyncio.run(scenario())
+
+
+def test_prefetched_documents_are_used(monkeypatch):
+    async def retrieve(query):
+        raise AssertionError("retrieved again")
+
+    async def scenario():
+        monkeypatch.setattr(pipeline, 'retrieve_relevant_documents', retrieve)
+        prefetched = asyncio.create_task(asyncio.sleep(0, DOCUMENTS))
+        trace = Trace('test')
+        assert await pipeline.get_relevant_documents('When was the company founded?', trace, prefetched) == DOCUMENTS
+        assert trace.fields['prefetched'] is True
+
+    asyncio.run(scenario())
@@ -0,0 +1,24 @@
+from aimodelhub import registry
+from aimodelhub.registry import CollectionRegistry
+
+
+def test_unreadable_registry_keeps_the_collections_loaded_before(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, 'CHECK_INTERVAL', 0)
+    filename = tmp_path / 'collections.json'
+    collections = CollectionRegistry(str(filename), str(tmp_path / 'collection_id.txt'))
+    collections.register('manuals', 'id-1')
+    assert collections.collections() == {'manuals': 'id-1'}
+
+    filename.write_text('{"manuals": "id-1", "faq": ')
+    assert collections.collections() == {'manuals': 'id-1'}
+
+    filename.write_text('{"faq": "id-2"}')
+    assert collections.collections() == {'faq': 'id-2'}
+
+
+def test_unreadable_registry_falls_back_to_the_persisted_collection(tmp_path):
+    filename = tmp_path / 'collections.json'
+    filename.write_text('["manuals"]')
+    (tmp_path / 'collection_id.txt').write_text('id-1')
+    collections = CollectionRegistry(str(filename), str(tmp_path / 'collection_id.txt'))
+    assert collections.collections() == {'default': 'id-1'}
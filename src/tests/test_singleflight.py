@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from aimodelhub.singleflight import SharedStream, SingleFlight, StreamFanout
+
+
+async def numbers(count, opened=None, closed=None):
+    if opened is not None:
+        opened.append(True)
+    try:
+        for number in range(count):
+            await asyncio.sleep(0.001)
+            yield number
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_single_flight_shares_one_call():
+    async def scenario():
+        calls = []
+
+        async def query(text):
+            calls.append(text)
+            await asyncio.sleep(0.01)
+            return text.upper()
+
+        flight = SingleFlight()
+        results = await asyncio.gather(*[flight.run('key', query, 'answer') for _ in range(5)])
+        assert results == ['ANSWER'] * 5
+        assert calls == ['answer']
+        assert not flight.calls
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_caller_giving_up_does_not_cancel_the_call():
+    async def scenario():
+        async def query():
+            await asyncio.sleep(0.02)
+            return 'done'
+
+        flight = SingleFlight()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flight.run('key', query), 0.005)
+        assert await flight.run('key', query) == 'done'
+
+    asyncio.run(scenario())
+
+
+def test_late_subscriber_gets_all_chunks():
+    async def scenario():
+        shared = SharedStream(numbers(5))
+        first = asyncio.create_task(collect(shared.subscribe()))
+        await asyncio.sleep(0.003)
+        second = await collect(shared.subscribe())
+        assert await first == [0, 1, 2, 3, 4]
+        assert second == [0, 1, 2, 3, 4]
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_subscriber():
+    async def failing():
+        yield 'partial'
+        raise RuntimeError('LLM failed')
+
+    async def scenario():
+        shared = SharedStream(failing())
+        for result in await asyncio.gather(collect(shared.subscribe()), collect(shared.subscribe()), return_exceptions=True):
+            assert isinstance(result, RuntimeError)
+
+    asyncio.run(scenario())
+
+
+def test_stream_is_cancelled_once_the_last_subscriber_left():
+    async def scenario():
+        closed = []
+        shared = SharedStream(numbers(1000, closed=closed))
+        first, second = shared.subscribe(), shared.subscribe()
+        await first.__anext__()
+        await second.__anext__()
+        await first.aclose()
+        await asyncio.sleep(0.005)
+        assert not shared.task.done()
+        await second.aclose()
+        await asyncio.sleep(0.005)
+        assert shared.task.done() and closed
+
+    asyncio.run(scenario())
+
+
+def test_fanout_opens_one_stream_per_key():
+    async def scenario():
+        opened, closes = [], []
+        fanout = StreamFanout()
+        streams = [fanout.stream('key', lambda: numbers(3, opened), lambda: closes.append(True)) for _ in range(3)]
+        assert fanout.running('key')
+        results = await asyncio.gather(*[collect(stream) for stream in streams])
+        await asyncio.sleep(0)
+        assert results == [[0, 1, 2]] * 3
+        assert len(opened) == 1
+        assert closes == [True]
+        assert not fanout.running('key')
+
+    asyncio.run(scenario())
+
+
+def test_fanout_calls_on_close_for_a_stream_cancelled_before_it_started():
+    async def scenario():
+        opened, closes = [], []
+        fanout = StreamFanout()
+        fanout.stream('key', lambda: numbers(3, opened), lambda: closes.append(True))
+        task = fanout.streams['key'].task
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert closes == [True]
+        assert not opened
+        assert not fanout.running('key')
+
+    asyncio.run(scenario())
@@ -0,0 +1,95 @@
+import pytest
+
+from ui.store import KeyValueHistoryStore, MemoryHistoryStore, Message, SQLiteHistoryStore
+
+
+class ListKeyValue:
+    """
+    In-memory stand-in for RedisKeyValue with the semantics of the Redis list commands.
+    """
+
+    def __init__(self):
+        self.lists = {}
+
+    def exists(self, key):
+        return key in self.lists
+
+    def reset(self, key, values, ttl):
+        self.lists.pop(key, None)
+        if values:
+            self.lists[key] = list(values)
+
+    def append(self, key, value, ttl):
+        self.lists.setdefault(key, []).append(value)
+        return len(self.lists[key])
+
+    def set(self, key, index, value, ttl):
+        if key not in self.lists:
+            raise KeyError(key)
+        if index >= len(self.lists[key]):
+            return False
+        self.lists[key][index] = value
+        return True
+
+    def range(self, key, start, end):
+        values = self.lists.get(key, [])
+        return values[start:None if end == -1 else end + 1]
+
+    def length(self, key):
+        return len(self.lists.get(key, []))
+
+    def delete(self, key):
+        self.lists.pop(key, None)
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'kv'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteHistoryStore(str(tmp_path / 'history.db'))
+    if request.param == 'kv':
+        return KeyValueHistoryStore(ListKeyValue())
+    return MemoryHistoryStore()
+
+
+def contents(messages):
+    return [message['content'] for message in messages]
+
+
+def test_page_and_tail(store):
+    store.reset('session', [Message('developer', 'instructions')])
+    for number in range(1, 10):
+        assert store.append('session', Message('user', f'message {number}', sent=True)) == number
+
+    assert store.count('session') == 10
+    assert contents(store.page('session', 3, 6)) == ['message 3', 'message 4', 'message 5']
+    assert contents(store.page('session', 8, 20)) == ['message 8', 'message 9']
+    assert store.page('session', 5, 5) == []
+    assert store.tail('session', 3)[0] == 7
+    assert contents(store.tail('session', 3)[1]) == ['message 7', 'message 8', 'message 9']
+    assert store.tail('session', 20)[0] == 0
+    assert store.page('session', 1, 2)[0]['sent'] is True
+
+
+def test_replace_keeps_position(store):
+    store.reset('session', [Message('developer', 'instructions')])
+    answer = Message('system', '')
+    position = store.append('session', answer)
+    # Another page of the same session appends a message in the meantime.
+    store.append('session', Message('user', 'newer question'))
+
+    answer['content'] = 'streamed answer'
+    store.replace('session', position, answer)
+
+    assert contents(store.messages('session')) == ['instructions', 'streamed answer', 'newer question']
+
+
+def test_missing_history(store):
+    assert not store.exists('session')
+    for call in [lambda: store.count('session'), lambda: store.page('session', 0, 2),
+                 lambda: store.replace('session', 0, Message('system', 'answer'))]:
+        with pytest.raises(KeyError):
+            call()
+
+    store.reset('session', [Message('developer', 'instructions')])
+    store.delete('session')
+    assert not store.exists('session')
@@ -1,13 +1,29 @@
-from nicegui import app, ui
-from langchain_openai import ChatOpenAI
+import asyncio
+from nicegui import app, context, ui
+import time
 from datetime import datetime
 
 from config import (
     CHAT_BOT_IMAGE, CHAT_BOT_NAME, CHAT_HEADER_TITLE, CHAT_HEADER_COLOR,
     CHAT_FOOTER_PLACEHOLDER, CHAT_FOOTER_COLOR, CHAT_USER_IMAGE, CHAT_USER_NAME,
-    IONOS_API_TOKEN, LLM_NAME, LLM_BASE_URL, 
+    CHAT_INCREMENTAL_STREAMING, CHAT_STREAM_FLUSH_INTERVAL, CHAT_STREAM_FLUSH_CHARS, CHAT_STREAM_SAVE_INTERVAL, HISTORY_PAGE_SIZE, CHAT_PREFETCH,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_FIRST_TURN_ONLY, REQUEST_COALESCING,
+    CHAT_QUEUE_MESSAGE, CHAT_OVERLOAD_MESSAGE, CHAT_RATE_LIMIT_MESSAGE, CHAT_CANCEL_GENERATION, CHAT_TRUNCATED_SUFFIX,
 )
-from ui.history import append_to_history, get_history, get_llm_prompt
+from aimodelhub.admission import Rejected
+from aimodelhub.answers import cache_answer, get_cached_answer, replay_answer, shared_answer
+from aimodelhub.llm import get_llm
+from aimodelhub.metrics import (
+    Trace, chat_cancelled, chat_errors, chat_rejected_overloaded, chat_rejected_rate_limited, chat_requests, chat_saved_tokens,
+)
+from aimodelhub.pipeline import get_relevant_documents
+from aimodelhub.tokens import count_tokens
+from ui.history import (
+    append_to_history, count_history, get_history_tail, get_llm_prompt, get_session_id,
+    is_first_turn, save_message,
+)
+from ui.prefetch import start_prefetch, take_prefetch
+from ui.streaming import ChunkBuffer
 
 
 def show_header():
@@ -28,6 +44,7 @@ def show_header():
 def show_footer():
     """
     Display the footer of the chat window with the input element for messages.
+    With CHAT_PREFETCH, documents are already retrieved while the user is typing.
     """
     with (
         ui.footer().style(f'background-color: {CHAT_FOOTER_COLOR}'), 
@@ -35,22 +52,117 @@ def show_footer():
     ):
         with ui.row().classes('w-full no-wrap items-center'):
             (
-                ui.input(placeholder=CHAT_FOOTER_PLACEHOLDER)
+                ui.input(
+                    placeholder=CHAT_FOOTER_PLACEHOLDER,
+                    on_change=(lambda event: start_prefetch(event.value)) if CHAT_PREFETCH else None,
+                )
                   .on('keydown.enter', lambda event: post_message(event.sender))
                   .props("rounded outlined input-class=mx-3 size=100")
             )
 
 
-@ui.refreshable
-def show_chat():
+# Loads older messages once the page is scrolled to the top. The height of the
+# page is remembered, so that the scroll position can be restored afterwards.
+SCROLL_SCRIPT = """
+<script>
+window.addEventListener('scroll', () => {
+    if (window.scrollY === 0 && document.body.scrollHeight > window.innerHeight) {
+        window.chatScrollHeight = document.body.scrollHeight;
+        emitEvent('load_older_messages');
+    }
+});
+</script>
+"""
+
+
+async def show_chat():
+    """
+    Display the chat messages of the current client and scroll to the end of the chat window.
+    """
+    app.storage.client['chat'] = ui.column().classes('w-full max-w-2xl mx-auto items-stretch')
+    await refresh_chat()
+
+
+async def refresh_chat(scroll=True):
     """
-    Display all chat messages and scroll to the end of the chat window.
+    Re-renders the newest chat messages of the current client.
+
+    Only the last messages are rendered, older ones are loaded page by page with a
+    button or by scrolling to the top. The text elements of the messages are
+    remembered by position in the client storage, so that a streamed answer can be
+    updated without re-rendering the whole chat.
+    Args:
+        scroll (bool, optional): Scroll to the end of the chat.
     """
-    with ui.column().classes('w-full max-w-2xl mx-auto items-stretch'):
-        for entry in get_history():
+    visible = app.storage.client.get('visible_messages', HISTORY_PAGE_SIZE)
+    # One more message tells whether there are older messages to load.
+    start, messages = await get_history_tail(visible + 1)
+    older = None
+    if len(messages) > visible:
+        older, messages, start = messages[0], messages[1:], start + 1
+    container = app.storage.client['chat']
+    container.clear()
+    labels = {}
+    with container:
+        # The instructions at the start of the history are never displayed.
+        if older is not None and older['role'] != 'developer':
+            (
+                ui.button('Load older messages')
+                  .props('flat no-caps')
+                  .on('click', js_handler="""() => {
+                      window.chatScrollHeight = document.body.scrollHeight;
+                      emitEvent('load_older_messages');
+                  }""")
+            )
+        for position, entry in enumerate(messages, start=start):
             if entry['role'] in ['system', 'user']:
-                display_message(entry)     
-        ui.run_javascript('window.scrollTo(0, document.body.scrollHeight)')
+                labels[position] = display_message(entry)
+        app.storage.client['labels'] = labels
+        if scroll:
+            scroll_to_end()
+
+
+def init_chat():
+    """
+    Registers the handler loading older messages in the current page.
+    """
+    ui.add_body_html(SCROLL_SCRIPT)
+    ui.on('load_older_messages', load_older_messages)
+
+
+async def load_older_messages():
+    """
+    Renders HISTORY_PAGE_SIZE more messages and keeps the messages in view which
+    were visible before.
+    """
+    visible = app.storage.client.get('visible_messages', HISTORY_PAGE_SIZE)
+    if visible >= await count_history():
+        return
+    app.storage.client['visible_messages'] = visible + HISTORY_PAGE_SIZE
+    await refresh_chat(scroll=False)
+    ui.run_javascript(
+        'setTimeout(() => window.scrollTo(0, document.body.scrollHeight - (window.chatScrollHeight || 0)), 0)'
+    )
+
+
+def scroll_to_end():
+    """
+    Scroll the browser window to the end of the chat.
+    """
+    ui.run_javascript('window.scrollTo(0, document.body.scrollHeight)')
+
+
+def show_message_text(message):
+    """
+    Updates the text of a message in the browser. The element showing it is looked
+    up on every update, as refresh_chat replaces the elements, e.g. when older
+    messages are loaded while an answer is streamed.
+    Args:
+        message (Message): The message as returned by append_to_history.
+    """
+    label = app.storage.client.get('labels', {}).get(message.position)
+    if label is not None:
+        label.set_text(message['content'])
 
 
 def display_message(message: dict):
@@ -58,13 +170,16 @@ def display_message(message: dict):
     Takes a message from the chat history and displays it in the chat window.
     Args:
         massage (dict): The content of the message.
+    Returns:
+        ui.label: The element holding the text of the message.
     """
-    ui.chat_message(message['content'],
+    with ui.chat_message(
         name=get_sender(message['role']),
         sent=message['sent'],
         stamp=get_time_delta(message['time']) if 'time' in message else '',
         avatar=get_avatar(message['role'])
-    ).style('size: 12; width: 100%').classes('justify-center')
+    ).style('size: 12; width: 100%').classes('justify-center'):
+        return ui.label(message['content']).classes('whitespace-pre-wrap')
 
 
 def get_time_delta(time_string):
@@ -117,44 +232,202 @@ async def post_message(query_field):
     """
     Invoked after the user clicks 'enter' in the input field. Adds
     the typed message to the message history, generates the LLM 
-    answer and displays everything in the chat window.
+    answer and displays everything in the chat window. The time spent
+    in every step is measured and exported as metrics. Answers to
+    frequently asked questions are replayed from the answer cache, and
+    identical questions asked at the same time share one answer. While
+    the answer waits for a free slot of the LLM, its place in the queue
+    is shown; messages which are not admitted get a friendly answer.
+    An answer still being generated for the previous message is stopped.
     Args:
         query_field (ui.input): Field capturing the user input.
     """
+    trace = Trace('chat')
     query = query_field.value
+    prefetched = take_prefetch(query)
     query_field.value = ''
-    show_user_message(query)
-    show_bot_message()
-
-    llm = ChatOpenAI(
-        model_name=LLM_NAME, 
-        streaming=True, 
-        base_url=LLM_BASE_URL, 
-        openai_api_key=IONOS_API_TOKEN
-    )
-    async for chunk in llm.astream(get_llm_prompt(query)):
-        get_history()[-1]['content'] += chunk.content
-        show_chat.refresh()
+    if CHAT_CANCEL_GENERATION:
+        await cancel_generation()
+        app.storage.client['generation'] = asyncio.current_task()
+    cacheable = ANSWER_CACHE_ENABLED and (await is_first_turn() or not ANSWER_CACHE_FIRST_TURN_ONLY)
+    with trace.span('ui_update_seconds'):
+        await show_user_message(query)
+        message = await show_bot_message()
 
+    def show_position(position):
+        label = app.storage.client['labels'].get(message.position)
+        if label is not None:
+            label.set_text(CHAT_QUEUE_MESSAGE.format(position=position))
 
-def show_user_message(query):
+    try:
+        relevant_docs = await get_relevant_documents(query, trace, prefetched)
+        cached = await get_cached_answer(query, relevant_docs) if cacheable else None
+        trace.set('cached', cached is not None)
+        if cached is None:
+            prompt = await get_llm_prompt(query, trace, relevant_docs=relevant_docs)
+            session_id = get_session_id()
+            if cacheable and REQUEST_COALESCING:
+                stream = await shared_answer(query, relevant_docs, prompt, session_id, show_position)
+            else:
+                stream = get_llm().astream(prompt, session_id, show_position)
+        else:
+            stream = replay_answer(cached['answer'])
+        stream_start = time.perf_counter()
+        stream = measure_stream(stream, trace)
+        if CHAT_INCREMENTAL_STREAMING:
+            await stream_to_last_message(stream, message, trace)
+        else:
+            async for chunk in stream:
+                message['content'] += chunk.content
+                with trace.span('ui_update_seconds'):
+                    await save_message(message)
+                    await refresh_chat()
+    except asyncio.CancelledError:
+        await mark_truncated(message)
+        trace.finish(cancelled=True)
+        raise
+    except Rejected as rejection:
+        await show_rejection(message, rejection.reason)
+        trace.finish(rejected=rejection.reason)
+        return
+    except Exception as error:
+        chat_errors.inc()
+        trace.finish(error=repr(error))
+        raise
+
+    chat_requests.inc()
+    stream_seconds = time.perf_counter() - stream_start
+    trace.set('stream_seconds', stream_seconds)
+    answer_tokens = count_tokens(message['content'])
+    trace.set('answer_tokens', answer_tokens)
+    if cached is not None:
+        chat_saved_tokens.inc(cached['prompt_tokens'] + cached['answer_tokens'])
+    else:
+        if 'time_to_first_token_seconds' in trace.fields:
+            generation_seconds = trace.elapsed() - trace.fields['time_to_first_token_seconds']
+            if generation_seconds > 0:
+                trace.set('tokens_per_second', answer_tokens / generation_seconds)
+        if cacheable and message['content'].strip():
+            await cache_answer(query, relevant_docs, message['content'], trace.fields['prompt_tokens'], answer_tokens)
+    trace.finish()
+
+
+async def measure_stream(stream, trace):
+    """
+    Passes the chunks of a stream through and records the time to the first chunk.
+    Args:
+        stream (AsyncIterator): The chunks streamed by the LLM.
+        trace (Trace): The measurements of the request.
+    Yields:
+        The chunks of the stream.
+    """
+    async for chunk in stream:
+        if 'time_to_first_token_seconds' not in trace.fields:
+            trace.set('time_to_first_token_seconds', trace.elapsed())
+        yield chunk
+
+
+async def stream_to_last_message(stream, message, trace=None):
+    """
+    Appends the chunks of a streamed answer to the last message in the history and
+    updates only the text of that message in the browser. Chunks are coalesced, so
+    the browser is updated at most once per CHAT_STREAM_FLUSH_INTERVAL unless
+    CHAT_STREAM_FLUSH_CHARS characters have been collected in the meantime. The
+    history store is only updated every CHAT_STREAM_SAVE_INTERVAL seconds and once
+    the answer is complete.
+    Args:
+        stream (AsyncIterator): The chunks streamed by the LLM.
+        message (Message): The last message in the history.
+        trace (Trace, optional): Measurements of the request, which get the time spent updating the UI.
+    """
+    trace = trace or Trace('chat')
+    buffer = ChunkBuffer(CHAT_STREAM_FLUSH_INTERVAL, CHAT_STREAM_FLUSH_CHARS)
+    saved = time.monotonic()
+    async for chunk in stream:
+        message['content'] += chunk.content
+        if buffer.add(chunk.content):
+            with trace.span('ui_update_seconds'):
+                show_message_text(message)
+                if time.monotonic() - saved >= CHAT_STREAM_SAVE_INTERVAL:
+                    await save_message(message)
+                    saved = time.monotonic()
+                scroll_to_end()
+    with trace.span('ui_update_seconds'):
+        show_message_text(message)
+        await save_message(message)
+        scroll_to_end()
+
+
+async def cancel_generation(client=None):
+    """
+    Stops the answer being generated for a client, e.g. once it was deleted, and
+    waits until the answer is marked as truncated. The LLM stream is closed, unless
+    the answer is shared with another chat.
+    Args:
+        client (nicegui.Client, optional): The client. Defaults to the current client.
+    """
+    generation = (client or context.client).storage.get('generation')
+    if generation is not None and not generation.done() and generation is not asyncio.current_task():
+        generation.cancel()
+        await asyncio.wait([generation])
+
+
+async def mark_truncated(message):
+    """
+    Marks an answer which was stopped before it was complete, in the history and in the browser.
+    Once the client is deleted, its history may be gone already and the browser is not updated.
+    Args:
+        message (Message): The last message in the history.
+    """
+    chat_cancelled.inc()
+    message['content'] = (message['content'] + CHAT_TRUNCATED_SUFFIX).strip()
+    try:
+        await save_message(message)
+    except KeyError:
+        # The history was deleted with the client, see launch_ui.py.
+        pass
+    show_message_text(message)
+
+
+async def show_rejection(message, reason):
+    """
+    Answers a message which was not admitted to the LLM with a friendly explanation.
+    Args:
+        message (Message): The last message in the history.
+        reason (str): 'overloaded' or 'rate_limited', see aimodelhub.admission.Rejected.
+    """
+    if reason == 'rate_limited':
+        chat_rejected_rate_limited.inc()
+        message['content'] = CHAT_RATE_LIMIT_MESSAGE
+    else:
+        chat_rejected_overloaded.inc()
+        message['content'] = CHAT_OVERLOAD_MESSAGE
+    await save_message(message)
+    show_message_text(message)
+    print(f"Message not admitted: {reason}")
+
+
+async def show_user_message(query):
     """
     Formats a query entered by the user and adds it to the history list.
     Args:
         query (str): Message entered by the user.
     """
-    append_to_history({
+    await append_to_history({
         'role': 'user', 
         'content': query, 
         'sent': True, 
         'time': datetime.strftime(datetime.now(), "%Y-%m-%dT%H:%M:%S")
     })
-    show_chat.refresh()
+    await refresh_chat()
 
 
-def show_bot_message():
+async def show_bot_message():
     """
     Adds an empty message to the history list.
+    Returns:
+        Message: The message to which the answer is streamed.
     """
-    append_to_history({'role': 'system', 'content': '', 'sent': False})
-    show_chat.refresh()
+    message = await append_to_history({'role': 'system', 'content': '', 'sent': False})
+    await refresh_chat()
+    return message
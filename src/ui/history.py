@@ -1,57 +1,181 @@
-from nicegui import app
-from config import CHAT_INSTRUCTIONS, CHAT_INITIAL_QUESTION
-from aimodelhub.vectordb import retrieve_documents, retrieve_id
+import asyncio
 
-def get_history():
+from nicegui import context
+from config import CHAT_INSTRUCTIONS, CHAT_INITIAL_QUESTION, HISTORY_IDLE_TIMEOUT
+from aimodelhub import pipeline
+from ui.store import Message, get_store
+
+
+def get_session_id():
+    """
+    The chat is identified by the browser session, if the history store is shared
+    by all workers and persistent, so that it survives page reloads and restarts.
+    Otherwise, and for clients without a browser session, every page has its own chat.
+    Returns:
+        str: The ID of the chat shown to the current client.
+    """
+    client = context.client
+    if get_store().persistent:
+        try:
+            request = client.request
+        except RuntimeError:
+            request = None
+        if request is not None and 'session' in request.scope and 'id' in request.session:
+            return request.session['id']
+    return client.id
+
+
+async def call_store(method, *args):
+    """
+    Calls a method of the history store. Stores outside the process memory block
+    on I/O, e.g. while another worker holds the write lock of the database, so
+    their methods run in a thread and do not hold up the other clients.
+    Args:
+        method (str): The name of the method.
+        *args: The arguments of the method.
+    Returns:
+        The result of the method.
+    """
+    store = get_store()
+    if store.persistent:
+        return await asyncio.to_thread(getattr(store, method), *args)
+    return getattr(store, method)(*args)
+
+
+async def call_history(method, *args):
+    """
+    Calls a method of the history store for the current chat, whose history is
+    initialised first if it does not exist yet.
+    Args:
+        method (str): The name of the method.
+        *args: The arguments after the session ID.
+    Returns:
+        The result of the method.
+    """
+    session_id = get_session_id()
+    try:
+        return await call_store(method, session_id, *args)
+    except KeyError:
+        await init_history()
+        return await call_store(method, session_id, *args)
+
+
+async def get_history():
     """
     Complete chat history in the current chat.
     Returns:
-        str: Chat history.
+        list: Chat history.
+    """
+    return await call_history('messages')
+
+
+async def get_history_page(start, end):
+    """
+    Part of the chat history in the current chat.
+    Args:
+        start (int): Position of the first message.
+        end (int): Position after the last message.
+    Returns:
+        list: The messages from start to end.
+    """
+    return await call_history('page', start, end)
+
+
+async def get_history_tail(limit):
+    """
+    Newest messages of the current chat, used to render only them.
+    Args:
+        limit (int): Maximum number of messages.
+    Returns:
+        tuple: The position of the first message and the messages.
+    """
+    return await call_history('tail', limit)
+
+
+async def count_history():
+    """
+    Returns:
+        int: The number of messages in the current chat, including the instructions.
     """
-    if 'history' not in app.storage.client:
-        init_history()
+    return await call_history('count')
 
-    return app.storage.client['history']
 
+async def is_first_turn():
+    """
+    Returns:
+        bool: True, if the user did not send a message in the current chat yet.
+    """
+    # The history starts with the instructions and the initial question.
+    return not any(message['role'] == 'user' for message in await get_history_page(0, 3))
 
-def init_history():
+
+async def init_history():
     """
     Initialises / resets the history of the chat.
 
     Namely, it replaces the chat history with the instructions to the LLM and the
     question to be initially displayed to the user.
     """
-    app.storage.client['history'] = [ 
-        {'role': 'developer', 'content': CHAT_INSTRUCTIONS, 'sent': False},
-        {'role': 'system', 'content': CHAT_INITIAL_QUESTION, 'sent': False}  
-    ]
+    await call_store('reset', get_session_id(), [
+        Message('developer', CHAT_INSTRUCTIONS, sent=False),
+        Message('system', CHAT_INITIAL_QUESTION, sent=False),
+    ])
 
 
-def append_to_history(message):
+async def append_to_history(message):
     """
     Appends a new message to the chat history list.
     Args:
         message (dict): message to append.
+    Returns:
+        Message: The message as kept in the history.
+    """
+    record = Message.from_dict(message)
+    record.position = await call_history('append', record)
+    return record
+
+
+async def save_message(message):
+    """
+    Stores changes of a message of the chat, e.g. of an answer being streamed. The
+    message keeps its position, even if another page of the same browser session
+    appended messages in the meantime.
+    Args:
+        message (Message): The message as returned by append_to_history.
+    """
+    await call_store('replace', get_session_id(), message.position, message)
+
+
+def delete_history(client):
     """
-    history = get_history()
-    history.append(message)
-    app.storage.client['history'] = history
+    Drops the history of a chat, once its client is deleted. Histories of persistent
+    stores are kept for the next page of the browser and evicted once idle.
+    Args:
+        client (nicegui.Client): The deleted client.
+    """
+    if not get_store().persistent:
+        get_store().delete(client.id)
 
 
-def get_llm_prompt(query):
+async def evict_idle_histories():
     """
-    Takes a query as input, searches for all relevant documents in the vector database
-    and appends it to the chat history. The result is returned as prompt for the LLM.
+    Drops the histories of chats without activity for HISTORY_IDLE_TIMEOUT seconds.
+    """
+    evicted = await call_store('evict', HISTORY_IDLE_TIMEOUT)
+    if evicted:
+        print(f"Evicted {evicted} idle chat histories.")
+
+
+async def get_llm_prompt(query, trace=None, prefetched=None, relevant_docs=None):
+    """
+    Builds the prompt answering a query with the history of the current chat, see
+    aimodelhub.pipeline.get_llm_prompt.
     Args:
         query (str): Query the user entered into the chat window.
+        trace (Trace, optional): Measurements of the request.
+        prefetched (asyncio.Task, optional): Retrieval started while the user was typing.
+        relevant_docs (list, optional): Documents already retrieved for the query.
     Returns:
         list: Prompt to be used as the input of the LLM.
     """
-    relevant_docs = retrieve_documents(collection_id=retrieve_id(), query_string=query)
-    print(f"The most relevant content is in files: {[entry['file_name'] for entry in relevant_docs]}")
-    prompt = [
-        {"role": "system", "content": "; ".join([entry['content'] for entry in relevant_docs])},
-    ]
-    prompt.extend(get_history())
-
-    return prompt
\ No newline at end of file
+    return await pipeline.get_llm_prompt(query, await get_history(), trace, prefetched, relevant_docs)
@@ -0,0 +1,86 @@
+import asyncio
+import difflib
+
+from nicegui import app, background_tasks
+
+from config import CHAT_PREFETCH_DEBOUNCE, CHAT_PREFETCH_MIN_CHARS, CHAT_PREFETCH_SIMILARITY
+from aimodelhub.cache import normalize_query
+from aimodelhub.metrics import chat_prefetch_hits, chat_prefetch_misses
+from aimodelhub.pipeline import retrieve_relevant_documents
+
+
+def query_similarity(a, b):
+    """
+    Args:
+        a (str): First query.
+        b (str): Second query.
+    Returns:
+        float: Similarity of the normalized queries from 0 (different) to 1 (equal).
+    """
+    return difflib.SequenceMatcher(None, normalize_query(a), normalize_query(b)).ratio()
+
+
+class Prefetch:
+    """
+    Retrieval of the documents for the text typed so far. It waits for
+    CHAT_PREFETCH_DEBOUNCE seconds without typing before the retrieval starts.
+    """
+    __slots__ = ('query', 'started', 'task')
+
+    def __init__(self, query):
+        """
+        Args:
+            query (str): The text typed so far.
+        """
+        self.query = query
+        self.started = False
+        self.task = background_tasks.create(self.run(), name='prefetch')
+
+    async def run(self):
+        await asyncio.sleep(CHAT_PREFETCH_DEBOUNCE)
+        self.started = True
+        return await retrieve_relevant_documents(self.query)
+
+
+def start_prefetch(query):
+    """
+    Invoked whenever the text in the input field changes. The prefetch of the
+    previous text is cancelled and the documents for the new text are retrieved
+    once the user stopped typing for CHAT_PREFETCH_DEBOUNCE seconds.
+    Args:
+        query (str): The text typed so far.
+    """
+    cancel_prefetch()
+    if len((query or '').strip()) < CHAT_PREFETCH_MIN_CHARS:
+        return
+    app.storage.client['prefetch'] = Prefetch(query)
+
+
+def cancel_prefetch():
+    """
+    Cancels the prefetch of the current client, if there is one.
+    """
+    entry = app.storage.client.pop('prefetch', None)
+    if entry is not None:
+        entry.task.cancel()
+
+
+def take_prefetch(query):
+    """
+    Hands the prefetch of the current client over to the message being sent.
+    Prefetches of a query too different from the final one, or which are still
+    waiting for the user to stop typing, are cancelled.
+    Args:
+        query (str): The final query.
+    Returns:
+        asyncio.Task: The retrieval of the documents or None, if the documents have to be retrieved again.
+    """
+    entry = app.storage.client.pop('prefetch', None)
+    if entry is None:
+        return None
+    if entry.started and query_similarity(entry.query, query) >= CHAT_PREFETCH_SIMILARITY:
+        chat_prefetch_hits.inc()
+        return entry.task
+    entry.task.cancel()
+    chat_prefetch_misses.inc()
+    return None
@@ -0,0 +1,534 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from config import HISTORY_BACKEND, HISTORY_DATABASE, HISTORY_IDLE_TIMEOUT, HISTORY_KV_PREFIX, HISTORY_KV_URL
+
+# Seconds between two updates of the access time of a session when its history is read.
+TOUCH_INTERVAL = 10.0
+
+# Process-wide history store, created on first use.
+_store = None
+
+
+class Message:
+    """
+    A single chat message. Item access (message['content']) is supported, so
+    that messages can be used like the dicts they replace. Messages appended by
+    this process know their position in the history, which is not stored.
+    """
+    FIELDS = ('role', 'content', 'sent', 'time')
+    __slots__ = FIELDS + ('position',)
+
+    def __init__(self, role, content, sent=False, time=None):
+        self.role = role
+        self.content = content
+        self.sent = sent
+        self.time = time
+        self.position = None
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS and getattr(self, key) is not None
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The fields of the message which are set.
+        """
+        return {key: getattr(self, key) for key in self.FIELDS if getattr(self, key) is not None}
+
+    @classmethod
+    def from_dict(cls, message):
+        """
+        Args:
+            message (dict): A message with 'role', 'content' and optionally 'sent' and 'time'.
+        Returns:
+            Message: The message record.
+        """
+        return cls(message['role'], message['content'], message.get('sent', False), message.get('time'))
+
+
+class MemoryHistoryStore:
+    """
+    Keeps the chat history of every session in process memory as lists of
+    compact Message records.
+    """
+    # Histories are lost with the process and only visible to it.
+    persistent = False
+
+    class Session:
+        __slots__ = ('messages', 'last_access')
+
+        def __init__(self, messages):
+            self.messages = messages
+            self.last_access = time.monotonic()
+
+    def __init__(self):
+        self.sessions = {}
+
+    def get_session(self, session_id):
+        session = self.sessions[session_id]
+        session.last_access = time.monotonic()
+        return session
+
+    def exists(self, session_id):
+        """
+        Args:
+            session_id (str): The ID of the chat session.
+        Returns:
+            bool: True, if the store holds a history for the session.
+        """
+        return session_id in self.sessions
+
+    def reset(self, session_id, messages):
+        """
+        Replaces the history of a session.
+        Args:
+            session_id (str): The ID of the chat session.
+            messages (list): The new messages.
+        """
+        self.sessions[session_id] = self.Session(list(messages))
+
+    def append(self, session_id, message):
+        """
+        Appends a message to the history of a session.
+        Args:
+            session_id (str): The ID of the chat session.
+            message (Message): The message to append.
+        Returns:
+            int: The position of the message in the history.
+        """
+        messages = self.get_session(session_id).messages
+        messages.append(message)
+        return len(messages) - 1
+
+    def replace(self, session_id, position, message):
+        """
+        Persists changes of a message of a session, e.g. a streamed answer. Several
+        pages of a browser may share a session, so the newest message may be
+        another one by now. Messages in memory are changed in place, so there is
+        nothing to do.
+        Args:
+            session_id (str): The ID of the chat session.
+            position (int): The position of the message, as returned by append.
+            message (Message): The changed message.
+        """
+        self.get_session(session_id)
+
+    def messages(self, session_id):
+        """
+        Args:
+            session_id (str): The ID of the chat session.
+        Returns:
+            list: All messages of the session, oldest first.
+        """
+        return self.get_session(session_id).messages
+
+    def page(self, session_id, start, end):
+        """
+        Args:
+            session_id (str): The ID of the chat session.
+            start (int): Position of the first message.
+            end (int): Position after the last message.
+        Returns:
+            list: The messages from start to end, oldest first.
+        """
+        return self.get_session(session_id).messages[start:end]
+
+    def tail(self, session_id, limit):
+        """
+        Args:
+            session_id (str): The ID of the chat session.
+            limit (int): Maximum number of messages.
+        Returns:
+            tuple: The position of the first message and the newest messages, oldest first.
+        """
+        messages = self.get_session(session_id).messages
+        start = max(0, len(messages) - limit)
+        return start, messages[start:]
+
+    def count(self, session_id):
+        """
+        Args:
+            session_id (str): The ID of the chat session.
+        Returns:
+            int: The number of messages of the session.
+        """
+        return len(self.get_session(session_id).messages)
+
+    def delete(self, session_id):
+        """
+        Drops the history of a session.
+        Args:
+            session_id (str): The ID of the chat session.
+        """
+        self.sessions.pop(session_id, None)
+
+    def evict(self, max_idle):
+        """
+        Drops the histories of sessions without access for max_idle seconds.
+        Args:
+            max_idle (float): Seconds a session may stay idle.
+        Returns:
+            int: The number of evicted sessions.
+        """
+        threshold = time.monotonic() - max_idle
+        idle = [session_id for session_id, session in self.sessions.items() if session.last_access < threshold]
+        for session_id in idle:
+            del self.sessions[session_id]
+        return len(idle)
+
+
+class SQLiteHistoryStore:
+    """
+    Keeps the chat history of every session in an SQLite database, so that only
+    the messages being rendered or sent to the LLM are held in memory. Implements
+    the methods of MemoryHistoryStore.
+
+    The database is opened in write-ahead log mode, so that several worker
+    processes on the same host share it: readers do not block the writer, and
+    writers wait up to `timeout` seconds for each other instead of failing. As
+    calls may block that long, the chat runs them in a thread, see ui.history.
+    """
+    persistent = True
+
+    def __init__(self, filename, timeout=5.0):
+        """
+        Args:
+            filename (str): The database file. It is created if it does not exist.
+            timeout (float, optional): Seconds to wait for a write lock held by another process.
+        """
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(filename, timeout=timeout, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, position INTEGER NOT NULL, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, sent INTEGER NOT NULL, time TEXT, "
+                "PRIMARY KEY (session_id, position)) WITHOUT ROWID"
+            )
+
+    def execute(self, sql, parameters=()):
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def touch(self, session_id):
+        """
+        Returns the size of the history of a session and updates its access time now
+        and then. Runs in the transaction of the read, with the lock held.
+        """
+        row = self.connection.execute(
+            "SELECT size, last_access FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        size, last_access = row
+        # Reads only write the access time now and then, so that workers sharing the
+        # database do not wait for each other's write locks on every render.
+        now = time.time()
+        if now - last_access > TOUCH_INTERVAL:
+            self.connection.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return size
+
+    def select(self, session_id, start, end):
+        rows = self.connection.execute(
+            "SELECT role, content, sent, time FROM messages "
+            "WHERE session_id = ? AND position >= ? AND position < ? ORDER BY position",
+            (session_id, start, end),
+        ).fetchall()
+        return [Message(role, content, bool(sent), time) for role, content, sent, time in rows]
+
+    def exists(self, session_id):
+        return bool(self.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)))
+
+    def reset(self, session_id, messages):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session_id, len(messages), time.time())
+            )
+            self.connection.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (session_id, position, message.role, message.content, message.sent, message.time)
+                    for position, message in enumerate(messages)
+                ],
+            )
+
+    def append(self, session_id, message):
+        with self.lock, self.connection:
+            size = self.connection.execute(
+                "UPDATE sessions SET size = size + 1, last_access = ? WHERE session_id = ? RETURNING size",
+                (time.time(), session_id),
+            ).fetchone()[0]
+            self.connection.execute(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, size - 1, message.role, message.content, message.sent, message.time),
+            )
+        return size - 1
+
+    def replace(self, session_id, position, message):
+        with self.lock, self.connection:
+            updated = self.connection.execute(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ?", (time.time(), session_id)
+            ).rowcount
+            if not updated:
+                raise KeyError(session_id)
+            self.connection.execute(
+                "UPDATE messages SET content = ? WHERE session_id = ? AND position = ?",
+                (message.content, session_id, position),
+            )
+
+    def messages(self, session_id):
+        with self.lock, self.connection:
+            return self.select(session_id, 0, self.touch(session_id))
+
+    def page(self, session_id, start, end):
+        with self.lock, self.connection:
+            self.touch(session_id)
+            return self.select(session_id, start, end)
+
+    def tail(self, session_id, limit):
+        with self.lock, self.connection:
+            size = self.touch(session_id)
+            start = max(0, size - limit)
+            return start, self.select(session_id, start, size)
+
+    def count(self, session_id):
+        with self.lock, self.connection:
+            return self.touch(session_id)
+
+    def delete(self, session_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self.connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def evict(self, max_idle):
+        with self.lock, self.connection:
+            idle = self.connection.execute(
+                "DELETE FROM sessions WHERE last_access < ? RETURNING session_id", (time.time() - max_idle,)
+            ).fetchall()
+            self.connection.executemany("DELETE FROM messages WHERE session_id = ?", idle)
+        return len(idle)
+
+
+class RedisKeyValue:
+    """
+    List interface of KeyValueHistoryStore backed by Redis (or a compatible server
+    like Valkey or KeyDB). Other key-value stores can be used by passing an object
+    with the same methods to KeyValueHistoryStore.
+    """
+
+    def __init__(self, url):
+        """
+        Args:
+            url (str): The URL of the server, e.g. 'redis://localhost:6379/0'.
+        """
+        if redis is None:
+            raise RuntimeError("The 'kv' history backend needs the redis package: pip install redis")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def exists(self, key):
+        """
+        Args:
+            key (str): The key of the list.
+        Returns:
+            bool: True, if the list exists and did not expire.
+        """
+        return bool(self.client.exists(key))
+
+    def reset(self, key, values, ttl):
+        """
+        Replaces a list.
+        Args:
+            key (str): The key of the list.
+            values (list): The new items.
+            ttl (float): Seconds until the list expires.
+        """
+        with self.client.pipeline() as pipeline:
+            pipeline.delete(key)
+            if values:
+                pipeline.rpush(key, *values)
+                pipeline.expire(key, max(1, int(ttl)))
+            pipeline.execute()
+
+    def append(self, key, value, ttl):
+        """
+        Appends an item to a list.
+        Args:
+            key (str): The key of the list.
+            value (str): The item.
+            ttl (float): Seconds until the list expires.
+        Returns:
+            int: The length of the list with the item.
+        """
+        with self.client.pipeline() as pipeline:
+            pipeline.rpush(key, value)
+            pipeline.expire(key, max(1, int(ttl)))
+            return pipeline.execute()[0]
+
+    def set(self, key, index, value, ttl):
+        """
+        Replaces an item of a list.
+        Args:
+            key (str): The key of the list.
+            index (int): The index of the item.
+            value (str): The new item.
+            ttl (float): Seconds until the list expires.
+        Returns:
+            bool: False, if the list is shorter than the index.
+        Raises:
+            KeyError: If the list does not exist.
+        """
+        try:
+            with self.client.pipeline() as pipeline:
+                pipeline.lset(key, index, value)
+                pipeline.expire(key, max(1, int(ttl)))
+                pipeline.execute()
+        except redis.ResponseError:
+            if not self.exists(key):
+                raise KeyError(key)
+            return False
+        return True
+
+    def range(self, key, start, end):
+        """
+        Args:
+            key (str): The key of the list.
+            start (int): Index of the first item, negative indexes count from the end.
+            end (int): Index of the last item, inclusive like LRANGE.
+        Returns:
+            list: The items.
+        """
+        return self.client.lrange(key, start, end)
+
+    def length(self, key):
+        """
+        Args:
+            key (str): The key of the list.
+        Returns:
+            int: The length of the list, 0 if it does not exist.
+        """
+        return self.client.llen(key)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class KeyValueHistoryStore:
+    """
+    Keeps the chat history of every session as a list of JSON encoded messages in
+    an external key-value store shared by all worker processes and hosts, so that
+    messages are appended, changed and read one by one. Lists expire after
+    HISTORY_IDLE_TIMEOUT seconds without changes, so the store evicts idle sessions
+    itself. Implements the methods of MemoryHistoryStore.
+    """
+    persistent = True
+
+    def __init__(self, kv, prefix=HISTORY_KV_PREFIX, ttl=HISTORY_IDLE_TIMEOUT):
+        """
+        Args:
+            kv (RedisKeyValue): The key-value store.
+            prefix (str, optional): Prefix of the keys of the histories.
+            ttl (float, optional): Seconds a history is kept without changes.
+        """
+        self.kv = kv
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @staticmethod
+    def encode(message):
+        return json.dumps(message.to_dict(), ensure_ascii=False)
+
+    @staticmethod
+    def decode(values):
+        return [Message.from_dict(json.loads(value)) for value in values]
+
+    def length(self, session_id):
+        length = self.kv.length(self.prefix + session_id)
+        if not length:
+            raise KeyError(session_id)
+        return length
+
+    def exists(self, session_id):
+        return self.kv.exists(self.prefix + session_id)
+
+    def reset(self, session_id, messages):
+        self.kv.reset(self.prefix + session_id, [self.encode(message) for message in messages], self.ttl)
+
+    def append(self, session_id, message):
+        if not self.exists(session_id):
+            raise KeyError(session_id)
+        return self.kv.append(self.prefix + session_id, self.encode(message), self.ttl) - 1
+
+    def replace(self, session_id, position, message):
+        # The history may have been reset in the meantime, then nothing is changed.
+        self.kv.set(self.prefix + session_id, position, self.encode(message), self.ttl)
+
+    def messages(self, session_id):
+        self.length(session_id)
+        return self.decode(self.kv.range(self.prefix + session_id, 0, -1))
+
+    def page(self, session_id, start, end):
+        self.length(session_id)
+        if end <= start:
+            return []
+        return self.decode(self.kv.range(self.prefix + session_id, start, end - 1))
+
+    def tail(self, session_id, limit):
+        length = self.length(session_id)
+        start = max(0, length - limit)
+        # Messages appended in the meantime are left out, so that start stays right.
+        return start, self.decode(self.kv.range(self.prefix + session_id, start, length - 1))
+
+    def count(self, session_id):
+        return self.length(session_id)
+
+    def delete(self, session_id):
+        self.kv.delete(self.prefix + session_id)
+
+    def evict(self, max_idle):
+        # Idle histories expire in the key-value store.
+        return 0
+
+
+def get_store():
+    """
+    Returns the history store configured with HISTORY_BACKEND, creating it on first use.
+    Returns:
+        MemoryHistoryStore | SQLiteHistoryStore | KeyValueHistoryStore: The history store.
+    """
+    global _store
+    if _store is None:
+        if HISTORY_BACKEND == 'sqlite':
+            _store = SQLiteHistoryStore(HISTORY_DATABASE)
+        elif HISTORY_BACKEND == 'kv':
+            _store = KeyValueHistoryStore(RedisKeyValue(HISTORY_KV_URL))
+        else:
+            _store = MemoryHistoryStore()
+    return _store
@@ -0,0 +1,37 @@
+import time
+
+
+class ChunkBuffer:
+    """
+    Coalesces streamed LLM chunks, so that the browser is only updated once per
+    time window or once enough new text has been collected.
+    """
+
+    def __init__(self, interval, max_chars, clock=time.monotonic):
+        """
+        Args:
+            interval (float): Seconds to collect chunks before a flush is due.
+            max_chars (int): Number of collected characters after which a flush is due.
+            clock (callable, optional): Monotonic clock returning seconds.
+        """
+        self.interval = interval
+        self.max_chars = max_chars
+        self.clock = clock
+        self.pending_chars = 0
+        self.last_flush = clock()
+
+    def add(self, text):
+        """
+        Registers a streamed chunk.
+        Args:
+            text (str): The content of the chunk.
+        Returns:
+            bool: True, if the collected text should be flushed to the browser now.
+        """
+        self.pending_chars += len(text)
+        now = self.clock()
+        if self.pending_chars >= self.max_chars or now - self.last_flush >= self.interval:
+            self.pending_chars = 0
+            self.last_flush = now
+            return True
+        return False